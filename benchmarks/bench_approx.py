@@ -0,0 +1,67 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.approx import KPI_DIGITS, approx_kpi_summary, build_sample
+from src.metrics import attribute_lookups, derive_attribute, kpi_summary, load_tables
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Approximate KPIs from a stratified sample vs exact: speed and interval coverage.")
+    parser.add_argument("--data_dir", type=str, default="data_out")
+    parser.add_argument("--format", type=str, default="csv")
+    parser.add_argument("--fraction", type=float, default=0.01)
+    parser.add_argument("--min_rows", type=int, default=30)
+    parser.add_argument("--slices", type=int, default=200, help="Random date range x Region/Category slices.")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    t = load_tables(args.data_dir, args.format, names=["DimSKU", "DimStore", "FactSales"])
+    fs = t["FactSales"]
+    t0 = time.perf_counter()
+    sample = build_sample(fs, t["DimSKU"], t["DimStore"], args.fraction, args.min_rows)
+    print(f"FactSales: {len(fs)} rows; sample: {len(sample.rows)} rows in {len(sample.strata)} strata, built in {time.perf_counter() - t0:.2f}s")
+
+    # Slices: a random 1-13 week date range, within one Region or Category half the time
+    lookups = attribute_lookups(t["DimSKU"], t["DimStore"])
+    attrs = {k: (derive_attribute(k, fs[s], lookups), derive_attribute(k, sample.rows[s], lookups)) for k, s in (("Region", "Store"), ("Category", "SKU"))}
+    rng = np.random.default_rng(args.seed)
+    first, last = fs["OrderDate"].min(), fs["OrderDate"].max()
+    covered = {k: 0 for k in KPI_DIGITS}
+    width = {k: [] for k in KPI_DIGITS}
+    exact_s = approx_s = 0.0
+    for _ in range(args.slices):
+        days = int(rng.integers(7, 92))
+        start = first + pd.Timedelta(days=int(rng.integers(0, max((last - first).days - days, 1))))
+        end = start + pd.Timedelta(days=days - 1)
+        full = (fs["OrderDate"] >= start) & (fs["OrderDate"] <= end)
+        part = (sample.rows["OrderDate"] >= start) & (sample.rows["OrderDate"] <= end)
+        if rng.random() < 0.5:
+            key = ["Region", "Category"][int(rng.integers(0, 2))]
+            member = rng.choice(attrs[key][0].cat.categories)
+            full &= attrs[key][0] == member
+            part &= attrs[key][1] == member
+
+        t0 = time.perf_counter()
+        exact = kpi_summary(fs[full])
+        t1 = time.perf_counter()
+        est, ci = approx_kpi_summary(sample, sample.rows[part])
+        t2 = time.perf_counter()
+        exact_s += t1 - t0
+        approx_s += t2 - t1
+        for k, (low, high) in ci.items():
+            covered[k] += low <= exact[k] <= high
+            if exact[k]:
+                width[k].append((high - low) / 2 / abs(exact[k]))
+
+    print(f"Per slice: exact {exact_s / args.slices * 1000:.1f} ms, approx {approx_s / args.slices * 1000:.1f} ms")
+    print("| KPI | 95% CI coverage | Median half-width % |")
+    print("|-----|-----------------|---------------------|")
+    for k in KPI_DIGITS:
+        print(f"| {k} | {covered[k] / args.slices:.1%} | {np.median(width[k]) * 100 if width[k] else 0:.2f} |")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import argparse
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from src import metrics
+from src.build_artifacts import write_artifacts
+from src.metrics import load_tables
+from src.storage import FORMATS
+
+
+def best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def with_latency(latency_ms: float) -> None:
+    # Emulates a network mount: every table read waits latency_ms before it starts
+    read_table = metrics.read_table
+
+    def slow_read_table(*args, **kwargs):
+        time.sleep(latency_ms / 1000)
+        return read_table(*args, **kwargs)
+
+    metrics.read_table = slow_read_table
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare sequential and threaded table loads and artifact writes.")
+    parser.add_argument("--data_dir", type=str, default="data_out")
+    parser.add_argument("--format", type=str, default="csv", choices=FORMATS)
+    parser.add_argument("--workers", type=str, default="1,2,6", help="Comma separated I/O thread counts.")
+    parser.add_argument("--latency_ms", type=float, default=0.0, help="Added per-read latency to emulate remote storage.")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.latency_ms:
+        with_latency(args.latency_ms)
+
+    out = Path(tempfile.mkdtemp())
+    artifacts = {str(out / f"artifact_{i}.md"): "x" * 200_000 for i in range(3)}
+    try:
+        print("| I/O workers | load_tables s | write_artifacts s |")
+        print("|-------------|---------------|-------------------|")
+        for workers in (int(w) for w in args.workers.split(",") if w):
+            load = best_of(lambda: load_tables(args.data_dir, args.format, workers=workers), args.repeat)
+
+            def write() -> None:
+                for p in artifacts:
+                    Path(p).unlink(missing_ok=True)
+                write_artifacts(artifacts, workers)
+
+            print(f"| {workers} | {load:.3f} | {best_of(write, args.repeat):.4f} |")
+    finally:
+        shutil.rmtree(out)
+
+
+if __name__ == "__main__":
+    main()
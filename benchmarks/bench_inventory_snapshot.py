@@ -0,0 +1,65 @@
+import argparse
+import time
+
+from data.generate_merchandising_data import (
+    Config,
+    _rng,
+    make_dim_date,
+    make_dim_sku,
+    make_dim_store,
+    generate_fact_sales,
+    generate_fact_inventory_snapshot,
+)
+
+
+def parse_scales(text: str) -> list:
+    # "250x30,1000x100" -> [(250, 30), (1000, 100)]
+    return [tuple(int(v) for v in s.split("x")) for s in text.split(",") if s]
+
+
+def run(cfg: Config) -> dict:
+    dim_date = make_dim_date(cfg.start_date, cfg.end_date)
+    dim_sku = make_dim_sku(_rng(cfg.seed), cfg.n_skus)
+    dim_store = make_dim_store(_rng(cfg.seed + 10), cfg.n_stores)
+    fact_sales = generate_fact_sales(cfg, dim_date, dim_sku, dim_store)
+
+    t0 = time.perf_counter()
+    fact_inv = generate_fact_inventory_snapshot(cfg, dim_date, dim_sku, dim_store, fact_sales)
+    secs = time.perf_counter() - t0
+
+    return {
+        "skus": cfg.n_skus,
+        "stores": cfg.n_stores,
+        "days": len(dim_date),
+        "rows": len(fact_inv),
+        "seconds": round(secs, 3),
+        "rows_per_sec": int(len(fact_inv) / secs) if secs > 0 else 0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the inventory snapshot simulator across scale points.")
+    parser.add_argument("--scales", type=str, default="250x30,1000x100,1000x250", help="Comma separated SKUSxSTORES.")
+    parser.add_argument("--rows_orders", type=int, default=100000)
+    parser.add_argument("--start_date", type=str, default="2024-01-01")
+    parser.add_argument("--end_date", type=str, default="2024-12-31")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print("| SKUs | Stores | Days | Rows | Seconds | Rows/s |")
+    print("|------|--------|------|------|---------|--------|")
+    for n_skus, n_stores in parse_scales(args.scales):
+        cfg = Config(
+            start_date=args.start_date,
+            end_date=args.end_date,
+            n_skus=n_skus,
+            n_stores=n_stores,
+            n_orders=args.rows_orders,
+            seed=args.seed,
+        )
+        r = run(cfg)
+        print(f"| {r['skus']} | {r['stores']} | {r['days']} | {r['rows']} | {r['seconds']} | {r['rows_per_sec']} |")
+
+
+if __name__ == "__main__":
+    main()
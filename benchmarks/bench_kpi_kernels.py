@@ -0,0 +1,47 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.metrics import sell_through_pct, sell_through_pct_array, weeks_of_supply, weeks_of_supply_array
+
+
+def make_pairs(n: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    units = rng.integers(0, 50, size=n).astype(float)
+    on_hand = rng.integers(0, 200, size=n).astype(float)
+    # Force a share of zero denominators
+    zero = rng.random(n) < 0.1
+    units[zero] = 0.0
+    on_hand[zero] = 0.0
+    return pd.DataFrame({"A": units, "B": on_hand})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Row-wise apply vs array KPI kernel timing (parity: tests/test_kpi_kernels.py).")
+    parser.add_argument("--rows", type=int, default=200000, help="SKU-store pairs to time.")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    df = make_pairs(args.rows, args.seed)
+    df["AvgWeeklyUnits"] = df["A"] / 4.0
+
+    t0 = time.perf_counter()
+    st = df.apply(lambda r: sell_through_pct(r["A"], r["B"]), axis=1)
+    wos = df.apply(lambda r: weeks_of_supply(r["B"], r["AvgWeeklyUnits"]), axis=1)
+    t_apply = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    st_v = sell_through_pct_array(df["A"], df["B"])
+    wos_v = weeks_of_supply_array(df["B"], df["AvgWeeklyUnits"])
+    t_vec = time.perf_counter() - t0
+
+    assert np.array_equal(st.to_numpy(), st_v) and np.array_equal(wos.to_numpy(), wos_v)
+    print(f"Rows: {args.rows}")
+    print(f"Row-wise apply: {t_apply:.3f}s")
+    print(f"Array kernels:  {t_vec:.4f}s ({t_apply / t_vec:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
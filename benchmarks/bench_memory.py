@@ -0,0 +1,47 @@
+import argparse
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from src.compact import memory_usage
+from src.metrics import load_tables
+from src.storage import FORMATS
+
+
+def _load(data_dir: str, fmt: str, compact: bool) -> tuple:
+    t0 = time.perf_counter()
+    tables = load_tables(data_dir, fmt, compact=compact)
+    secs = time.perf_counter() - t0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    peak_mb = peak / 2**20 if sys.platform == "darwin" else peak / 1024
+    return memory_usage(tables), secs, peak_mb
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare in-memory size of the default and compact table loads.")
+    parser.add_argument("--data_dir", type=str, default="data_out")
+    parser.add_argument("--format", type=str, default="csv", choices=FORMATS)
+    args = parser.parse_args()
+
+    # Peak RSS is a per-process high-water mark, so each load runs in a fresh process
+    reports = {}
+    for compact in (False, True):
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            reports[compact] = pool.submit(_load, args.data_dir, args.format, compact).result()
+
+    default, t_default, rss_default = reports[False]
+    compact, t_compact, rss_compact = reports[True]
+    out = default.rename(columns={"MB": "Default MB"})
+    out["Compact MB"] = compact["MB"]
+    out["Ratio"] = (out["Default MB"] / out["Compact MB"]).round(1)
+
+    print(out.to_string(index=False))
+    print(f"Total: {out['Default MB'].sum():.1f} MB -> {out['Compact MB'].sum():.1f} MB")
+    print(f"Peak RSS: {rss_default:.0f} MB default, {rss_compact:.0f} MB compact")
+    print(f"Load time: {t_default:.2f}s default, {t_compact:.2f}s compact")
+
+
+if __name__ == "__main__":
+    main()
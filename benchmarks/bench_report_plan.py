@@ -0,0 +1,72 @@
+import argparse
+import time
+
+import pandas as pd
+
+from src.metrics import (
+    load_tables,
+    kpi_summary,
+    avg_weekly_units,
+    stockout_days,
+    exec_page_tables,
+    inventory_page_tables,
+)
+from src.plan import report_tables
+from src.storage import FORMATS
+
+
+def call_sequence(t: dict) -> tuple:
+    fs = t["FactSales"]
+    inv = t["FactInventorySnapshot"]
+    return (
+        kpi_summary(fs),
+        avg_weekly_units(fs),
+        stockout_days(inv),
+        exec_page_tables(fs),
+        inventory_page_tables(fs, inv, t["DimSKU"], t["DimStore"]),
+    )
+
+
+def fused(t: dict) -> tuple:
+    return report_tables(t["FactSales"], t["FactInventorySnapshot"], t["DimSKU"], t["DimStore"])
+
+
+def check_same(a: tuple, b: tuple) -> None:
+    assert a[0] == b[0] and a[1] == b[1] and a[2] == b[2]
+    for k in ["sales_by_week", "top_movers"]:
+        pd.testing.assert_frame_equal(a[3][k].reset_index(drop=True), b[3][k].reset_index(drop=True), check_dtype=False)
+    for k in ["by_category", "by_store"]:
+        pd.testing.assert_frame_equal(
+            a[4][k].reset_index(drop=True), b[4][k].reset_index(drop=True), check_dtype=False, check_categorical=False
+        )
+    assert a[4]["latest_snapshot"] == b[4]["latest_snapshot"]
+
+
+def best_of(fn, t: dict, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(t)
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare the fused report plan against the per-function call sequence.")
+    parser.add_argument("--data_dir", type=str, default="data_out")
+    parser.add_argument("--format", type=str, default="csv", choices=FORMATS)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    t = load_tables(args.data_dir, args.format)
+    check_same(call_sequence(t), fused(t))
+
+    t_seq = best_of(call_sequence, t, args.repeat)
+    t_plan = best_of(fused, t, args.repeat)
+    print(f"FactSales rows: {len(t['FactSales'])}, FactInventorySnapshot rows: {len(t['FactInventorySnapshot'])}")
+    print(f"Call sequence: {t_seq:.3f}s")
+    print(f"Fused plan:    {t_plan:.3f}s ({t_seq / t_plan:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import argparse
+import time
+
+from data.generate_superstore_data import generate_superstore_data, iter_superstore_chunks
+
+
+def rows_per_sec(fn, n_rows: int) -> tuple:
+    t0 = time.perf_counter()
+    fn(n_rows)
+    secs = time.perf_counter() - t0
+    return round(secs, 3), int(n_rows / secs) if secs > 0 else 0
+
+
+def batched(n_rows: int, chunk_rows: int) -> None:
+    for _ in iter_superstore_chunks(n_rows, chunk_rows=chunk_rows):
+        pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark superstore generator throughput.")
+    parser.add_argument("--rows", type=str, default="100000,1000000,10000000", help="Comma separated row counts.")
+    parser.add_argument("--legacy_rows", type=int, default=20000, help="Row count for the row-by-row generator.")
+    parser.add_argument("--chunk_rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    print("| Generator | Rows | Seconds | Rows/s |")
+    print("|-----------|------|---------|--------|")
+    secs, rate = rows_per_sec(generate_superstore_data, args.legacy_rows)
+    print(f"| legacy | {args.legacy_rows} | {secs} | {rate} |")
+    for n_rows in (int(v) for v in args.rows.split(",") if v):
+        secs, rate = rows_per_sec(lambda n: batched(n, args.chunk_rows), n_rows)
+        print(f"| batched | {n_rows} | {secs} | {rate} |")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.topn import HeavyHitters, top_n
+
+
+def make_totals(stores: int, weeks: int, skus: int, seed: int) -> pd.DataFrame:
+    # One Sales total per store, week and SKU, in shuffled order. SKU popularity is Zipf-like,
+    # as in retail, and integer Units give ties.
+    rng = np.random.default_rng(seed)
+    n = stores * weeks * skus
+    popularity = 1.0 / np.arange(1, skus + 1)
+    df = pd.DataFrame(
+        {
+            "Store": np.repeat(np.arange(stores), weeks * skus),
+            "WeekStart": np.tile(np.repeat(np.arange(weeks), skus), stores),
+            "SKU": np.tile(np.arange(skus), stores * weeks),
+            "Sales": (rng.gamma(2.0, 50.0, n) * np.tile(popularity, stores * weeks)).round(2),
+            "Units": rng.integers(0, 20, n),
+        }
+    )
+    return df.iloc[rng.permutation(n)]
+
+
+def sorted_top(df: pd.DataFrame, n: int, by: str, per: list) -> pd.DataFrame:
+    # The full-sort reference: stable, so ties keep row order as top_n does
+    if not per:
+        return df.sort_values(by, ascending=False, kind="stable").head(n)
+    ordered = df.sort_values([*per, by], ascending=[True] * len(per) + [False], kind="stable")
+    return ordered.groupby(per, sort=False).head(n)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Partial-selection top-N vs full sort, and heavy hitters accuracy.")
+    parser.add_argument("--stores", type=int, default=1000)
+    parser.add_argument("--weeks", type=int, default=13)
+    parser.add_argument("--skus", type=int, default=1000)
+    parser.add_argument("--n", type=int, default=50)
+    parser.add_argument("--capacity", type=int, default=50_000, help="HeavyHitters keys held.")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    df = make_totals(args.stores, args.weeks, args.skus, args.seed)
+    print(f"Rows: {len(df)}")
+    print("| Query | Full sort s | top_n s | Same rows |")
+    print("|-------|-------------|---------|-----------|")
+    for label, by, per in [
+        ("top SKU-store-week by Sales", "Sales", []),
+        (f"top {args.n} per store-week by Sales", "Sales", ["Store", "WeekStart"]),
+        (f"top {args.n} per store-week by Units", "Units", ["Store", "WeekStart"]),
+    ]:
+        t0 = time.perf_counter()
+        ref = sorted_top(df, args.n, by, per)
+        t1 = time.perf_counter()
+        got = top_n(df, args.n, by, per)
+        t2 = time.perf_counter()
+        print(f"| {label} | {t1 - t0:.2f} | {t2 - t1:.2f} | {ref.index.equals(got.index)} |")
+
+    # Heavy hitters over 100 chunks of SKU-store totals, against the exact totals
+    exact = df.groupby(["SKU", "Store"])["Sales"].sum()
+    hitters = HeavyHitters(["SKU", "Store"], "Sales", args.capacity)
+    t0 = time.perf_counter()
+    step = -(-len(df) // 100)
+    for start in range(0, len(df), step):
+        hitters.update(df.iloc[start : start + step])
+    top = hitters.top(args.n)
+    secs = time.perf_counter() - t0
+    found = len(set(zip(top["SKU"], top["Store"])) & set(exact.nlargest(args.n).index))
+    print(
+        f"HeavyHitters: {len(exact)} keys, capacity {args.capacity}, {secs:.2f}s, "
+        f"error bound {hitters.error:.2f}, {found}/{args.n} of the exact top {args.n} found"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+import argparse
+import hashlib
+import json
+import platform
+import shutil
+import subprocess
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+from data import generate_merchandising_data as merch_gen
+from data import generate_superstore_data as superstore_gen
+from src.cache import code_version
+from src.metrics import exec_page_tables, inventory_page_tables, kpi_summary, load_tables
+from src.plan import report_tables
+from src.storage import FORMATS
+from src.superstore import load_superstore, superstore_tables
+from src.validate import validate_tables
+
+
+ROOT = Path(__file__).resolve().parents[1]
+DATA_DIR = ROOT / "benchmarks" / ".data"
+RESULTS_DIR = ROOT / "benchmarks" / "results"
+
+
+@dataclass(frozen=True)
+class Scale:
+    n_orders: int
+    n_skus: int
+    n_stores: int
+    start_date: str = "2024-01-01"
+    end_date: str = "2024-12-31"
+
+
+# FactInventorySnapshot has days x SKUs x stores rows, so the larger points use a shorter window
+SCALES: Dict[str, Scale] = {
+    "30k": Scale(30_000, 250, 30),
+    "1m": Scale(1_000_000, 1_000, 100, "2024-10-01", "2024-12-31"),
+    "10m": Scale(10_000_000, 5_000, 1_000, "2024-12-18", "2024-12-31"),
+}
+
+
+def _git_commit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _dataset_dir(kind: str, name: str, scale: Scale, fmt: str, generator: Path, variant: str = "") -> Path:
+    # Keyed by the scale point and the generator source, so editing a generator regenerates
+    h = hashlib.sha256(json.dumps([asdict(scale), fmt, variant]).encode() + generator.read_bytes()).hexdigest()[:10]
+    return DATA_DIR / f"{kind}-{name}-{fmt}{'-' + variant if variant else ''}-{h}"
+
+
+def _cached(path: Path, build: Callable[[Path], dict], regen: bool) -> dict:
+    # Reuses a generated dataset when its _meta.json marker exists; the marker keeps the
+    # generation timing so it is still reported on cached runs
+    marker = path / "_meta.json"
+    if marker.exists() and not regen:
+        return {**json.loads(marker.read_text()), "cached": True}
+    if path.exists():
+        shutil.rmtree(path)
+    path.mkdir(parents=True)
+    t0 = time.perf_counter()
+    meta = build(path)
+    meta["seconds"] = time.perf_counter() - t0
+    marker.write_text(json.dumps(meta))
+    return {**meta, "cached": False}
+
+
+def merch_dataset(name: str, scale: Scale, fmt: str, regen: bool, inventory: str = "snapshot") -> tuple:
+    variant = "" if inventory == "snapshot" else inventory
+    path = _dataset_dir("merch", name, scale, fmt, Path(merch_gen.__file__), variant)
+    cfg = merch_gen.Config(scale.start_date, scale.end_date, scale.n_skus, scale.n_stores, scale.n_orders)
+    # Large snapshots are streamed a week at a time so generation memory stays flat
+    meta = _cached(path, lambda p: {"rows": merch_gen.write_dataset(cfg, p, fmt, 7, inventory)}, regen)
+    return path, meta
+
+
+def superstore_dataset(name: str, scale: Scale, regen: bool) -> tuple:
+    path = _dataset_dir("superstore", name, scale, "csv", Path(superstore_gen.__file__))
+
+    def build(p: Path) -> dict:
+        n = 0
+        for chunk in superstore_gen.iter_superstore_chunks(scale.n_orders):
+            chunk.to_csv(p / "superstore.csv", index=False, mode="w" if n == 0 else "a", header=(n == 0))
+            n += len(chunk)
+        return {"rows": {"superstore": n}}
+
+    return path / "superstore.csv", _cached(path, build, regen)
+
+
+@dataclass
+class Result:
+    scale: str
+    format: str
+    op: str
+    rows: int
+    seconds: float
+    rows_per_sec: float
+    peak_mb: Optional[float] = None
+    cached: Optional[bool] = None
+    inventory: str = "snapshot"
+
+
+def measure(fn: Callable[[], object], repeat: int, memory: bool) -> tuple:
+    # Best wall time of repeat runs, then one run under tracemalloc for the allocation peak
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            fn()
+            peak = tracemalloc.get_traced_memory()[1] / 2**20
+        finally:
+            tracemalloc.stop()
+    return best, peak
+
+
+def run_scale(
+    name: str, scale: Scale, fmt: str, repeat: int, memory: bool, regen: bool, inventory: str = "snapshot"
+) -> List[Result]:
+    results: List[Result] = []
+
+    def record(op: str, rows: int, seconds: float, peak: Optional[float] = None, cached: Optional[bool] = None) -> None:
+        rate = round(rows / seconds, 1) if seconds > 0 else 0.0
+        r = Result(name, fmt, op, rows, round(seconds, 4), rate, None if peak is None else round(peak, 2), cached, inventory)
+        results.append(r)
+        note = " (cached dataset)" if cached else ""
+        print(f"{name:>4} {fmt:<8} {op:<22} {rows:>11} rows {seconds:9.3f}s {r.rows_per_sec:>14,.0f} rows/s{note}")
+
+    data_dir, meta = merch_dataset(name, scale, fmt, regen, inventory)
+    record("generate_merchandising", sum(meta["rows"].values()), meta["seconds"], cached=meta["cached"])
+    ss_path, ss_meta = superstore_dataset(name, scale, regen)
+    record("generate_superstore", ss_meta["rows"]["superstore"], ss_meta["seconds"], cached=ss_meta["cached"])
+
+    secs, peak = measure(lambda: load_tables(str(data_dir), fmt), repeat, memory)
+    t = load_tables(str(data_dir), fmt)
+    fs, inv = t["FactSales"], t["FactInventorySnapshot"]
+    total = sum(len(df) for df in t.values())
+    record("load_tables", total, secs, peak)
+
+    args = [t[n] for n in ("DimDate", "DimSKU", "DimStore", "DimChannel", "FactSales", "FactInventorySnapshot")]
+    ops = {
+        "validate_tables": (lambda: validate_tables(*args), total),
+        "kpi_summary": (lambda: kpi_summary(fs), len(fs)),
+        "exec_page_tables": (lambda: exec_page_tables(fs), len(fs)),
+        "inventory_page_tables": (lambda: inventory_page_tables(fs, inv, t["DimSKU"], t["DimStore"]), len(fs) + len(inv)),
+        "report_tables": (lambda: report_tables(fs, inv, t["DimSKU"], t["DimStore"]), len(fs) + len(inv)),
+    }
+    for op, (fn, rows) in ops.items():
+        secs, peak = measure(fn, repeat, memory)
+        record(op, rows, secs, peak)
+    del t, fs, inv, args
+
+    secs, peak = measure(lambda: load_superstore(str(ss_path)), repeat, memory)
+    df = load_superstore(str(ss_path))
+    record("load_superstore", len(df), secs, peak)
+    secs, peak = measure(lambda: superstore_tables(df), repeat, memory)
+    record("superstore_tables", len(df), secs, peak)
+    return results
+
+
+def compare(base_path: str, new_path: str) -> None:
+    base = json.loads(Path(base_path).read_text())
+    new = json.loads(Path(new_path).read_text())
+    key = lambda r: (r["scale"], r["format"], r.get("inventory", "snapshot"), r["op"])  # noqa: E731
+    before = {key(r): r for r in base["results"]}
+    rows = []
+    for r in new["results"]:
+        b = before.get(key(r))
+        if b is None or r.get("cached") or b.get("cached"):
+            continue
+        rows.append(
+            {
+                "Scale": r["scale"],
+                "Format": r["format"],
+                "Inventory": r.get("inventory", "snapshot"),
+                "Op": r["op"],
+                "Base s": b["seconds"],
+                "New s": r["seconds"],
+                "Speedup": round(b["seconds"] / r["seconds"], 2) if r["seconds"] else None,
+            }
+        )
+    print(f"{base['meta']['commit']} -> {new['meta']['commit']}")
+    print(pd.DataFrame(rows).to_string(index=False))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark generators, loading, validation and metrics across scale points.")
+    parser.add_argument("--scales", type=str, default="30k,1m", help=f"Comma separated scale points from {list(SCALES)}.")
+    parser.add_argument("--format", type=str, default="csv", choices=FORMATS)
+    parser.add_argument(
+        "--inventory", type=str, default="snapshot", choices=["snapshot", "changes"], help="Inventory table representation."
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no_memory", action="store_true", help="Skip the extra tracemalloc run per op.")
+    parser.add_argument("--regen", action="store_true", help="Regenerate datasets even if cached.")
+    parser.add_argument("--out", type=str, default=None, help="Results file (default: benchmarks/results/<commit>.json).")
+    parser.add_argument("--compare", type=str, nargs=2, metavar=("BASE", "NEW"), help="Compare two results files and exit.")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results: List[Result] = []
+    for name in (s for s in args.scales.split(",") if s):
+        results += run_scale(name, SCALES[name], args.format, args.repeat, not args.no_memory, args.regen, args.inventory)
+
+    commit = _git_commit()
+    out = Path(args.out) if args.out else RESULTS_DIR / f"{commit}.json"
+    meta = {
+        "commit": commit,
+        "code_version": code_version(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+    }
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps({"meta": meta, "results": [asdict(r) for r in results]}, indent=2))
+    print(f"Results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,18 @@
 import argparse
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
 
 import numpy as np
 import pandas as pd
 
+# Allow running as a script from the repo root: python data/generate_merchandising_data.py
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from src.storage import FORMATS, ShardWriter, concat_shards, table_path, write_table  # noqa: E402
+
 
 @dataclass
 class Config:
@@ -92,47 +100,51 @@ def make_dim_channel() -> pd.DataFrame:
 
 
 def generate_fact_sales(cfg: Config, dim_date: pd.DataFrame, dim_sku: pd.DataFrame, dim_store: pd.DataFrame) -> pd.DataFrame:
-    rng = _rng(cfg.seed)
+    return _sales_rows(_rng(cfg.seed), cfg.n_orders, 1, dim_date, dim_sku, dim_store)
+
 
+def _sales_rows(
+    rng: np.random.Generator, n_orders: int, first_id: int, dim_date: pd.DataFrame, dim_sku: pd.DataFrame, dim_store: pd.DataFrame
+) -> pd.DataFrame:
     # Sample order dates
-    order_dates = rng.choice(dim_date["Date"].values, size=cfg.n_orders, replace=True)
+    order_dates = rng.choice(dim_date["Date"].values, size=n_orders, replace=True)
 
     # Order ID per transaction line (keep it simple: one line per order)
-    order_ids = [f"ORD-{i:08d}" for i in range(1, cfg.n_orders + 1)]
+    order_ids = [f"ORD-{i:08d}" for i in range(first_id, first_id + n_orders)]
 
     # Choose SKU, store, channel
     sku_vals = dim_sku["SKU"].values
     store_vals = dim_store["Store"].values
     channels = np.array(CHANNELS)
 
-    chosen_skus = rng.choice(sku_vals, size=cfg.n_orders, replace=True)
-    chosen_stores = rng.choice(store_vals, size=cfg.n_orders, replace=True)
-    chosen_channels = rng.choice(channels, size=cfg.n_orders, replace=True, p=[0.70, 0.30])  # mostly in-store
+    chosen_skus = rng.choice(sku_vals, size=n_orders, replace=True)
+    chosen_stores = rng.choice(store_vals, size=n_orders, replace=True)
+    chosen_channels = rng.choice(channels, size=n_orders, replace=True, p=[0.70, 0.30])  # mostly in-store
 
     # Units and pricing
-    units = rng.integers(1, 9, size=cfg.n_orders)
+    units = rng.integers(1, 9, size=n_orders)
 
     sku_lookup = dim_sku.set_index("SKU")
     base_price = sku_lookup.loc[chosen_skus, "BasePrice"].values.astype(float)
     margin_rate = sku_lookup.loc[chosen_skus, "BaseMarginRate"].values.astype(float)
 
     # Price noise and promo cadence
-    price_multiplier = rng.normal(loc=1.0, scale=0.06, size=cfg.n_orders).clip(0.75, 1.35)
+    price_multiplier = rng.normal(loc=1.0, scale=0.06, size=n_orders).clip(0.75, 1.35)
     unit_price = base_price * price_multiplier
 
     gross_sales = unit_price * units
 
     # Discount rate depends on channel and random promo, online tends to have higher discount
-    promo_flag = rng.random(cfg.n_orders) < 0.25
+    promo_flag = rng.random(n_orders) < 0.25
     base_disc = np.where(chosen_channels == "Online", 0.08, 0.05)
-    promo_disc = np.where(promo_flag, rng.uniform(0.05, 0.30, size=cfg.n_orders), 0.0)
+    promo_disc = np.where(promo_flag, rng.uniform(0.05, 0.30, size=n_orders), 0.0)
     discount_rate = (base_disc + promo_disc).clip(0.0, 0.45)
     discount_amt = gross_sales * discount_rate
 
     net_sales = gross_sales - discount_amt
 
     # Gross margin dollars: margin_rate applied to net sales, add small noise
-    gm_noise = rng.normal(loc=1.0, scale=0.03, size=cfg.n_orders).clip(0.85, 1.20)
+    gm_noise = rng.normal(loc=1.0, scale=0.03, size=n_orders).clip(0.85, 1.20)
     gross_margin_amt = net_sales * margin_rate * gm_noise
 
     # Return probability: higher online, slightly higher for apparel/footwear
@@ -140,7 +152,7 @@ def generate_fact_sales(cfg: Config, dim_date: pd.DataFrame, dim_sku: pd.DataFra
     base_ret = np.where(chosen_channels == "Online", 0.06, 0.02)
     cat_bump = np.where(np.isin(cat, ["Apparel", "Footwear"]), 0.02, 0.0)
     return_prob = (base_ret + cat_bump).clip(0.0, 0.20)
-    return_flag = (rng.random(cfg.n_orders) < return_prob).astype(int)
+    return_flag = (rng.random(n_orders) < return_prob).astype(int)
 
     fact = pd.DataFrame(
         {
@@ -166,70 +178,388 @@ def generate_fact_sales(cfg: Config, dim_date: pd.DataFrame, dim_sku: pd.DataFra
     return fact
 
 
-def generate_fact_inventory_snapshot(
+def _sold_rows(
+    dates: np.ndarray, skus: np.ndarray, stores: np.ndarray, fact_sales: pd.DataFrame
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # Day, SKU and store positions and units of the sales of known SKUs and stores on known days
+    day_idx = pd.Index(dates).get_indexer(fact_sales["OrderDate"])
+    sku_idx = pd.Index(skus).get_indexer(fact_sales["SKU"])
+    store_idx = pd.Index(stores).get_indexer(fact_sales["Store"])
+    keep = (day_idx >= 0) & (sku_idx >= 0) & (store_idx >= 0)
+    units = fact_sales["Units"].to_numpy()[keep].astype(np.int64)
+    return day_idx[keep], sku_idx[keep], store_idx[keep], units
+
+
+def _by_day(n_days: int, day_idx: np.ndarray, cells: np.ndarray, units: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Sort sales by day so each day's are one contiguous slice: cells[offsets[k]:offsets[k + 1]]
+    order = np.argsort(day_idx, kind="stable")
+    offsets = np.searchsorted(day_idx[order], np.arange(n_days + 1))
+    return offsets, cells[order], units[order]
+
+
+def _daily_sold_by_day(
+    dates: np.ndarray, skus: np.ndarray, stores: np.ndarray, fact_sales: pd.DataFrame
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Each sale's day and flat SKU-store cell, grouped by day
+    day_idx, sku_idx, store_idx, units = _sold_rows(dates, skus, stores, fact_sales)
+    return _by_day(len(dates), day_idx, sku_idx * len(stores) + store_idx, units)
+
+
+def iter_on_hand(
     cfg: Config,
     dim_date: pd.DataFrame,
     dim_sku: pd.DataFrame,
     dim_store: pd.DataFrame,
     fact_sales: pd.DataFrame,
-) -> pd.DataFrame:
-    rng = _rng(cfg.seed + 1)
-
-    dates = dim_date["Date"].sort_values().values
-    skus = dim_sku["SKU"].values
-    stores = dim_store["Store"].values
+) -> Iterator[Tuple[pd.Timestamp, np.ndarray]]:
+    # Rolls the SKU x store on-hand state forward one day at a time and yields
+    # (date, on_hand) with on_hand a (n_skus, n_stores) int64 array. The same array
+    # is updated in place on the next step, so copy it if you keep it.
+    dates = dim_date["Date"].sort_values().to_numpy()
+    skus = dim_sku["SKU"].to_numpy()
+    stores = dim_store["Store"].to_numpy()
+    sold = _daily_sold_by_day(dates, skus, stores, fact_sales)
+    yield from _roll_on_hand(_rng(cfg.seed + 1), dates, (len(skus), len(stores)), sold)
+
+
+def _roll_on_hand(
+    rng: np.random.Generator, dates: np.ndarray, shape: Tuple[int, int], sold: Tuple[np.ndarray, np.ndarray, np.ndarray]
+) -> Iterator[Tuple[pd.Timestamp, np.ndarray]]:
+    # iter_on_hand for the cells of an (n_skus, n_stores) shape, with their sales grouped
+    # by day as _by_day gives them
+    is_monday = pd.DatetimeIndex(dates).weekday == 0
 
     # Initialize on-hand per SKU-store
-    init_on_hand = rng.integers(20, 200, size=(len(skus), len(stores)))
+    current = rng.integers(20, 200, size=shape).astype(np.int64)
+    flat = current.reshape(-1)
 
-    # Build daily units sold per SKU-store (across channels)
-    daily_sold = (
-        fact_sales.groupby(["OrderDate", "SKU", "Store"], as_index=False)["Units"]
-        .sum()
-        .rename(columns={"OrderDate": "Date", "Units": "UnitsSold"})
-    )
-    # For fast lookup
-    daily_sold_key = {(r["Date"], r["SKU"], r["Store"]): int(r["UnitsSold"]) for _, r in daily_sold.iterrows()}
+    offsets, cells, units = sold
 
     # Replenishment: occasional arrivals per SKU-store
     # Simple rule: each week, 25% of SKU-store combos get replenished
     replenishment_rate = 0.25
     replenishment_units_low, replenishment_units_high = 20, 120
 
-    rows = []
-    current = init_on_hand.astype(int)
-
-    for d in dates:
-        d_ts = pd.to_datetime(d)
-
+    for k, d in enumerate(dates):
         # Weekly replenishment event (on Mondays)
-        is_monday = pd.Timestamp(d_ts).weekday() == 0
-        if is_monday:
+        if is_monday[k]:
             repl_mask = rng.random(size=current.shape) < replenishment_rate
             repl_units = rng.integers(replenishment_units_low, replenishment_units_high + 1, size=current.shape)
-            current = current + (repl_mask * repl_units).astype(int)
+            current += repl_mask * repl_units
+
+        # Decrement on-hand by units sold that day per sku-store, clamped at zero
+        lo, hi = offsets[k], offsets[k + 1]
+        np.subtract.at(flat, cells[lo:hi], units[lo:hi])
+        np.maximum(current, 0, out=current)
+
+        yield pd.Timestamp(d), current
+
+
+def _snapshot_frame(dates: np.ndarray, on_hand: np.ndarray, skus: np.ndarray, stores: np.ndarray) -> pd.DataFrame:
+    # on_hand is (n_days, n_skus * n_stores); rows are ordered date, then SKU, then store
+    return pd.DataFrame(
+        {
+            "SnapshotDate": np.repeat(dates, len(skus) * len(stores)),
+            "SKU": np.tile(np.repeat(skus, len(stores)), len(dates)),
+            "Store": np.tile(stores, len(skus) * len(dates)),
+            "OnHandUnits": on_hand.reshape(-1),
+        }
+    )
+
 
-        # Decrement on-hand by units sold that day per sku-store
-        for i, sku in enumerate(skus):
-            for j, store in enumerate(stores):
-                sold = daily_sold_key.get((d_ts, sku, store), 0)
-                current[i, j] = max(int(current[i, j]) - int(sold), 0)
+def generate_fact_inventory_snapshot(
+    cfg: Config,
+    dim_date: pd.DataFrame,
+    dim_sku: pd.DataFrame,
+    dim_store: pd.DataFrame,
+    fact_sales: pd.DataFrame,
+) -> pd.DataFrame:
+    dates = dim_date["Date"].sort_values().to_numpy()
+    skus = dim_sku["SKU"].to_numpy()
+    stores = dim_store["Store"].to_numpy()
 
-                rows.append(
-                    {
-                        "SnapshotDate": d_ts,
-                        "SKU": sku,
-                        "Store": store,
-                        "OnHandUnits": int(current[i, j]),
-                    }
-                )
+    on_hand = np.empty((len(dates), len(skus) * len(stores)), dtype=np.int64)
+    for k, (_, current) in enumerate(iter_on_hand(cfg, dim_date, dim_sku, dim_store, fact_sales)):
+        on_hand[k] = current.reshape(-1)
 
-    return pd.DataFrame(rows)
+    return _snapshot_frame(dates, on_hand, skus, stores)
 
 
-def write_csv(df: pd.DataFrame, path: Path) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    df.to_csv(path, index=False)
+def iter_inventory_snapshot_chunks(
+    cfg: Config,
+    dim_date: pd.DataFrame,
+    dim_sku: pd.DataFrame,
+    dim_store: pd.DataFrame,
+    fact_sales: pd.DataFrame,
+    chunk_days: int,
+) -> Iterator[pd.DataFrame]:
+    # Same rows as generate_fact_inventory_snapshot, emitted chunk_days days at a
+    # time so only one block of days is ever held in memory.
+    dates = dim_date["Date"].sort_values().to_numpy()
+    skus = dim_sku["SKU"].to_numpy()
+    stores = dim_store["Store"].to_numpy()
+    chunk_days = max(1, int(chunk_days))
+
+    block = np.empty((chunk_days, len(skus) * len(stores)), dtype=np.int64)
+    n = 0
+    for k, (_, current) in enumerate(iter_on_hand(cfg, dim_date, dim_sku, dim_store, fact_sales)):
+        block[n] = current.reshape(-1)
+        n += 1
+        if n == chunk_days:
+            yield _snapshot_frame(dates[k + 1 - n : k + 1], block, skus, stores)
+            n = 0
+    if n:
+        yield _snapshot_frame(dates[len(dates) - n :], block[:n], skus, stores)
+
+
+def _change_frame(
+    dates: np.ndarray, skus: np.ndarray, stores: np.ndarray, cells: np.ndarray, start: np.ndarray, end: int, on_hand: np.ndarray
+) -> pd.DataFrame:
+    # Runs of the flat SKU-store cells that held on_hand from dates[start] until dates[end]
+    return pd.DataFrame(
+        {
+            "SKU": skus[cells // len(stores)],
+            "Store": stores[cells % len(stores)],
+            "ValidFrom": dates[start],
+            "ValidTo": np.repeat(dates[end], len(cells)),
+            "OnHandUnits": on_hand,
+        }
+    )
+
+
+def iter_inventory_change_chunks(
+    cfg: Config,
+    dim_date: pd.DataFrame,
+    dim_sku: pd.DataFrame,
+    dim_store: pd.DataFrame,
+    fact_sales: pd.DataFrame,
+    chunk_days: int,
+) -> Iterator[pd.DataFrame]:
+    # The same on-hand history as FactInventorySnapshot, as FactInventoryChanges rows
+    # (see src.inventory). A run is emitted when it closes, chunk_days days of closed
+    # runs at a time; runs still open at the end close the day after the last date.
+    on_hand = iter_on_hand(cfg, dim_date, dim_sku, dim_store, fact_sales)
+    dates = dim_date["Date"].sort_values().to_numpy()
+    yield from _change_chunks(on_hand, dates, dim_sku["SKU"].to_numpy(), dim_store["Store"].to_numpy(), chunk_days)
+
+
+def _change_chunks(
+    on_hand: Iterator[Tuple[pd.Timestamp, np.ndarray]], dates: np.ndarray, skus: np.ndarray, stores: np.ndarray, chunk_days: int
+) -> Iterator[pd.DataFrame]:
+    dates = np.append(dates, dates[-1] + np.timedelta64(1, "D"))
+    chunk_days = max(1, int(chunk_days))
+
+    value = start = None
+    closed = []
+    for k, (_, current) in enumerate(on_hand):
+        flat = current.reshape(-1)
+        if value is None:
+            value, start = flat.copy(), np.zeros(len(flat), dtype=np.int64)
+        else:
+            cells = np.flatnonzero(flat != value)
+            closed.append(_change_frame(dates, skus, stores, cells, start[cells], k, value[cells]))
+            start[cells] = k
+            value[cells] = flat[cells]
+        if (k + 1) % chunk_days == 0 and closed:
+            yield pd.concat(closed, ignore_index=True)
+            closed = []
+
+    cells = np.arange(len(value))
+    closed.append(_change_frame(dates, skus, stores, cells, start, len(dates) - 1, value))
+    yield pd.concat(closed, ignore_index=True)
+
+
+def generate_fact_inventory_changes(
+    cfg: Config,
+    dim_date: pd.DataFrame,
+    dim_sku: pd.DataFrame,
+    dim_store: pd.DataFrame,
+    fact_sales: pd.DataFrame,
+) -> pd.DataFrame:
+    chunks = iter_inventory_change_chunks(cfg, dim_date, dim_sku, dim_store, fact_sales, len(dim_date))
+    fact = pd.concat(chunks, ignore_index=True)
+    return fact.sort_values(["SKU", "Store", "ValidFrom"], kind="stable").reset_index(drop=True)
+
+
+def write_inventory_snapshot(
+    cfg: Config,
+    dim_date: pd.DataFrame,
+    dim_sku: pd.DataFrame,
+    dim_store: pd.DataFrame,
+    fact_sales: pd.DataFrame,
+    out_dir: Path,
+    fmt: str,
+    chunk_days: int,
+    inventory: str = "snapshot",
+) -> int:
+    n_rows = 0
+    if inventory == "changes":
+        name = "FactInventoryChanges"
+        chunks = iter_inventory_change_chunks(cfg, dim_date, dim_sku, dim_store, fact_sales, chunk_days)
+    else:
+        name = "FactInventorySnapshot"
+        chunks = iter_inventory_snapshot_chunks(cfg, dim_date, dim_sku, dim_store, fact_sales, chunk_days)
+    for part, chunk in enumerate(chunks):
+        write_table(chunk, str(out_dir), name, fmt, part=part)
+        n_rows += len(chunk)
+    return n_rows
+
+
+def write_dataset(
+    cfg: Config, out_dir: Path, fmt: str = "csv", chunk_days: int = 0, inventory: str = "snapshot"
+) -> Dict[str, int]:
+    # Generates and writes all six tables; returns the row count of each. inventory="changes"
+    # writes FactInventoryChanges in place of FactInventorySnapshot.
+    dim_date = make_dim_date(cfg.start_date, cfg.end_date)
+    dim_sku = make_dim_sku(_rng(cfg.seed), cfg.n_skus)
+    dim_store = make_dim_store(_rng(cfg.seed + 10), cfg.n_stores)
+    dim_channel = make_dim_channel()
+
+    fact_sales = generate_fact_sales(cfg, dim_date, dim_sku, dim_store)
+
+    tables = {
+        "DimDate": dim_date,
+        "DimSKU": dim_sku,
+        "DimStore": dim_store,
+        "DimChannel": dim_channel,
+        "FactSales": fact_sales,
+    }
+    for name, df in tables.items():
+        write_table(df, str(out_dir), name, fmt)
+    rows = {name: len(df) for name, df in tables.items()}
+
+    name = "FactInventoryChanges" if inventory == "changes" else "FactInventorySnapshot"
+    if chunk_days > 0:
+        rows[name] = write_inventory_snapshot(
+            cfg, dim_date, dim_sku, dim_store, fact_sales, out_dir, fmt, chunk_days, inventory
+        )
+    else:
+        generate = generate_fact_inventory_changes if inventory == "changes" else generate_fact_inventory_snapshot
+        fact_inventory = generate(cfg, dim_date, dim_sku, dim_store, fact_sales)
+        write_table(fact_inventory, str(out_dir), name, fmt)
+        rows[name] = len(fact_inventory)
+    return rows
+
+
+def _bounds(n: int, shards: int) -> List[int]:
+    # Ends of shards near-equal contiguous ranges covering range(n)
+    return [n * i // shards for i in range(shards + 1)]
+
+
+def _shard_keys(df: pd.DataFrame, dims: Tuple[pd.DataFrame, ...], fmt: str) -> pd.DataFrame:
+    # Columnar shards encode SKU/Store/Channel over the whole Dim table, so every part
+    # carries the same dictionary and concat_shards can copy the encoded rows as they are
+    if fmt == "csv":
+        return df
+    _, dim_sku, dim_store = dims
+    for c, values in (("SKU", dim_sku["SKU"]), ("Store", dim_store["Store"]), ("Channel", CHANNELS)):
+        if c in df.columns:
+            df[c] = pd.Categorical(df[c], categories=list(values))
+    return df
+
+
+def _sales_shard(task: tuple) -> ShardWriter:
+    shard, seq, first_id, n_orders, dims, store_bounds, staging, fmt = task
+    dim_date, dim_sku, dim_store = dims
+    fact = _sales_rows(np.random.default_rng(seq), n_orders, first_id, dim_date, dim_sku, dim_store)
+
+    # Hand each inventory shard the units sold in its stores, as SKU x store-range cells
+    dates = dim_date["Date"].sort_values().to_numpy()
+    day, sku, store, units = _sold_rows(dates, dim_sku["SKU"].to_numpy(), dim_store["Store"].to_numpy(), fact)
+    owner = np.searchsorted(store_bounds, store, side="right") - 1
+    for t in range(len(store_bounds) - 1):
+        rows = owner == t
+        cells = sku[rows] * (store_bounds[t + 1] - store_bounds[t]) + store[rows] - store_bounds[t]
+        np.savez(staging / f"sold-{t:03d}-{shard:03d}.npz", day=day[rows], cell=cells, units=units[rows])
+
+    writer = ShardWriter(str(staging / f"sales-{shard:03d}"), "FactSales", fmt)
+    writer.write(_shard_keys(fact, dims, fmt))
+    return writer
+
+
+def _inventory_shard(task: tuple) -> ShardWriter:
+    shard, seq, sales_shards, dims, store_bounds, staging, fmt, inventory, chunk_days = task
+    dim_date, dim_sku, dim_store = dims
+    dates = dim_date["Date"].sort_values().to_numpy()
+    skus = dim_sku["SKU"].to_numpy()
+    stores = dim_store["Store"].to_numpy()[store_bounds[shard] : store_bounds[shard + 1]]
+
+    sold: Dict[str, List[np.ndarray]] = {"day": [], "cell": [], "units": []}
+    for s in range(sales_shards):
+        with np.load(staging / f"sold-{shard:03d}-{s:03d}.npz") as f:
+            for k in sold:
+                sold[k].append(f[k])
+    by_day = _by_day(len(dates), *(np.concatenate(sold[k]) for k in ("day", "cell", "units")))
+    on_hand = _roll_on_hand(np.random.default_rng(seq), dates, (len(skus), len(stores)), by_day)
+
+    if inventory == "changes":
+        writer = ShardWriter(str(staging / f"inventory-{shard:03d}"), "FactInventoryChanges", fmt)
+        for chunk in _change_chunks(on_hand, dates, skus, stores, chunk_days or len(dates)):
+            writer.write(_shard_keys(chunk, dims, fmt))
+        return writer
+
+    # A part per day, so concat_shards can lay the shards' days out in date order. Every
+    # day has the same SKU and Store keys, so they are built (and encoded) once.
+    writer = ShardWriter(str(staging / f"inventory-{shard:03d}"), "FactInventorySnapshot", fmt)
+    day = _snapshot_frame(dates[:1], np.zeros((1, len(skus) * len(stores)), dtype=np.int64), skus, stores)
+    day = _shard_keys(day, dims, fmt)
+    for k, (_, current) in enumerate(on_hand):
+        writer.write(day.assign(SnapshotDate=np.repeat(dates[k : k + 1], len(day)), OnHandUnits=current.reshape(-1)))
+    return writer
+
+
+def write_sharded_dataset(
+    cfg: Config,
+    out_dir: Path,
+    fmt: str = "csv",
+    chunk_days: int = 0,
+    inventory: str = "snapshot",
+    workers: int = 1,
+    shards: int = 0,
+) -> Dict[str, int]:
+    # write_dataset split into shards (workers of them by default) generated on a pool of
+    # workers processes: FactSales by order ID range, the inventory by store range, as each
+    # SKU-store's history only depends on its own sales. Sales shard i draws from stream i
+    # of one SeedSequence(seed).spawn child and inventory shard i from stream i of the
+    # other, so the rows depend on the seed and shard count but not on workers. Shards are
+    # written under <out_dir>/_shards and copied into the usual tables by concat_shards.
+    shards = shards or workers
+    dim_date = make_dim_date(cfg.start_date, cfg.end_date)
+    dim_sku = make_dim_sku(_rng(cfg.seed), cfg.n_skus)
+    dim_store = make_dim_store(_rng(cfg.seed + 10), cfg.n_stores)
+    tables = {"DimDate": dim_date, "DimSKU": dim_sku, "DimStore": dim_store, "DimChannel": make_dim_channel()}
+    for name, df in tables.items():
+        write_table(df, str(out_dir), name, fmt)
+    rows = {name: len(df) for name, df in tables.items()}
+
+    sales_seqs, inv_seqs = (seq.spawn(shards) for seq in np.random.SeedSequence(cfg.seed).spawn(2))
+    order_bounds = _bounds(cfg.n_orders, shards)
+    store_bounds = np.array(_bounds(len(dim_store), max(1, min(shards, len(dim_store)))))
+    dims = (dim_date, dim_sku, dim_store)
+
+    staging = out_dir / "_shards"
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            sales_tasks = [
+                (i, sales_seqs[i], order_bounds[i] + 1, order_bounds[i + 1] - order_bounds[i], dims, store_bounds, staging, fmt)
+                for i in range(shards)
+            ]
+            sales = list(pool.map(_sales_shard, sales_tasks))
+            inv_tasks = [
+                (i, inv_seqs[i], shards, dims, store_bounds, staging, fmt, inventory, chunk_days)
+                for i in range(len(store_bounds) - 1)
+            ]
+            inv = pool.map(_inventory_shard, inv_tasks)
+            # FactSales is copied together while the inventory shards run
+            rows["FactSales"] = concat_shards(sales, str(out_dir))
+            inv = list(inv)
+        name = "FactInventoryChanges" if inventory == "changes" else "FactInventorySnapshot"
+        rows[name] = concat_shards(inv, str(out_dir), by_part=inventory != "changes")
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return rows
 
 
 def main() -> None:
@@ -240,7 +570,33 @@ def main() -> None:
     parser.add_argument("--start_date", type=str, default="2024-01-01")
     parser.add_argument("--end_date", type=str, default="2024-12-31")
     parser.add_argument("--seed", type=int, default=42)
-    parser.add_argument("--out_dir", type=str, default="data_out", help="Output folder for CSV files.")
+    parser.add_argument("--out_dir", type=str, default="data_out", help="Output folder for the star schema tables.")
+    parser.add_argument("--format", type=str, default="csv", choices=FORMATS, help="Storage format for the tables.")
+    parser.add_argument(
+        "--chunk_days",
+        type=int,
+        default=0,
+        help="Stream the inventory table to disk this many days at a time (0 builds it in memory).",
+    )
+    parser.add_argument(
+        "--inventory",
+        type=str,
+        default="snapshot",
+        choices=["snapshot", "changes"],
+        help="Write daily FactInventorySnapshot rows, or FactInventoryChanges rows with validity ranges.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Generate shards on this many processes (0 uses one process and the original single random stream).",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=0,
+        help="Shards for --workers (default: --workers). A seed gives the same rows for the same shard count.",
+    )
     args = parser.parse_args()
 
     cfg = Config(
@@ -252,30 +608,15 @@ def main() -> None:
         seed=args.seed,
     )
 
-    out_dir = Path(args.out_dir)
-
-    dim_date = make_dim_date(cfg.start_date, cfg.end_date)
-    dim_sku = make_dim_sku(_rng(cfg.seed), cfg.n_skus)
-    dim_store = make_dim_store(_rng(cfg.seed + 10), cfg.n_stores)
-    dim_channel = make_dim_channel()
-
-    fact_sales = generate_fact_sales(cfg, dim_date, dim_sku, dim_store)
-    fact_inventory = generate_fact_inventory_snapshot(cfg, dim_date, dim_sku, dim_store, fact_sales)
-
-    write_csv(dim_date, out_dir / "DimDate.csv")
-    write_csv(dim_sku, out_dir / "DimSKU.csv")
-    write_csv(dim_store, out_dir / "DimStore.csv")
-    write_csv(dim_channel, out_dir / "DimChannel.csv")
-    write_csv(fact_sales, out_dir / "FactSales.csv")
-    write_csv(fact_inventory, out_dir / "FactInventorySnapshot.csv")
-
+    if args.workers > 0:
+        rows = write_sharded_dataset(
+            cfg, Path(args.out_dir), args.format, args.chunk_days, args.inventory, args.workers, args.shards
+        )
+    else:
+        rows = write_dataset(cfg, Path(args.out_dir), args.format, args.chunk_days, args.inventory)
     print("Generated merchandising dataset:")
-    print(f"- {out_dir / 'DimDate.csv'} ({len(dim_date)} rows)")
-    print(f"- {out_dir / 'DimSKU.csv'} ({len(dim_sku)} rows)")
-    print(f"- {out_dir / 'DimStore.csv'} ({len(dim_store)} rows)")
-    print(f"- {out_dir / 'DimChannel.csv'} ({len(dim_channel)} rows)")
-    print(f"- {out_dir / 'FactSales.csv'} ({len(fact_sales)} rows)")
-    print(f"- {out_dir / 'FactInventorySnapshot.csv'} ({len(fact_inventory)} rows)")
+    for name, n in rows.items():
+        print(f"- {table_path(args.out_dir, name, args.format)} ({n} rows)")
 
 
 if __name__ == "__main__":
@@ -1,5 +1,6 @@
 import argparse
 from pathlib import Path
+from typing import Iterator
 import numpy as np
 import pandas as pd
 
@@ -13,6 +14,10 @@ SUBCATS = {
     "Office Supplies": ["Binders", "Paper", "Storage", "Art"],
 }
 SHIP_MODES = ["Standard Class", "Second Class", "First Class", "Same Day"]
+DISCOUNTS = [0.0, 0.1, 0.2, 0.3]
+
+# Rows per block of the batched stream, see generate_superstore_block
+BLOCK_ROWS = 100_000
 
 
 def generate_superstore_data(n_rows: int, seed: int = 42) -> pd.DataFrame:
@@ -50,6 +55,71 @@ def generate_superstore_data(n_rows: int, seed: int = 42) -> pd.DataFrame:
     return df
 
 
+def generate_superstore_block(block: int, n_rows: int, seed: int = 42) -> pd.DataFrame:
+    # Block b of the batched stream holds rows b * BLOCK_ROWS onwards and is drawn from its own
+    # Generator seeded with SeedSequence(seed, spawn_key=(b,)). Columns are drawn whole, in this
+    # order: category, sub category index, sales, discount, quantity, order date, segment,
+    # region, ship mode, customer. So a given seed always yields the same rows, however the
+    # output is chunked, and any block can be regenerated on its own.
+    rng = np.random.Generator(np.random.PCG64(np.random.SeedSequence(seed, spawn_key=(block,))))
+    dates = pd.date_range("2024-01-01", "2024-12-31", freq="D")
+
+    category_idx = rng.integers(0, len(CATEGORIES), size=n_rows)
+    subcat_idx = rng.integers(0, 4, size=n_rows)
+    sales = rng.uniform(20, 2000, size=n_rows)
+    discount = np.asarray(DISCOUNTS)[rng.integers(0, len(DISCOUNTS), size=n_rows)]
+    quantity = rng.integers(1, 10, size=n_rows)
+    order_date = dates[rng.integers(0, len(dates), size=n_rows)]
+    segment = np.asarray(SEGMENTS)[rng.integers(0, len(SEGMENTS), size=n_rows)]
+    region = np.asarray(REGIONS)[rng.integers(0, len(REGIONS), size=n_rows)]
+    ship_mode = np.asarray(SHIP_MODES)[rng.integers(0, len(SHIP_MODES), size=n_rows)]
+    customer = rng.integers(1, 500, size=n_rows)
+
+    subcats = np.asarray([SUBCATS[c] for c in CATEGORIES])
+    # simple profit model
+    profit = sales * (0.15 - discount * 0.3)
+
+    first = 100000 + block * BLOCK_ROWS
+    return pd.DataFrame(
+        {
+            "Order ID": "CA-" + pd.Series(np.arange(first, first + n_rows)).astype(str),
+            "Order Date": order_date,
+            "Segment": segment,
+            "Region": region,
+            "Category": np.asarray(CATEGORIES)[category_idx],
+            "Sub Category": subcats[category_idx, subcat_idx],
+            "Ship Mode": ship_mode,
+            "Customer Name": "Customer " + pd.Series(customer).astype(str),
+            "Sales": np.round(sales, 2),
+            "Quantity": quantity.astype(int),
+            "Discount": np.round(discount, 2),
+            "Profit": np.round(profit, 2),
+        }
+    )
+
+
+def iter_superstore_chunks(n_rows: int, seed: int = 42, chunk_rows: int = BLOCK_ROWS) -> Iterator[pd.DataFrame]:
+    # Yields the batched stream chunk_rows rows at a time; the rows do not depend on chunk_rows.
+    # Blocks are sliced by offset, so each row is copied into one chunk only.
+    if chunk_rows < 1:
+        raise ValueError(f"chunk_rows must be at least 1, got {chunk_rows}")
+    pending, n_pending = [], 0
+    n_blocks = -(-n_rows // BLOCK_ROWS)
+    for b in range(n_blocks):
+        block = generate_superstore_block(b, min(BLOCK_ROWS, n_rows - b * BLOCK_ROWS), seed)
+        start = 0
+        while start < len(block):
+            take = min(chunk_rows - n_pending, len(block) - start)
+            pending.append(block.iloc[start : start + take])
+            n_pending += take
+            start += take
+            if n_pending == chunk_rows:
+                yield pd.concat(pending, ignore_index=True)
+                pending, n_pending = [], 0
+    if n_pending:
+        yield pd.concat(pending, ignore_index=True)
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(
         description="Generate a synthetic Superstore style dataset."
@@ -66,13 +136,34 @@ def main() -> None:
         default="data/superstore_sample_large.csv",
         help="Path to output CSV file.",
     )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--chunk_rows",
+        type=int,
+        default=1_000_000,
+        help="Write the batched stream to disk this many rows at a time.",
+    )
+    parser.add_argument(
+        "--legacy",
+        action="store_true",
+        help="Use the original row-by-row generator (reproduces data/superstore_sample_large.csv).",
+    )
     args = parser.parse_args()
 
-    df = generate_superstore_data(args.rows)
     output_path = Path(args.output)
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    df.to_csv(output_path, index=False)
-    print(f"Generated dataset with {len(df)} rows at {output_path.resolve()}")
+
+    if args.legacy:
+        df = generate_superstore_data(args.rows, args.seed)
+        df.to_csv(output_path, index=False)
+        n_rows = len(df)
+    else:
+        n_rows = 0
+        for chunk in iter_superstore_chunks(args.rows, args.seed, args.chunk_rows):
+            chunk.to_csv(output_path, index=False, mode="w" if n_rows == 0 else "a", header=(n_rows == 0))
+            n_rows += len(chunk)
+
+    print(f"Generated dataset with {n_rows} rows at {output_path.resolve()}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,304 @@
+from __future__ import annotations
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.cache import fingerprint
+from src.inventory import latest_on_hand
+from src.metrics import (
+    MOVER_MEASURES,
+    attribute_lookups,
+    key_columns,
+    kpis_from_totals,
+    load_tables,
+    top_movers_table,
+)
+from src.profiling import profiled
+from src.storage import FORMATS, read_table, write_table
+
+
+# A stratified row sample of FactSales for approximate KPIs while exploring. Strata are
+# Store x Category; each keeps fraction of its rows, at least min_rows (all of them when it
+# has fewer), drawn without replacement. A sampled row of stratum h stands for
+# Rows_h / Sampled_h rows, and the total of a measure over any subset of the facts (a date
+# range, some stores, a channel) is estimated from the sampled rows in that subset, with
+# the stratified variance
+#   sum over h of Rows_h^2 (1 - Sampled_h / Rows_h) s_h^2 / Sampled_h
+# where s_h^2 is the sample variance in h of the measure, zero outside the subset. OrderID
+# is unique per FactSales row (see validate_tables), so Orders is a row count, estimated
+# like the measures. Ratio KPIs (GM %, Markdown Rate %, AOV) are ratios of estimated
+# totals, and their standard errors are those of the total of (y - R x) / X.
+STRATA = ["Store", "Category"]
+MEASURES = ["Sales", "Units", "GrossMarginAmt", "DiscountAmt"]
+COLUMNS = ["OrderDate", "OrderID", "SKU", "Store", "Channel", *MEASURES]
+MANIFEST = "_manifest.json"
+Z = 1.96  # two-sided 95% normal interval
+
+# KPI -> the total it estimates, or (numerator, denominator totals) for ratios
+KPI_TOTALS = {"Sales $": "Sales", "Orders": "Orders", "Units": "Units", "GM $": "GrossMarginAmt", "Markdown $": "DiscountAmt"}
+KPI_RATIOS = {"GM %": ("GrossMarginAmt", ["Sales"]), "Markdown Rate %": ("DiscountAmt", ["Sales", "DiscountAmt"]), "AOV": ("Sales", ["Orders"])}
+KPI_DIGITS = {"Sales $": 2, "Orders": 0, "Units": 0, "GM $": 2, "GM %": 4, "Markdown $": 2, "Markdown Rate %": 4, "AOV": 2}
+
+
+def default_sample_dir(data_dir: str) -> Path:
+    return Path(data_dir) / "_sample"
+
+
+class KpiSample:
+    def __init__(
+        self, rows: pd.DataFrame, strata: pd.DataFrame, last_date: pd.Timestamp, dim_sku: pd.DataFrame, dim_store: pd.DataFrame
+    ) -> None:
+        # rows: the sampled FactSales COLUMNS and the row number of their stratum in strata
+        # strata: Store, Category, Rows (in FactSales) and Sampled; last_date: of FactSales
+        self.rows = rows
+        self.strata = strata
+        self.last_date = last_date
+        self.lookups = attribute_lookups(dim_sku, dim_store)
+        total = strata["Rows"].to_numpy(dtype=float)
+        self.sampled = strata["Sampled"].to_numpy(dtype=float)
+        self.weights = total / self.sampled
+        self.scale = total**2 * (1 - self.sampled / total) / self.sampled
+
+    def groups(self, rows: pd.DataFrame, keys: Sequence[str]) -> Tuple[np.ndarray, pd.DataFrame]:
+        # The group number of each of rows by keys, in key order, and the keys of each group
+        if not keys:
+            return np.zeros(len(rows), dtype=np.int64), pd.DataFrame(index=range(1))
+        by = key_columns(rows, keys, self.lookups)
+        codes = rows.groupby(by, observed=True, sort=True, dropna=False).ngroup().to_numpy()
+        first = np.zeros(codes.max() + 1 if len(codes) else 0, dtype=np.int64)
+        first[codes[::-1]] = np.arange(len(codes))[::-1]
+        return codes, pd.DataFrame({k: s.iloc[first].reset_index(drop=True) for k, s in zip(keys, by)})
+
+    def estimate(self, rows: pd.DataFrame, groups: Tuple[np.ndarray, pd.DataFrame], values: Dict[str, np.ndarray]) -> pd.DataFrame:
+        # The groups' keys and the estimated total of each of values (one per row of rows)
+        # per group, with its standard error as {name}SE
+        codes, keys = groups
+        strata = len(self.sampled)
+        cell, cells = pd.factorize(codes * strata + rows["Stratum"].to_numpy())
+        g, h = cells // strata, cells % strata
+        n = self.sampled[h]
+        out = {}
+        for name, y in values.items():
+            s1 = np.bincount(cell, y, len(cells))
+            s2 = np.bincount(cell, y * y, len(cells))
+            var = np.clip(s2 - s1**2 / n, 0, None) / np.maximum(n - 1, 1) * self.scale[h]
+            out[name] = np.bincount(g, s1 * self.weights[h], len(keys))
+            out[f"{name}SE"] = np.sqrt(np.bincount(g, var, len(keys)))
+        return pd.concat([keys, pd.DataFrame(out, index=keys.index)], axis=1)
+
+    def totals(self, rows: pd.DataFrame, keys: Sequence[str], columns: Sequence[str]) -> pd.DataFrame:
+        # Estimated totals of columns over rows (some of self.rows) by keys; "Orders" counts rows
+        return self.estimate(rows, self.groups(rows, keys), {c: _column(rows, c) for c in columns})
+
+
+def _column(rows: pd.DataFrame, column: str) -> np.ndarray:
+    return np.ones(len(rows)) if column == "Orders" else rows[column].to_numpy(dtype=float)
+
+
+@profiled()
+def build_sample(
+    fact_sales: pd.DataFrame,
+    dim_sku: pd.DataFrame,
+    dim_store: Optional[pd.DataFrame] = None,
+    fraction: float = 0.01,
+    min_rows: int = 30,
+    seed: int = 0,
+) -> KpiSample:
+    groups = fact_sales.groupby(key_columns(fact_sales, STRATA, attribute_lookups(dim_sku, None)), observed=True, sort=True)
+    codes = groups.ngroup().to_numpy()
+    sizes = groups.size()
+    total = sizes.to_numpy()
+    sampled = np.minimum(total, np.maximum(min_rows, np.ceil(fraction * total).astype(np.int64)))
+
+    # The sampled[h] rows of each stratum with the smallest random keys, kept in fact order
+    order = np.lexsort((np.random.default_rng(seed).random(len(codes)), codes))
+    rank = np.arange(len(order)) - np.r_[0, np.cumsum(total)[:-1]][codes[order]]
+    picked = np.sort(order[rank < sampled[codes[order]]])
+
+    rows = fact_sales[COLUMNS].iloc[picked].reset_index(drop=True)
+    rows["Stratum"] = codes[picked].astype(np.int32)
+    strata = sizes.rename("Rows").reset_index().assign(Sampled=sampled)
+    return KpiSample(rows, strata, fact_sales["OrderDate"].max(), dim_sku, dim_store)
+
+
+def _sample_params(fraction: float, min_rows: int, seed: int) -> dict:
+    return {"fraction": fraction, "min_rows": min_rows, "seed": seed}
+
+
+def _source(data_dir: str, fmt: str) -> list:
+    # The sample depends on FactSales and, through the strata, on DimSKU
+    return [fingerprint(data_dir, name, fmt) for name in ("FactSales", "DimSKU")]
+
+
+def write_sample(sample: KpiSample, out_dir: str, fmt: str = "csv", params: Optional[dict] = None, source: Optional[list] = None) -> None:
+    write_table(sample.rows, out_dir, "FactSalesSample", fmt)
+    write_table(sample.strata, out_dir, "SampleStrata", fmt)
+    manifest = {"format": fmt, "params": params, "last_date": sample.last_date.isoformat(), "source": source}
+    (Path(out_dir) / MANIFEST).write_text(json.dumps(manifest, indent=2), encoding="utf8")
+
+
+def read_sample(out_dir: str, fmt: str, dim_sku: pd.DataFrame, dim_store: pd.DataFrame) -> KpiSample:
+    manifest = json.loads((Path(out_dir) / MANIFEST).read_text(encoding="utf8"))
+    rows = read_table(out_dir, "FactSalesSample", fmt)
+    rows["OrderDate"] = pd.to_datetime(rows["OrderDate"])
+    strata = read_table(out_dir, "SampleStrata", fmt)
+    return KpiSample(rows, strata, pd.Timestamp(manifest["last_date"]), dim_sku, dim_store)
+
+
+def sample_is_current(data_dir: str, out_dir: str, fmt: str, params: dict) -> bool:
+    # True when out_dir holds a sample drawn with params from FactSales and DimSKU as they are now
+    path = Path(out_dir) / MANIFEST
+    if not path.exists():
+        return False
+    manifest = json.loads(path.read_text(encoding="utf8"))
+    return manifest.get("format") == fmt and manifest.get("params") == params and manifest.get("source") == _source(data_dir, fmt)
+
+
+def load_sample(
+    data_dir: str,
+    fmt: str = "csv",
+    fraction: float = 0.01,
+    min_rows: int = 30,
+    seed: int = 0,
+    tables: Optional[Dict[str, pd.DataFrame]] = None,
+) -> KpiSample:
+    # The persisted sample when it is current, else a new one drawn (from tables, when
+    # given) and persisted
+    out_dir = str(default_sample_dir(data_dir))
+    params = _sample_params(fraction, min_rows, seed)
+    t = tables if tables is not None else load_tables(data_dir, fmt, names=["DimSKU", "DimStore"])
+    if sample_is_current(data_dir, out_dir, fmt, params):
+        return read_sample(out_dir, fmt, t["DimSKU"], t["DimStore"])
+
+    source = _source(data_dir, fmt)
+    fs = t["FactSales"] if "FactSales" in t else load_tables(data_dir, fmt, names=["FactSales"])["FactSales"]
+    sample = build_sample(fs, t["DimSKU"], t["DimStore"], fraction, min_rows, seed)
+    write_sample(sample, out_dir, fmt, params, source)
+    return sample
+
+
+def _interval(df: pd.DataFrame, column: str, digits: int = 2) -> pd.DataFrame:
+    se = df.pop(f"{column}SE")
+    return df.assign(**{f"{column}Low": (df[column] - Z * se).round(digits), f"{column}High": (df[column] + Z * se).round(digits)})
+
+
+@profiled()
+def approx_kpi_table(sample: KpiSample, keys: Sequence[str] = (), rows: Optional[pd.DataFrame] = None) -> List[dict]:
+    # kpi_summary per member of keys, estimated from rows (default: the whole sample), each
+    # with a 95% interval per KPI under "CI95"
+    rows = sample.rows if rows is None else rows
+    groups = sample.groups(rows, keys)
+    values = {c: _column(rows, c) for c in [*MEASURES, "Orders"]}
+    t = sample.estimate(rows, groups, values)
+
+    z = {}
+    codes = groups[0]
+    for kpi, (num, den) in KPI_RATIOS.items():
+        x_total = sum(t[c] for c in den).to_numpy()
+        ratio = np.divide(t[num].to_numpy(), x_total, out=np.zeros(len(t)), where=x_total > 0)
+        x = sum(values[c] for c in den)
+        z[kpi] = np.divide(values[num] - ratio[codes] * x, x_total[codes], out=np.zeros(len(rows)), where=x_total[codes] > 0)
+    t = t.join(sample.estimate(rows, groups, z).filter(like="SE"))
+
+    out = []
+    for r in t.to_dict(orient="records"):
+        kpis = kpis_from_totals(r["Sales"], int(round(r["Orders"])), int(round(r["Units"])), r["GrossMarginAmt"], r["DiscountAmt"])
+        se = {kpi: r[f"{col}SE"] for kpi, col in KPI_TOTALS.items()}
+        se.update({kpi: r[f"{kpi}SE"] for kpi in KPI_RATIOS})
+        intervals = {}
+        for kpi, value in kpis.items():
+            low, high = round(value - Z * se[kpi], KPI_DIGITS[kpi]), round(value + Z * se[kpi], KPI_DIGITS[kpi])
+            intervals[kpi] = [int(low), int(high)] if KPI_DIGITS[kpi] == 0 else [low, high]
+        out.append({**{k: r[k] for k in keys}, **kpis, "CI95": intervals})
+    return out
+
+
+def approx_kpi_summary(sample: KpiSample, rows: Optional[pd.DataFrame] = None) -> Tuple[dict, Dict[str, list]]:
+    # (kpis, {kpi: [low, high]}) for the facts rows were sampled from
+    row = approx_kpi_table(sample, (), rows)[0]
+    return {k: v for k, v in row.items() if k != "CI95"}, row["CI95"]
+
+
+@profiled()
+def approx_exec_page_tables(sample: KpiSample, rows: Optional[pd.DataFrame] = None) -> dict:
+    # exec_page_tables from the sample, with SalesLow and SalesHigh bounds
+    rows = sample.rows if rows is None else rows
+    weekly = _interval(sample.totals(rows, ["WeekStart"], ["Sales"]), "Sales")
+    weekly["Sales"] = weekly["Sales"].round(2)
+
+    skus = sample.totals(rows, ["SKU"], MOVER_MEASURES)
+    skus["Units"] = skus["Units"].round().astype(np.int64)
+    top = top_movers_table(skus.drop(columns=[f"{c}SE" for c in MOVER_MEASURES if c != "Sales"]))
+    return {"sales_by_week": weekly.sort_values("WeekStart"), "top_movers": _interval(top, "Sales")}
+
+
+@profiled()
+def approx_inventory_page_tables(
+    sample: KpiSample,
+    fact_inv: pd.DataFrame,
+    dim_sku: pd.DataFrame,
+    dim_store: pd.DataFrame,
+    rows: Optional[pd.DataFrame] = None,
+    last_date: Optional[pd.Timestamp] = None,
+) -> dict:
+    # inventory_page_tables with Units28d estimated from the sample (trailing 28 days to
+    # last_date, default the last OrderDate) and bounded by Units28dLow and Units28dHigh.
+    # On hand is exact: the latest snapshot is one day of rows. SellThrough% and WOS are
+    # left out; they average per SKU-store ratios, which a row sample cannot estimate.
+    rows = sample.rows if rows is None else rows
+    last = sample.last_date if last_date is None else last_date
+    dates = rows["OrderDate"]
+    recent = rows[(dates > last - pd.Timedelta(days=28)) & (dates <= last)]
+
+    latest, inv = latest_on_hand(fact_inv)
+    inv = inv.merge(dim_sku[["SKU", "Category"]], on="SKU", how="left").merge(dim_store[["Store", "Region"]], on="Store", how="left")
+    tables = {}
+    for name, keys in (("by_category", ["Category"]), ("by_store", ["Store", "Region"])):
+        on_hand = inv.groupby(keys, as_index=False, observed=True)["OnHandUnits"].sum()
+        sold = sample.totals(recent, keys[:1], ["Units"]).rename(columns={"Units": "Units28d", "UnitsSE": "Units28dSE"})
+        sold = _interval(sold, "Units28d", 0).assign(Units28d=lambda d: d["Units28d"].round())
+        table = on_hand.astype({keys[0]: str}).merge(sold.astype({keys[0]: str}), on=keys[0], how="left").fillna(0.0)
+        tables[name] = table.sort_values("Units28d", ascending=False)
+    tables["by_store"] = tables["by_store"].head(15)
+    return {**tables, "latest_snapshot": latest}
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Approximate KPIs with 95% intervals from a persisted stratified sample of FactSales.")
+    p.add_argument("--data_dir", type=str, default="data_out")
+    p.add_argument("--format", type=str, default="csv", choices=FORMATS)
+    p.add_argument("--fraction", type=float, default=0.01, help="Share of each Store x Category stratum sampled.")
+    p.add_argument("--min_rows", type=int, default=30, help="Rows sampled at least per stratum (all when it has fewer).")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--by", type=str, default="", help="Comma separated keys to break the KPIs down by, e.g. Region,WeekStart.")
+    p.add_argument("--start", type=str, default=None, help="First OrderDate included.")
+    p.add_argument("--end", type=str, default=None, help="Last OrderDate included.")
+    args = p.parse_args()
+
+    t0 = time.perf_counter()
+    sample = load_sample(args.data_dir, args.format, args.fraction, args.min_rows, args.seed)
+    t1 = time.perf_counter()
+    rows = sample.rows
+    if args.start:
+        rows = rows[rows["OrderDate"] >= pd.Timestamp(args.start)]
+    if args.end:
+        rows = rows[rows["OrderDate"] <= pd.Timestamp(args.end)]
+    keys = [k for k in args.by.split(",") if k]
+    table = approx_kpi_table(sample, keys, rows)
+    t2 = time.perf_counter()
+
+    for r in table:
+        if keys:
+            print(", ".join(f"{k}: {r[k].date() if isinstance(r[k], pd.Timestamp) else r[k]}" for k in keys))
+        for kpi, (low, high) in r["CI95"].items():
+            print(f"- {kpi}: {r[kpi]} (95% CI {low} .. {high})")
+    print(f"\n{len(sample.rows)} sampled rows in {len(sample.strata)} strata; sample loaded in {t1 - t0:.2f}s, queried in {(t2 - t1) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
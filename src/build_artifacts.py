@@ -1,29 +1,124 @@
 from __future__ import annotations
 import argparse
+import sys
+from contextlib import nullcontext
+from typing import Dict, Optional
 
-from src.metrics import load_tables, kpi_summary, exec_page_tables, inventory_page_tables, avg_weekly_units, stockout_days
-from src.reporting import md_table, write_text, metric_definitions_md
-from src.validate import validate_tables
+import pandas as pd
 
+from src.cache import ResultCache, cache_key, code_version, default_cache_dir, fingerprint
+from src.incremental import report_inputs, update_state
+from src.parallel import parallel_report_tables
+from src.plan import inventory_tables, report_tables, sales_tables
+from src.profiling import Profiler, profiled, profiling, stage
+from src.reporting import md_table, metric_definitions_md, write_texts
+from src.rollup import (
+    build_rollup,
+    default_rollup_dir,
+    read_rollup,
+    rollup_is_current,
+    rollup_report_tables,
+    rollup_source,
+    rollup_validation,
+    write_rollup,
+)
+from src.storage import FORMATS, TABLES
+from src.streaming import streaming_report_tables
+from src.validate import load_validated
 
-def build_report(data_dir: str, report_path: str, defs_path: str, one_pager_path: str) -> None:
-    t = load_tables(data_dir)
 
-    vr = validate_tables(
-        t["DimDate"], t["DimSKU"], t["DimStore"], t["DimChannel"], t["FactSales"], t["FactInventorySnapshot"]
+def _plain_keys(df: pd.DataFrame) -> pd.DataFrame:
+    # Cached stage outputs keep string keys so they join with any later (compact) load
+    out = df.copy()
+    for c in ("SKU", "Store"):
+        if isinstance(out[c].dtype, pd.CategoricalDtype):
+            out[c] = out[c].astype(str)
+    return out
+
+
+def cached_report_inputs(
+    data_dir: str,
+    fmt: str,
+    compact: bool,
+    cache: ResultCache,
+    fps: Dict[str, list],
+    validate_sample: Optional[int] = None,
+    io_workers: int = 1,
+) -> tuple:
+    # The report splits into a FactSales stage and an inventory stage (FactInventorySnapshot,
+    # DimSKU, DimStore and the sales stage's 28 day units). Each is cached under the
+    # fingerprints of its own inputs, so a change to one table recomputes only what reads it.
+    # FactSales is validated against every Dim table, so the sales stage is keyed on them
+    # and on validate_sample too: a Dim change reloads and revalidates FactSales.
+    dims = [n for n in TABLES if n.startswith("Dim")]
+    sales_key = cache_key("sales", code_version(), fmt, compact, fps["FactSales"], [fps[n] for n in dims], validate_sample)
+    inv_key = cache_key(
+        "inventory", code_version(), fmt, compact, sales_key, fps["FactInventorySnapshot"], fps["DimSKU"], fps["DimStore"]
     )
-    if not vr.ok:
-        raise ValueError("Validation failed:\n" + "\n".join(vr.errors))
+    sales = cache.get(sales_key)
+    inv = cache.get(inv_key)
+
+    names = list(dims)
+    names += [n for n, hit in (("FactSales", sales), ("FactInventorySnapshot", inv)) if hit is None]
+    t = load_validated(data_dir, fmt, compact, names, validate_sample, io_workers)
+
+    if sales is None:
+        kpis, avg_week, exec_tables, sold = sales_tables(t["FactSales"])
+        sales = (kpis, avg_week, exec_tables, _plain_keys(sold))
+        cache.put(sales_key, sales)
+    kpis, avg_week, exec_tables, sold = sales
+    if inv is None:
+        inv = inventory_tables(sold, t["FactInventorySnapshot"], t["DimSKU"], t["DimStore"])
+        cache.put(inv_key, inv)
+    stockouts, inv_tables = inv
+    return kpis, avg_week, stockouts, exec_tables, inv_tables
+
+
+def compute_report_inputs(
+    data_dir: str,
+    fmt: str = "csv",
+    compact: bool = False,
+    workers: int = 1,
+    partition_by: str = "store",
+    validate_sample: Optional[int] = None,
+    io_workers: int = 1,
+) -> tuple:
+    t = load_validated(data_dir, fmt, compact, TABLES, validate_sample, io_workers)
 
-    fs = t["FactSales"]
-    inv = t["FactInventorySnapshot"]
+    if workers > 1:
+        return parallel_report_tables(
+            t["FactSales"], t["FactInventorySnapshot"], t["DimSKU"], t["DimStore"], workers, partition_by
+        )
 
-    kpis = kpi_summary(fs)
-    avg_week = avg_weekly_units(fs)
-    stockouts = stockout_days(inv)
+    # One fused pass over the facts instead of kpi_summary, avg_weekly_units,
+    # stockout_days, exec_page_tables and inventory_page_tables in turn
+    return report_tables(t["FactSales"], t["FactInventorySnapshot"], t["DimSKU"], t["DimStore"])
 
-    exec_tables = exec_page_tables(fs)
-    inv_tables = inventory_page_tables(fs, inv, t["DimSKU"], t["DimStore"])
+
+def rollup_report_inputs(
+    data_dir: str, fmt: str = "csv", compact: bool = False, validate_sample: Optional[int] = None, io_workers: int = 1
+) -> tuple:
+    # Reports from the exported aggregation tables; FactSales is only read (and validated)
+    # when they are missing, were built from an older FactSales, DimSKU or DimStore, or
+    # FactSales was validated against other Dim tables or another validate_sample, and
+    # they are then rebuilt
+    rollup_dir = default_rollup_dir(data_dir)
+    validated = rollup_validation(data_dir, fmt, validate_sample)
+    current = rollup_is_current(data_dir, rollup_dir, fmt, validated)
+    names = [n for n in TABLES if n != "FactSales" or not current]
+    t = load_validated(data_dir, fmt, compact, names, validate_sample, io_workers)
+
+    if current:
+        rollup = read_rollup(rollup_dir, fmt, t["DimSKU"], t["DimStore"])
+    else:
+        rollup = build_rollup(t["FactSales"], t["DimSKU"], t["DimStore"])
+        write_rollup(rollup, rollup_dir, fmt, rollup_source(data_dir, fmt), validated)
+    return rollup_report_tables(rollup, t["FactInventorySnapshot"], t["DimSKU"], t["DimStore"])
+
+
+@profiled()
+def render_artifacts(inputs: tuple, report_path: str, defs_path: str, one_pager_path: str) -> Dict[str, str]:
+    kpis, avg_week, stockouts, exec_tables, inv_tables = inputs
 
     report = []
     report.append("# Merchandising Metrics Report\n")
@@ -52,9 +147,6 @@ def build_report(data_dir: str, report_path: str, defs_path: str, one_pager_path
     report.append(md_table(inv_tables["by_store"], max_rows=15))
     report.append("")
 
-    write_text(report_path, "\n".join(report))
-    write_text(defs_path, metric_definitions_md())
-
     one_pager = f"""# One Pager: Merchandising Analytics Toolkit
 
 ## Business question
@@ -79,18 +171,154 @@ Sales $, Units, GM %, Markdown Rate %, AOV, Sell-through %, WOS, Stockout proxy.
 - Markdown KPI report: `{report_path}`
 - Metric definitions (governance): `{defs_path}`
 """
-    write_text(one_pager_path, one_pager)
+    return {report_path: "\n".join(report), defs_path: metric_definitions_md(), one_pager_path: one_pager}
+
+
+def write_artifacts(artifacts: Dict[str, str], io_workers: Optional[int] = None) -> None:
+    # Concurrent atomic writes; files that already hold the same text are left untouched
+    write_texts(artifacts, io_workers, skip_unchanged=True)
+
+
+def build_report(
+    data_dir: str,
+    report_path: str,
+    defs_path: str,
+    one_pager_path: str,
+    fmt: str = "csv",
+    incremental: bool = False,
+    state_path: Optional[str] = None,
+    compact: bool = False,
+    chunksize: int = 0,
+    orders: str = "exact",
+    spill_dir: Optional[str] = None,
+    workers: int = 1,
+    partition_by: str = "store",
+    cache_dir: Optional[str] = None,
+    use_cache: bool = True,
+    cache_max_mb: int = 256,
+    cache_content_hash: bool = False,
+    validate_sample: Optional[int] = None,
+    rollup: bool = False,
+    io_workers: int = len(TABLES),
+) -> None:
+    cache = key = None
+    if use_cache:
+        # A rebuild over unchanged tables, code and parameters only rewrites changed files
+        with stage("cache_lookup"):
+            cache = ResultCache(cache_dir or default_cache_dir(data_dir), max_bytes=cache_max_mb * 2**20)
+            fps = {name: fingerprint(data_dir, name, fmt, cache_content_hash) for name in TABLES}
+            params = [fmt, incremental, compact, chunksize, orders, workers, partition_by, validate_sample, rollup]
+            key = cache_key("artifacts", code_version(), params, [report_path, defs_path, one_pager_path], fps)
+            hit = cache.get(key)
+        if hit is not None:
+            write_artifacts(hit["artifacts"], io_workers)
+            return
+
+    if incremental:
+        # Fold only new fact rows into the persisted aggregates, then report from them
+        state, dims = update_state(data_dir, fmt, state_path)
+        inputs = report_inputs(state, dims["DimSKU"], dims["DimStore"])
+    elif chunksize > 0:
+        # Out-of-core: facts are read and aggregated chunksize rows at a time
+        inputs = streaming_report_tables(data_dir, fmt, chunksize, orders=orders, spill_dir=spill_dir)
+    elif rollup:
+        inputs = rollup_report_inputs(data_dir, fmt, compact, validate_sample, io_workers)
+    elif cache is not None and workers <= 1:
+        inputs = cached_report_inputs(data_dir, fmt, compact, cache, fps, validate_sample, io_workers)
+    else:
+        inputs = compute_report_inputs(data_dir, fmt, compact, workers, partition_by, validate_sample, io_workers)
+
+    artifacts = render_artifacts(inputs, report_path, defs_path, one_pager_path)
+    write_artifacts(artifacts, io_workers)
+    if cache is not None:
+        with stage("cache_store"):
+            cache.put(key, {"artifacts": artifacts})
 
 
 def main() -> None:
     p = argparse.ArgumentParser(description="End to end merchandising analytics artifacts builder.")
     p.add_argument("--data_dir", type=str, default="data_out")
+    p.add_argument("--format", type=str, default="csv", choices=FORMATS, help="Storage format of the tables in data_dir.")
+    p.add_argument("--compact", action="store_true", help="Load facts with integer-coded keys and narrow dtypes.")
+    p.add_argument("--incremental", action="store_true", help="Fold only new fact rows into persisted aggregate state.")
+    p.add_argument("--state_path", type=str, default=None, help="Aggregate state file (default: <data_dir>/_kpi_state.pkl).")
+    p.add_argument("--chunksize", type=int, default=0, help="Stream facts in chunks of this many rows (0 loads them whole).")
+    p.add_argument(
+        "--orders",
+        type=str,
+        default="exact",
+        choices=["exact", "approx"],
+        help="Distinct Orders in streaming mode: exact (spills to disk) or approx (HyperLogLog).",
+    )
+    p.add_argument("--spill_dir", type=str, default=None, help="Directory for exact distinct-count spill files.")
+    p.add_argument("--workers", type=int, default=1, help="Aggregate fact partitions in this many processes.")
+    p.add_argument(
+        "--partition_by", type=str, default="store", choices=["store", "date"], help="How facts are split across workers."
+    )
+    p.add_argument(
+        "--rollup", action="store_true", help="Report from the aggregation tables in <data_dir>/aggregations, rebuilding them if stale."
+    )
     p.add_argument("--report_path", type=str, default="reports/merch_kpi_report.md")
     p.add_argument("--defs_path", type=str, default="reports/metric_definitions.md")
     p.add_argument("--one_pager_path", type=str, default="docs/one_pager.md")
+    p.add_argument("--cache_dir", type=str, default=None, help="Result cache directory (default: <data_dir>/_cache).")
+    p.add_argument("--no_cache", action="store_true", help="Always recompute and do not read or write the result cache.")
+    p.add_argument("--cache_max_mb", type=int, default=256, help="Evict least recently used cache entries beyond this size.")
+    p.add_argument(
+        "--cache_content_hash", action="store_true", help="Fingerprint tables by sha256 of their files, not size and mtime."
+    )
+    p.add_argument(
+        "--validate_sample",
+        type=int,
+        default=None,
+        help="Validate facts larger than this on a random sample of this many rows.",
+    )
+    p.add_argument(
+        "--io_workers",
+        type=int,
+        default=len(TABLES),
+        help="Threads for reading tables and writing artifacts concurrently (1 reads them one at a time).",
+    )
+    p.add_argument("--profile", type=str, default=None, help="Write a JSON trace of per-stage time, memory and rows here.")
+    p.add_argument("--profile_chrome", type=str, default=None, help="Also write a Chrome trace-event file here.")
+    p.add_argument("--profile_memory", action="store_true", help="Track per-stage Python allocation peaks (tracemalloc).")
     args = p.parse_args()
+    mode = "--incremental" if args.incremental else "--chunksize" if args.chunksize > 0 else None
+    if mode and args.compact:
+        p.error(f"--compact cannot be combined with {mode}")
+    if mode and args.validate_sample is not None:
+        p.error(f"--validate_sample cannot be combined with {mode}")
+
+    profiler = Profiler(trace_memory=args.profile_memory, meta={"argv": sys.argv[1:], "code_version": code_version()})
+    enabled = bool(args.profile or args.profile_chrome)
+    with profiling(profiler) if enabled else nullcontext(), stage("build_report"):
+        build_report(
+            args.data_dir,
+            args.report_path,
+            args.defs_path,
+            args.one_pager_path,
+            fmt=args.format,
+            incremental=args.incremental,
+            state_path=args.state_path,
+            compact=args.compact,
+            chunksize=args.chunksize,
+            orders=args.orders,
+            spill_dir=args.spill_dir,
+            workers=args.workers,
+            partition_by=args.partition_by,
+            cache_dir=args.cache_dir,
+            use_cache=not args.no_cache,
+            cache_max_mb=args.cache_max_mb,
+            cache_content_hash=args.cache_content_hash,
+            validate_sample=args.validate_sample,
+            rollup=args.rollup,
+            io_workers=args.io_workers,
+        )
+    if args.profile:
+        profiler.write_json(args.profile)
+    if args.profile_chrome:
+        profiler.write_chrome_trace(args.profile_chrome)
 
-    build_report(args.data_dir, args.report_path, args.defs_path, args.one_pager_path)
     print("Artifacts generated:")
     print(f"- {args.report_path}")
     print(f"- {args.defs_path}")
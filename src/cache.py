@@ -0,0 +1,110 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import pickle
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, List, Optional
+
+from src.storage import partition_files, stored_table
+
+
+CACHE_VERSION = 1
+SRC_DIR = Path(__file__).resolve().parent
+
+
+def default_cache_dir(data_dir: str) -> Path:
+    return Path(data_dir) / "_cache"
+
+
+@lru_cache(maxsize=1)
+def code_version() -> str:
+    # Any edit to the package source invalidates every cached result
+    h = hashlib.sha256(str(CACHE_VERSION).encode())
+    for path in sorted(SRC_DIR.glob("*.py")):
+        h.update(path.name.encode())
+        h.update(path.read_bytes())
+    return h.hexdigest()[:16]
+
+
+def _file_digest(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def fingerprint(data_dir: str, name: str, fmt: str = "csv", content: bool = False) -> List[list]:
+    # Identifies the current contents of a table by the size and mtime of its files, or
+    # by their sha256 when content=True (slower, but robust to touched or copied files)
+    out = []
+    for path in partition_files(data_dir, stored_table(data_dir, name, fmt), fmt):
+        if not path.exists():
+            out.append([path.name, None])
+            continue
+        st = path.stat()
+        rel = str(path.relative_to(data_dir))
+        out.append([rel, _file_digest(path)] if content else [rel, st.st_size, st.st_mtime_ns])
+    return out
+
+
+def cache_key(*parts: Any) -> str:
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResultCache:
+    # Pickled results in one file per key. Reads refresh the file's mtime, so the
+    # least recently used entries are the first evicted once the cache holds more
+    # than max_bytes or max_entries.
+    def __init__(self, cache_dir: str, max_bytes: int = 256 * 2**20, max_entries: int = 64) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.pkl"
+
+    def get(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # Truncated or written by an incompatible version: treat as a miss
+            path.unlink(missing_ok=True)
+            return None
+        os.utime(path)
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp.replace(path)
+        self.evict()
+
+    def evict(self) -> None:
+        entries = []
+        for p in self.cache_dir.glob("*.pkl"):
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime_ns, st.st_size, p))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        while entries and (total > self.max_bytes or len(entries) > self.max_entries):
+            _, size, p = entries.pop(0)
+            p.unlink(missing_ok=True)
+            total -= size
+
+    def clear(self) -> None:
+        for p in self.cache_dir.glob("*.pkl"):
+            p.unlink(missing_ok=True)
@@ -0,0 +1,247 @@
+from __future__ import annotations
+import json
+import os
+import zlib
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.compact import split_ids
+
+
+# A table stored as a directory holding one raw array file per column and a manifest:
+#   {"rows": n, "columns": {name: {"kind", "dtype", "crc32", ...}}}
+# Column kinds:
+#   values      numbers and bools, in their own dtype
+#   date        int32 day numbers since 1970-01-01 (timestamps at midnight, no NaT)
+#   datetime    int64 nanoseconds, for any other timestamps
+#   dictionary  integer codes (-1 for missing) into "categories", loaded as a Categorical
+#   id          IDs of one "prefix" plus "width" digits, stored and loaded as the integer
+#               part, as --compact loads OrderID
+# Columns are opened with np.memmap, so opening a table costs the manifest read, several
+# processes share the OS page cache, and only the columns (and rows) a metric touches
+# are ever paged in. Date columns are the exception: they are widened to datetime64 on
+# open, one pass over the day numbers. read_columns(verify=True) checks each opened
+# column against its crc32 first, which reads the whole file.
+MANIFEST = "_manifest.json"
+DAY_US = 86_400_000_000
+
+
+def _code_dtype(n_categories: int) -> np.dtype:
+    # The code width pandas itself uses, so codes are wrapped without a copy
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_categories < np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def _column_file(path: Path, name: str) -> Path:
+    return path / f"{name}.bin"
+
+
+def read_manifest(path: Path) -> dict:
+    return json.loads((path / MANIFEST).read_text(encoding="utf8"))
+
+
+def _write_manifest(path: Path, manifest: dict) -> None:
+    tmp = path / f".{MANIFEST}.{os.getpid()}.tmp"
+    tmp.write_text(json.dumps(manifest, indent=1), encoding="utf8")
+    os.replace(tmp, path / MANIFEST)
+
+
+def _encode(s: pd.Series, ids: bool, old: Optional[dict] = None) -> Optional[Tuple[np.ndarray, dict]]:
+    # (array, column meta) for s, continuing old's encoding when appending; None when s
+    # does not fit old's encoding and the column has to be rewritten
+    if isinstance(s.dtype, pd.DatetimeTZDtype):
+        raise TypeError(f"{s.name}: timezone-aware timestamps are not supported")
+    if pd.api.types.is_datetime64_dtype(s.dtype):
+        us = s.to_numpy("datetime64[us]").view(np.int64)
+        kind = "date" if not s.isna().any() and (us % DAY_US == 0).all() else "datetime"
+        if old is not None and old["kind"] != kind:
+            return None
+        if kind == "date":
+            return (us // DAY_US).astype("<i4"), {"kind": kind, "dtype": "<i4"}
+        return s.to_numpy("datetime64[ns]").view(np.int64), {"kind": kind, "dtype": "<i8"}
+
+    if pd.api.types.is_bool_dtype(s.dtype) or pd.api.types.is_numeric_dtype(s.dtype):
+        values = s.to_numpy()
+        if values.dtype == object:
+            values = s.to_numpy(dtype=np.float64, na_value=np.nan)
+        if old is not None and (old["kind"] != "values" or np.dtype(old["dtype"]) != values.dtype):
+            return None
+        return values, {"kind": "values", "dtype": values.dtype.str}
+
+    if ids and not isinstance(s.dtype, pd.CategoricalDtype):
+        parts = split_ids(s)
+        if parts is not None:
+            prefix, width, digits = parts
+            if old is None or (old["kind"] == "id" and old["prefix"] == prefix and old["width"] == width):
+                return digits.to_numpy(dtype="<i8"), {"kind": "id", "dtype": "<i8", "prefix": prefix, "width": width}
+
+    if old is not None and old["kind"] != "dictionary":
+        return None
+    return _dictionary(s, old["categories"] if old is not None else [], old)
+
+
+def _dictionary(s: pd.Series, known: list, old: Optional[dict] = None) -> Optional[Tuple[np.ndarray, dict]]:
+    # Codes into known plus, appended in sorted order, any values not seen before
+    values = s.cat.categories if isinstance(s.dtype, pd.CategoricalDtype) else pd.Index(s.dropna().unique())
+    new = values.difference(pd.Index(known)).sort_values()
+    categories = pd.Index(known).append(pd.Index(new)) if len(known) else pd.Index(new)
+    dtype = _code_dtype(len(categories))
+    if old is not None and np.dtype(old["dtype"]) != dtype:
+        return None
+    codes = pd.Categorical(s, categories=categories).codes.astype(dtype)
+    return codes, {"kind": "dictionary", "dtype": dtype.str, "categories": categories.tolist()}
+
+
+def _verify(path: Path, name: str, meta: dict, rows: int) -> None:
+    file = _column_file(path, name)
+    left = rows * np.dtype(meta["dtype"]).itemsize
+    crc = 0
+    with open(file, "rb") as f:
+        while left > 0:
+            block = f.read(min(left, 1 << 24))
+            if not block:
+                break
+            crc = zlib.crc32(block, crc)
+            left -= len(block)
+    if left or crc != meta["crc32"]:
+        raise ValueError(f"{file} does not match its crc32 in {path / MANIFEST}: truncated or corrupt")
+
+
+def _open(path: Path, name: str, meta: dict, rows: int, verify: bool = False) -> pd.Series:
+    if verify:
+        _verify(path, name, meta, rows)
+    dtype = np.dtype(meta["dtype"])
+    if rows:
+        values = np.memmap(_column_file(path, name), dtype=dtype, mode="r", shape=(rows,))
+    else:
+        values = np.empty(0, dtype=dtype)
+
+    kind = meta["kind"]
+    if kind == "date":
+        values = (values.astype(np.int64) * DAY_US).view("datetime64[us]")
+    elif kind == "datetime":
+        values = values.view("datetime64[ns]")
+    elif kind == "dictionary":
+        values = pd.Categorical.from_codes(values, categories=meta["categories"], validate=False)
+    return pd.Series(values, name=name, copy=False)
+
+
+def _decode(path: Path, name: str, meta: dict, rows: int) -> pd.Series:
+    # The column's original values, for re-encoding
+    s = _open(path, name, meta, rows)
+    if meta["kind"] == "id":
+        return meta["prefix"] + s.astype(str).str.zfill(meta["width"])
+    return s
+
+
+def write_columns(df: pd.DataFrame, path: Path, ids: Sequence[str] = (), append: bool = False) -> None:
+    # Writes df as a column store at path, replacing any table there, or with append=True
+    # adds its rows to the existing one. Columns named in ids are stored as "id" columns
+    # when their values fit, other strings dictionary encoded.
+    manifest = read_manifest(path) if append and (path / MANIFEST).exists() else None
+    if manifest is None:
+        if path.exists():
+            for f in path.iterdir():
+                f.unlink()
+        path.mkdir(parents=True, exist_ok=True)
+        manifest = {"rows": 0, "columns": {}}
+    elif list(manifest["columns"]) != list(df.columns):
+        raise ValueError(f"Cannot append columns {list(df.columns)} to {path} with {list(manifest['columns'])}")
+
+    rows = manifest["rows"]
+    for c in df.columns:
+        old = manifest["columns"].get(c)
+        encoded = _encode(df[c], c in ids, old)
+        if encoded is None:
+            # The new rows need a wider or different encoding: rewrite the column
+            encoded = _encode(pd.concat([_decode(path, c, old, rows), df[c]], ignore_index=True), c in ids)
+            old = None
+        values, meta = encoded
+        data = np.ascontiguousarray(values).tobytes()
+        with open(_column_file(path, c), "ab" if old is not None else "wb") as f:
+            f.write(data)
+        meta["crc32"] = zlib.crc32(data, old["crc32"] if old is not None else 0)
+        manifest["columns"][c] = meta
+    manifest["rows"] = rows + len(df)
+    _write_manifest(path, manifest)
+
+
+def copy_bytes(src, dst, start: int, stop: int, crc: int = 0) -> int:
+    # Copies bytes [start, stop) of the open file src to dst; returns their crc32 continued from crc
+    src.seek(start)
+    left = stop - start
+    while left > 0:
+        block = src.read(min(left, 1 << 24))
+        if not block:
+            raise EOFError(f"{src.name} ends before byte {stop}")
+        dst.write(block)
+        crc = zlib.crc32(block, crc)
+        left -= len(block)
+    return crc
+
+
+def _same_encoding(a: dict, b: dict) -> bool:
+    return {k: v for k, v in a.items() if k != "crc32"} == {k: v for k, v in b.items() if k != "crc32"}
+
+
+def concat_columns(ranges: Sequence[Tuple[Path, int, int]], path: Path) -> None:
+    # Writes rows [start, stop) of each (store, start, stop) in ranges, in order, as one
+    # store at path. Columns encoded alike in every source are copied byte for byte; any
+    # other column is decoded and encoded again over all the rows.
+    manifests = {src: read_manifest(src) for src, _, _ in ranges}
+    first = manifests[ranges[0][0]]
+    for src, m in manifests.items():
+        if list(m["columns"]) != list(first["columns"]):
+            raise ValueError(f"{src} has columns {list(m['columns'])}, expected {list(first['columns'])}")
+
+    if path.exists():
+        for f in path.iterdir():
+            f.unlink()
+    path.mkdir(parents=True, exist_ok=True)
+    manifest = {"rows": sum(stop - start for _, start, stop in ranges), "columns": {}}
+    for c, meta in first["columns"].items():
+        metas = [manifests[src]["columns"][c] for src, _, _ in ranges]
+        if all(_same_encoding(m, meta) for m in metas):
+            itemsize = np.dtype(meta["dtype"]).itemsize
+            crc = 0
+            with open(_column_file(path, c), "wb") as out:
+                for src, start, stop in ranges:
+                    with open(_column_file(src, c), "rb") as f:
+                        crc = copy_bytes(f, out, start * itemsize, stop * itemsize, crc)
+            manifest["columns"][c] = {**meta, "crc32": crc}
+            continue
+
+        parts = [
+            _decode(src, c, m, manifests[src]["rows"]).iloc[start:stop]
+            for (src, start, stop), m in zip(ranges, metas)
+        ]
+        values, new = _encode(pd.concat(parts, ignore_index=True), any(m["kind"] == "id" for m in metas))
+        data = np.ascontiguousarray(values).tobytes()
+        _column_file(path, c).write_bytes(data)
+        new["crc32"] = zlib.crc32(data)
+        manifest["columns"][c] = new
+    _write_manifest(path, manifest)
+
+
+def read_columns(path: Path, columns: Optional[List[str]] = None, verify: bool = False) -> pd.DataFrame:
+    manifest = read_manifest(path)
+    names = columns if columns is not None else list(manifest["columns"])
+    missing = [c for c in names if c not in manifest["columns"]]
+    if missing:
+        raise KeyError(f"{path} has no columns {missing}")
+    series = {c: _open(path, c, manifest["columns"][c], manifest["rows"], verify) for c in names}
+    return pd.DataFrame(series, copy=False)
+
+
+def iter_column_chunks(
+    path: Path, chunksize: int, columns: Optional[List[str]] = None, verify: bool = False
+) -> Iterator[pd.DataFrame]:
+    # Row slices of the mapped columns; each chunk pages in only its own rows
+    df = read_columns(path, columns, verify)
+    for start in range(0, len(df), chunksize):
+        yield df.iloc[start : start + chunksize].reset_index(drop=True)
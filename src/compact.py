@@ -0,0 +1,95 @@
+from __future__ import annotations
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+
+
+# Fact key column -> (Dim table, key column) that serves as its dictionary
+DIM_KEYS = {
+    "SKU": ("DimSKU", "SKU"),
+    "Store": ("DimStore", "Store"),
+    "Channel": ("DimChannel", "Channel"),
+}
+
+# Read dtypes for the key columns; categories are unioned with the Dim keys afterwards
+KEY_DTYPES = {col: "category" for col in DIM_KEYS}
+
+# Integer measures that fit comfortably in narrow types
+DOWNCAST_COLUMNS = ("Units", "OnHandUnits", "ReturnFlag")
+
+
+def _distinct(s: pd.Series) -> pd.Index:
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        return pd.Index(s.cat.categories.astype(str))
+    return pd.Index(s.dropna().astype(str).unique())
+
+
+def _categories(dim_values: pd.Series, *facts: pd.Series) -> pd.Index:
+    # Sorted Dim keys plus any key seen only in a fact, which is kept rather than silently turned into NaN
+    cats = _distinct(dim_values)
+    for s in facts:
+        cats = cats.union(_distinct(s))
+    return cats.sort_values()
+
+
+def encode_keys(s: pd.Series, categories: pd.Index) -> pd.Series:
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        # Already dictionary encoded (columnar storage): remap codes without materializing strings
+        return s.cat.rename_categories(s.cat.categories.astype(str)).cat.set_categories(categories)
+    return pd.Series(pd.Categorical(s.astype(str), categories=categories), index=s.index, name=s.name)
+
+
+def split_ids(ids: pd.Series) -> Optional[Tuple[str, int, pd.Series]]:
+    # "ORD-00000042" -> ("ORD-", 8, 42) when every ID is one prefix plus fixed-width digits, else None
+    ids = ids.astype(str)
+    if len(ids):
+        prefix = ids.iloc[0].rstrip("0123456789")
+        digits = ids.str.slice(len(prefix))
+        if ids.str.len().nunique() == 1 and ids.str.startswith(prefix).all() and digits.str.isdigit().all():
+            return prefix, len(ids.iloc[0]) - len(prefix), pd.to_numeric(digits, downcast="integer")
+    return None
+
+
+def encode_order_ids(order_ids: pd.Series) -> pd.Series:
+    # "ORD-00000042" -> 42 when every ID is one prefix plus fixed-width digits; otherwise dense
+    # factorized codes. Either way distinct IDs stay distinct, which is all Orders (nunique) needs.
+    if pd.api.types.is_integer_dtype(order_ids.dtype):
+        return order_ids
+    parts = split_ids(order_ids)
+    if parts is not None:
+        return parts[2].rename(order_ids.name)
+    codes, _ = pd.factorize(order_ids)
+    return pd.Series(codes, index=order_ids.index, name=order_ids.name).astype("int32" if len(codes) < 2**31 else "int64")
+
+
+def compact_tables(tables: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
+    # Replaces columns in place: a copy would hold the wide and compact frames at once
+    facts = [tables[n] for n in ("FactSales", "FactInventorySnapshot") if n in tables]
+
+    for col, (dim_name, dim_col) in DIM_KEYS.items():
+        dim = tables[dim_name]
+        cats = _categories(dim[dim_col], *[f[col] for f in facts if col in f.columns])
+        dim[dim_col] = encode_keys(dim[dim_col], cats)
+        for f in facts:
+            if col in f.columns:
+                f[col] = encode_keys(f[col], cats)
+
+    if "Region" in tables["DimStore"].columns:
+        tables["DimStore"]["Region"] = tables["DimStore"]["Region"].astype("category")
+
+    for f in facts:
+        for col in DOWNCAST_COLUMNS:
+            if col in f.columns:
+                f[col] = pd.to_numeric(f[col], downcast="integer")
+        if "OrderID" in f.columns:
+            f["OrderID"] = encode_order_ids(f["OrderID"])
+
+    return tables
+
+
+def memory_usage(tables: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    rows = [
+        {"Table": name, "Rows": len(df), "MB": round(df.memory_usage(deep=True).sum() / 2**20, 3)}
+        for name, df in tables.items()
+    ]
+    return pd.DataFrame(rows)
@@ -0,0 +1,146 @@
+from __future__ import annotations
+import shutil
+import tempfile
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+def _hash(values: np.ndarray) -> np.ndarray:
+    # 64-bit hashes; integers hash natively, everything else via its string form
+    if values.dtype.kind in "iub":
+        return pd.util.hash_array(values)
+    return pd.util.hash_array(values.astype(str).astype(object))
+
+
+class ExactDistinct:
+    # Exact distinct count. Values are kept in memory until more than max_in_memory
+    # distinct values are held, then hash-partitioned into bucket files on disk so
+    # each bucket can be de-duplicated on its own at count time.
+    def __init__(self, max_in_memory: Optional[int] = None, spill_dir: Optional[str] = None, buckets: int = 64) -> None:
+        self.max_in_memory = max_in_memory
+        self.spill_dir = spill_dir
+        self.buckets = buckets
+        self._values: Optional[np.ndarray] = None
+        self._pending: List[np.ndarray] = []
+        self._pending_n = 0
+        self._spill_path: Optional[Path] = None
+
+    @property
+    def spilled(self) -> bool:
+        return self._spill_path is not None
+
+    def update(self, values) -> None:
+        u = pd.unique(np.asarray(values))
+        self._pending.append(u)
+        self._pending_n += len(u)
+        if self._pending_n > max(self._held(), 1_000_000):
+            self._compact()
+
+    def _held(self) -> int:
+        return 0 if self._values is None else len(self._values)
+
+    def _compact(self) -> None:
+        if self._pending:
+            parts = self._pending if self._values is None else [self._values, *self._pending]
+            self._values = pd.unique(np.concatenate(parts))
+            self._pending, self._pending_n = [], 0
+        if self.max_in_memory is not None and self._held() > self.max_in_memory:
+            self._spill(self._values)
+            self._values = None
+
+    def _spill(self, values: np.ndarray) -> None:
+        if self._spill_path is None:
+            self._spill_path = Path(tempfile.mkdtemp(prefix="distinct-", dir=self.spill_dir))
+        bucket = _hash(values) % np.uint64(self.buckets)
+        for b in np.unique(bucket):
+            with open(self._spill_path / f"bucket-{int(b):04d}.txt", "a", encoding="utf8") as f:
+                f.write("\n".join(values[bucket == b].astype(str)) + "\n")
+
+    def merge(self, other: "ExactDistinct") -> None:
+        other._compact()
+        if other._values is not None:
+            self.update(other._values)
+        if other.spilled:
+            self._compact()
+            if self._spill_path is None:
+                self._spill_path = Path(tempfile.mkdtemp(prefix="distinct-", dir=self.spill_dir))
+            for src in sorted(other._spill_path.glob("bucket-*.txt")):
+                with open(self._spill_path / src.name, "a", encoding="utf8") as dst:
+                    dst.write(src.read_text(encoding="utf8"))
+
+    def count(self) -> int:
+        self._compact()
+        if not self.spilled:
+            return self._held()
+        if self._values is not None:
+            self._spill(self._values)
+            self._values = None
+        total = 0
+        for path in sorted(self._spill_path.glob("bucket-*.txt")):
+            with open(path, encoding="utf8") as f:
+                total += len({line for line in f.read().splitlines() if line})
+        return total
+
+    def close(self) -> None:
+        if self._spill_path is not None:
+            shutil.rmtree(self._spill_path, ignore_errors=True)
+            self._spill_path = None
+
+    def __getstate__(self) -> dict:
+        if self.spilled:
+            raise ValueError("A spilled ExactDistinct cannot be pickled.")
+        self._compact()
+        return self.__dict__.copy()
+
+
+class HyperLogLog:
+    # Approximate distinct count with relative standard error ~1.04 / sqrt(2**p)
+    # (about 0.8% at the default p=14), in 2**p bytes of state.
+    def __init__(self, p: int = 14) -> None:
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    def update(self, values) -> None:
+        values = np.asarray(values)
+        if not len(values):
+            return
+        h = _hash(values)
+        idx = (h >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = h & np.uint64((1 << (64 - self.p)) - 1)
+        # Rank is the position of the leftmost 1-bit in the remaining 64-p bits; the
+        # values fit exactly in a float64 mantissa, so frexp gives their bit length.
+        bit_length = np.frexp(rest.astype(np.float64))[1]
+        rank = (64 - self.p - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, idx, rank)
+
+    def merge(self, other: "HyperLogLog") -> None:
+        if other.p != self.p:
+            raise ValueError("Cannot merge HyperLogLog sketches with different precision.")
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self) -> int:
+        m = float(len(self.registers))
+        alpha = 0.7213 / (1.0 + 1.079 / m)
+        estimate = alpha * m * m / float(np.sum(np.exp2(-self.registers.astype(np.float64))))
+        zeros = int((self.registers == 0).sum())
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate in the small range
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+    def standard_error(self) -> float:
+        return 1.04 / np.sqrt(len(self.registers))
+
+    def close(self) -> None:
+        pass
+
+
+def make_distinct(mode: str = "exact", max_in_memory: Optional[int] = None, spill_dir: Optional[str] = None):
+    if mode == "exact":
+        return ExactDistinct(max_in_memory=max_in_memory, spill_dir=spill_dir)
+    if mode == "approx":
+        return HyperLogLog()
+    raise ValueError(f"Unknown distinct count mode {mode!r}, expected 'exact' or 'approx'")
@@ -0,0 +1,184 @@
+from __future__ import annotations
+import argparse
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.metrics import attribute_lookups, key_columns, load_tables
+from src.profiling import profiled
+from src.reporting import md_table, write_text
+from src.storage import FORMATS
+
+
+# Sales $ change = Volume + Mix + Price + Markdown; GM $ change adds Rate (margin on net sales).
+# Within each member of the level, mix is across its SKUs, valued at base period prices:
+#   Volume   (U1 - U0) x base average net price of the member
+#   Mix      current units at each SKU's base net price, less Volume and base Sales
+#   Price    change in list price (UnitPrice) at the base DiscountRate
+#   Markdown change in DiscountRate at the current list price
+# List price and DiscountRate are the unit-weighted UnitPrice and DiscountRate, taken from
+# Sales + DiscountAmt and DiscountAmt so the effects add up to the change exactly. SKUs not
+# sold in the base period are valued at DimSKU BasePrice and BaseMarginRate, and the base
+# period's overall DiscountRate (per base week for weekly_drivers, so each week matches drivers
+# run on that pair of weeks).
+LEVELS = ["SKU", "Brand", "Category", "Store", "Region", "Channel"]
+SALES_EFFECTS = ["SalesVolume", "SalesMix", "SalesPrice", "SalesMarkdown"]
+GM_EFFECTS = ["GMVolume", "GMMix", "GMPrice", "GMMarkdown", "GMRate"]
+MEASURES = ["Units", "Sales", "DiscountAmt", "GrossMarginAmt"]
+
+Period = Tuple[pd.Timestamp, pd.Timestamp]
+
+
+def _ratio(num: np.ndarray, den: np.ndarray, fallback) -> np.ndarray:
+    out = np.broadcast_to(np.asarray(fallback, dtype=float), num.shape).copy()
+    np.divide(num, den, out=out, where=den > 0)
+    return out
+
+
+def _decompose(cells: pd.DataFrame, members: List[str], dim_sku: pd.DataFrame, period: Optional[str] = None) -> pd.DataFrame:
+    # cells: members, SKU and MEASURES suffixed 0 (base) and 1 (current), zero where unsold.
+    # period names the column that separates pairs of periods when cells hold several.
+    u0, s0, d0, m0 = (cells[f"{c}0"].to_numpy(dtype=float) for c in MEASURES)
+    u1, s1, d1, m1 = (cells[f"{c}1"].to_numpy(dtype=float) for c in MEASURES)
+    g0, g1 = s0 + d0, s1 + d1
+
+    codes, uniques = pd.factorize(cells["SKU"])
+    base = dim_sku.set_index(dim_sku["SKU"].astype(str))[["BasePrice", "BaseMarginRate"]]
+    base = base.reindex(pd.Index(uniques).astype(str)).to_numpy(dtype=float)[codes]
+
+    # Base period list price, DiscountRate and margin rate per cell
+    price0 = _ratio(g0, u0, base[:, 0])
+    if period is None:
+        pooled_d0, pooled_g0 = d0.sum(), g0.sum()
+    else:
+        by = cells[period].to_numpy()
+        pooled_d0 = pd.Series(d0).groupby(by).transform("sum").to_numpy()
+        pooled_g0 = pd.Series(g0).groupby(by).transform("sum").to_numpy()
+    disc0 = _ratio(d0, g0, _ratio(np.broadcast_to(pooled_d0, d0.shape), np.broadcast_to(pooled_g0, g0.shape), 0.0))
+    rate0 = _ratio(m0, s0, base[:, 1])
+    net0 = price0 * (1 - disc0)
+
+    parts = pd.DataFrame(
+        {
+            "Units0": u0,
+            "Units1": u1,
+            "SalesBase": s0,
+            "SalesCurrent": s1,
+            "GMBase": m0,
+            "GMCurrent": m1,
+            "SalesAtBase": u1 * net0,
+            "SalesPrice": g1 * (1 - disc0) - u1 * net0,
+            "SalesMarkdown": g1 * disc0 - d1,
+            "GMAtBase": u1 * net0 * rate0,
+            "GMPrice": (g1 * (1 - disc0) - u1 * net0) * rate0,
+            "GMMarkdown": (g1 * disc0 - d1) * rate0,
+            "GMRate": m1 - s1 * rate0,
+        },
+        index=cells.index,
+    )
+    out = parts.groupby([cells[k] for k in members], observed=True).sum().reset_index()
+
+    # Volume at the member's base average, the rest of the move to current units at base prices is mix
+    units0, units1 = out["Units0"].to_numpy(), out["Units1"].to_numpy()
+    for m, at_base in (("Sales", "SalesAtBase"), ("GM", "GMAtBase")):
+        base_total = out[f"{m}Base"].to_numpy()
+        volume = np.where(units0 > 0, (units1 - units0) * _ratio(base_total, units0, 0.0), out[at_base].to_numpy())
+        out[f"{m}Volume"] = volume
+        out[f"{m}Mix"] = out[at_base].to_numpy() - base_total - volume
+        out[f"{m}Change"] = out[f"{m}Current"] - out[f"{m}Base"]
+
+    cols = [*members, "SalesBase", "SalesCurrent", "SalesChange", *SALES_EFFECTS, "GMBase", "GMCurrent", "GMChange", *GM_EFFECTS]
+    return out[cols]
+
+
+def _cells(fact_sales: pd.DataFrame, keys: List[str], lookups: dict) -> pd.DataFrame:
+    cell_keys = keys if "SKU" in keys else [*keys, "SKU"]
+    return fact_sales.groupby(key_columns(fact_sales, cell_keys, lookups), observed=True)[MEASURES].sum()
+
+
+def _pair(base: pd.DataFrame, current: pd.DataFrame) -> pd.DataFrame:
+    cells = base.join(current, how="outer", lsuffix="0", rsuffix="1")
+    return cells.fillna(0).reset_index()
+
+
+@profiled()
+def drivers(
+    fact_sales: pd.DataFrame,
+    dim_sku: pd.DataFrame,
+    base: Period,
+    current: Period,
+    level: str = "Category",
+    dim_store: Optional[pd.DataFrame] = None,
+) -> pd.DataFrame:
+    # Sales $ and GM $ change from base to current (inclusive date ranges) per member of
+    # level, split into SALES_EFFECTS and GM_EFFECTS
+    lookups = attribute_lookups(dim_sku, dim_store)
+    dates = fact_sales["OrderDate"]
+
+    def cells(period: Period) -> pd.DataFrame:
+        return _cells(fact_sales[(dates >= period[0]) & (dates <= period[1])], [level], lookups)
+
+    return _decompose(_pair(cells(base), cells(current)), [level], dim_sku)
+
+
+@profiled()
+def weekly_drivers(
+    fact_sales: pd.DataFrame, dim_sku: pd.DataFrame, level: str = "Store", dim_store: Optional[pd.DataFrame] = None
+) -> pd.DataFrame:
+    # drivers for every week against the week before, per member of level, from one grouped
+    # pass: each week's cells are paired with the previous week's by shifting WeekStart
+    lookups = attribute_lookups(dim_sku, dim_store)
+    cells = _cells(fact_sales, ["WeekStart", level], lookups).reset_index()
+    prior = cells.assign(WeekStart=cells["WeekStart"] + pd.Timedelta(days=7))
+
+    keys = ["WeekStart", level] if level == "SKU" else ["WeekStart", level, "SKU"]
+    pairs = _pair(prior.set_index(keys), cells.set_index(keys))
+    weeks = np.sort(cells["WeekStart"].unique())
+    pairs = pairs[pairs["WeekStart"].isin(weeks[1:])]
+    return _decompose(pairs, ["WeekStart", level], dim_sku, period="WeekStart")
+
+
+def _period(text: str) -> Period:
+    start, _, end = text.partition(":")
+    return pd.Timestamp(start), pd.Timestamp(end or start)
+
+
+def drivers_md(table: pd.DataFrame, title: str, max_rows: int) -> str:
+    shown = table.sort_values("SalesChange", key=np.abs, ascending=False).round(2)
+    return "\n".join([f"# Drivers: {title}\n", md_table(shown, max_rows=max_rows), ""])
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Decompose the Sales $ and GM $ change between two periods into drivers.")
+    p.add_argument("--data_dir", type=str, default="data_out")
+    p.add_argument("--format", type=str, default="csv", choices=FORMATS)
+    p.add_argument("--level", type=str, default="Category", choices=LEVELS)
+    p.add_argument("--base", type=str, default=None, help="START:END (default: the 28 days before --current).")
+    p.add_argument("--current", type=str, default=None, help="START:END (default: the last 28 days).")
+    p.add_argument("--weekly", action="store_true", help="Every week against the week before instead of two periods.")
+    p.add_argument("--output", type=str, default="reports/drivers.md", help="Markdown report, or .csv for the full table.")
+    p.add_argument("--max_rows", type=int, default=25, help="Rows shown in the Markdown report, largest change first.")
+    args = p.parse_args()
+
+    t = load_tables(args.data_dir, args.format, names=["DimSKU", "DimStore", "FactSales"])
+    fs = t["FactSales"]
+    if args.weekly:
+        table = weekly_drivers(fs, t["DimSKU"], args.level, t["DimStore"])
+        title = f"{args.level}, week over week"
+    else:
+        last = fs["OrderDate"].max()
+        current = _period(args.current) if args.current else (last - pd.Timedelta(days=27), last)
+        base = _period(args.base) if args.base else (current[0] - pd.Timedelta(days=28), current[0] - pd.Timedelta(days=1))
+        table = drivers(fs, t["DimSKU"], base, current, args.level, t["DimStore"])
+        title = f"{args.level}, {current[0].date()}..{current[1].date()} vs {base[0].date()}..{base[1].date()}"
+
+    if args.output.endswith(".csv"):
+        table.to_csv(args.output, index=False)
+    else:
+        write_text(args.output, drivers_md(table, title, args.max_rows))
+    print(f"Drivers ({len(table)} rows) written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
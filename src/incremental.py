@@ -0,0 +1,301 @@
+from __future__ import annotations
+import pickle
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from src.distinct import ExactDistinct, HyperLogLog
+from src.inventory import daily_on_hand, latest_on_hand
+from src.metrics import add_week_start, inventory_tables_from_parts, kpis_from_totals, sales_by_week_table, top_movers_table
+from src.profiling import profiled
+from src.storage import DATE_COLUMNS, partition_files, read_partition, read_table, stored_table
+from src.validate import REQUIRED_COLUMNS, validate_tables
+
+
+STATE_VERSION = 5
+WINDOW_DAYS = 28
+DIM_TABLES = ("DimDate", "DimSKU", "DimStore", "DimChannel")
+FACT_TABLES = ("FactSales", "FactInventorySnapshot")
+# How much of the already folded rows is compared to detect a rewrite
+TAIL_BYTES = 1 << 16
+TAIL_ROWS = 1000
+
+
+def default_state_path(data_dir: str) -> Path:
+    return Path(data_dir) / "_kpi_state.pkl"
+
+
+def _fold(current: Optional[pd.DataFrame], new: pd.DataFrame, keys: list) -> pd.DataFrame:
+    combined = new if current is None else pd.concat([current, new], ignore_index=True)
+    return combined.groupby(keys, as_index=False, observed=True).sum()
+
+
+def _plain_keys(df: pd.DataFrame, keys: list) -> pd.DataFrame:
+    # Store keys as plain strings so partials from differently encoded inputs concatenate cleanly
+    out = df.copy()
+    for k in keys:
+        if isinstance(out[k].dtype, pd.CategoricalDtype):
+            out[k] = out[k].astype(str)
+    return out
+
+
+@dataclass
+class AggregateState:
+    # Partial aggregates of FactSales and FactInventorySnapshot; folding new rows in
+    # gives the same report inputs as aggregating the full history.
+    fmt: str = "csv"
+    version: int = STATE_VERSION
+    files: Dict[str, dict] = field(default_factory=dict)
+
+    sales: float = 0.0
+    units: int = 0
+    gm: float = 0.0
+    markdown: float = 0.0
+    orders: Union[ExactDistinct, HyperLogLog] = field(default_factory=ExactDistinct)  # distinct OrderIDs
+
+    weekly: Optional[pd.DataFrame] = None  # WeekStart, Sales, Units
+    sku_totals: Optional[pd.DataFrame] = None  # SKU, Sales, Units, GrossMarginAmt, DiscountAmt
+    last_order_date: Optional[pd.Timestamp] = None
+    sku_store_window: Optional[pd.DataFrame] = None  # OrderDate, SKU, Store, Units for the trailing window
+
+    daily_on_hand: Optional[pd.DataFrame] = None  # SnapshotDate, OnHandUnits
+    latest_snapshot: Optional[pd.Timestamp] = None
+    latest_on_hand: Optional[pd.DataFrame] = None  # SKU, Store, OnHandUnits at latest_snapshot
+
+    def fold_sales(self, fs: pd.DataFrame) -> None:
+        if fs.empty:
+            return
+        self.sales += float(fs["Sales"].sum())
+        self.units += int(fs["Units"].sum())
+        self.gm += float(fs["GrossMarginAmt"].sum())
+        self.markdown += float(fs["DiscountAmt"].sum())
+        self.orders.update(fs["OrderID"].to_numpy())
+
+        weekly = add_week_start(fs[["OrderDate", "Sales", "Units"]], "OrderDate")
+        weekly = weekly.groupby("WeekStart", as_index=False)[["Sales", "Units"]].sum()
+        self.weekly = _fold(self.weekly, weekly, ["WeekStart"])
+
+        skus = fs.groupby("SKU", as_index=False, observed=True)[["Sales", "Units", "GrossMarginAmt", "DiscountAmt"]].sum()
+        self.sku_totals = _fold(self.sku_totals, _plain_keys(skus, ["SKU"]), ["SKU"])
+
+        last = fs["OrderDate"].max()
+        self.last_order_date = last if self.last_order_date is None else max(self.last_order_date, last)
+        start = self.last_order_date - pd.Timedelta(days=WINDOW_DAYS - 1)
+
+        keys = ["OrderDate", "SKU", "Store"]
+        daily = fs[fs["OrderDate"] >= start].groupby(keys, as_index=False, observed=True)["Units"].sum()
+        window = _fold(self.sku_store_window, _plain_keys(daily, ["SKU", "Store"]), keys)
+        self.sku_store_window = window[window["OrderDate"] >= start].reset_index(drop=True)
+
+    def fold_inventory(self, inv: pd.DataFrame) -> None:
+        # inv is daily snapshot rows or change rows; both fold the same way
+        if inv.empty:
+            return
+        self.daily_on_hand = _fold(self.daily_on_hand, daily_on_hand(inv), ["SnapshotDate"])
+
+        latest, rows = latest_on_hand(inv)
+        rows = _plain_keys(rows, ["SKU", "Store"])
+        if self.latest_snapshot is None or latest > self.latest_snapshot:
+            self.latest_snapshot = latest
+            self.latest_on_hand = _fold(None, rows, ["SKU", "Store"])
+        elif latest == self.latest_snapshot:
+            self.latest_on_hand = _fold(self.latest_on_hand, rows, ["SKU", "Store"])
+
+    def merge(self, other: "AggregateState") -> None:
+        # Combine partials built over disjoint sets of fact rows
+        self.sales += other.sales
+        self.units += other.units
+        self.gm += other.gm
+        self.markdown += other.markdown
+        self.orders.merge(other.orders)
+
+        if other.weekly is not None:
+            self.weekly = _fold(self.weekly, other.weekly, ["WeekStart"])
+        if other.sku_totals is not None:
+            self.sku_totals = _fold(self.sku_totals, other.sku_totals, ["SKU"])
+        if other.sku_store_window is not None:
+            self.last_order_date = (
+                other.last_order_date if self.last_order_date is None else max(self.last_order_date, other.last_order_date)
+            )
+            start = self.last_order_date - pd.Timedelta(days=WINDOW_DAYS - 1)
+            window = _fold(self.sku_store_window, other.sku_store_window, ["OrderDate", "SKU", "Store"])
+            self.sku_store_window = window[window["OrderDate"] >= start].reset_index(drop=True)
+
+        if other.daily_on_hand is not None:
+            self.daily_on_hand = _fold(self.daily_on_hand, other.daily_on_hand, ["SnapshotDate"])
+        if other.latest_snapshot is not None:
+            if self.latest_snapshot is None or other.latest_snapshot > self.latest_snapshot:
+                self.latest_snapshot = other.latest_snapshot
+                self.latest_on_hand = other.latest_on_hand
+            elif other.latest_snapshot == self.latest_snapshot:
+                self.latest_on_hand = _fold(self.latest_on_hand, other.latest_on_hand, ["SKU", "Store"])
+
+
+def load_state(path: Path, fmt: str) -> AggregateState:
+    # A missing, truncated, incompatible or out of date state gives an empty one, so every
+    # row is folded again
+    try:
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+    except Exception:
+        return AggregateState(fmt=fmt)
+    if isinstance(state, AggregateState) and getattr(state, "version", None) == STATE_VERSION and state.fmt == fmt:
+        return state
+    return AggregateState(fmt=fmt)
+
+
+def save_state(state: AggregateState, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    tmp.replace(path)
+
+
+def _digest(df: pd.DataFrame) -> int:
+    return int(pd.util.hash_pandas_object(df, index=False).to_numpy().sum(dtype=np.uint64))
+
+
+def _tail_crc(path: Path, end: int) -> int:
+    with open(path, "rb") as f:
+        f.seek(max(0, end - TAIL_BYTES))
+        return zlib.crc32(f.read(end - max(0, end - TAIL_BYTES)))
+
+
+def _csv_rows_after(path: Path, name: str, offset: int) -> pd.DataFrame:
+    # The rows in the bytes after offset, which falls on a line end, parsed as read_partition would
+    columns = list(pd.read_csv(path, nrows=0).columns)
+    dates = [c for c in DATE_COLUMNS.get(name, []) if c in columns]
+    with open(path, "rb") as f:
+        f.seek(offset)
+        if not f.read(1):
+            return pd.read_csv(path, nrows=0, parse_dates=dates or False)
+        f.seek(offset)
+        return pd.read_csv(f, header=None, names=columns, parse_dates=dates or False)
+
+
+def _read_new(path: Path, name: str, fmt: str, rec: Optional[dict], size: int) -> Tuple[Optional[pd.DataFrame], dict]:
+    # (rows after those rec says were folded, the file's new record), or (None, {}) when the
+    # folded rows were rewritten. Only the last folded rows are compared: TAIL_BYTES of a csv
+    # file, TAIL_ROWS otherwise. csv files are read from the recorded byte offset and memmap
+    # columns are sliced from the recorded row (only date columns are widened whole), so an
+    # append does not re-read history; a changed parquet or feather file (one month of a
+    # partitioned table) is read whole.
+    n = rec["rows"] if rec is not None else 0
+    if fmt == "csv":
+        offset = rec["bytes"] if rec is not None else 0
+        if size < offset or (offset and _tail_crc(path, offset) != rec["tail"]):
+            return None, {}
+        if offset:
+            with open(path, "rb") as f:
+                f.seek(offset - 1)
+                if f.read(1) != b"\n":
+                    return None, {}
+        new = _csv_rows_after(path, name, offset) if offset else read_partition(path, name, fmt)
+        return new, {"rows": n + len(new), "bytes": size, "tail": _tail_crc(path, size)}
+
+    df = read_partition(path, name, fmt)
+    if n > len(df) or (n and _digest(df.iloc[max(0, n - TAIL_ROWS) : n]) != rec["tail"]):
+        return None, {}
+    return df.iloc[n:].reset_index(drop=True), {"rows": len(df), "tail": _digest(df.iloc[-TAIL_ROWS:])}
+
+
+def _scan_new_rows(state: AggregateState, data_dir: str, name: str) -> Tuple[Optional[pd.DataFrame], Dict[str, dict]]:
+    # Fact files are treated as append-only. Files whose size and mtime are unchanged are
+    # skipped without reading; changed files contribute only the rows after those already
+    # folded (see _read_new), and new files contribute all rows. Returns (None, {}) when
+    # previously folded rows were rewritten or a file disappeared, which needs a full rebuild.
+    stored = stored_table(data_dir, name, state.fmt)
+    paths = partition_files(data_dir, stored, state.fmt)
+    keys = {str(p) for p in paths}
+    if any(rec["table"] == name and key not in keys for key, rec in state.files.items()):
+        return None, {}
+
+    frames = []
+    records: Dict[str, dict] = {}
+    for path in paths:
+        st = path.stat()
+        key = str(path)
+        rec = state.files.get(key)
+        if rec is not None and rec["size"] == st.st_size and rec["mtime_ns"] == st.st_mtime_ns:
+            records[key] = rec
+            continue
+
+        new, read = _read_new(path, stored, state.fmt, rec, st.st_size)
+        if new is None:
+            return None, {}
+        frames.append(new)
+        records[key] = {"table": name, "size": st.st_size, "mtime_ns": st.st_mtime_ns, **read}
+
+    new = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=REQUIRED_COLUMNS[name])
+    return new, records
+
+
+@profiled()
+def update_state(data_dir: str, fmt: str = "csv", state_path: Optional[str] = None) -> Tuple[AggregateState, Dict[str, pd.DataFrame]]:
+    path = Path(state_path) if state_path else default_state_path(data_dir)
+    state = load_state(path, fmt)
+    dims = {name: read_table(data_dir, name, fmt) for name in DIM_TABLES}
+
+    new: Dict[str, Optional[pd.DataFrame]] = {}
+    files: Dict[str, dict] = {}
+    for name in FACT_TABLES:
+        new[name], recs = _scan_new_rows(state, data_dir, name)
+        if new[name] is None:
+            break
+        files.update(recs)
+
+    if any(new.get(name) is None for name in FACT_TABLES):
+        # History changed underneath the state: start over from the full tables
+        state = AggregateState(fmt=fmt)
+        files = {}
+        for name in FACT_TABLES:
+            new[name], recs = _scan_new_rows(state, data_dir, name)
+            files.update(recs)
+
+    vr = validate_tables(
+        dims["DimDate"], dims["DimSKU"], dims["DimStore"], dims["DimChannel"], new["FactSales"], new["FactInventorySnapshot"]
+    )
+    if not vr.ok:
+        raise ValueError("Validation failed:\n" + "\n".join(vr.errors))
+
+    # validate_tables only sees the new rows (unique among themselves), so OrderIDs repeating
+    # folded history show up as distinct Orders growing by less than the new rows. The state
+    # is not saved when they do.
+    orders = state.orders.count()
+    state.fold_sales(new["FactSales"])
+    repeated = orders + len(new["FactSales"]) - state.orders.count()
+    if repeated:
+        raise ValueError(f"Validation failed:\nFactSales has {repeated} appended OrderID values already folded.")
+    state.fold_inventory(new["FactInventorySnapshot"])
+    state.files = files
+    save_state(state, path)
+    return state, dims
+
+
+@profiled()
+def report_inputs(state: AggregateState, dim_sku: pd.DataFrame, dim_store: pd.DataFrame) -> Tuple[dict, float, int, dict, dict]:
+    # Same (kpis, avg_week, stockouts, exec_tables, inv_tables) as the full metrics path
+    if state.weekly is None or state.latest_on_hand is None:
+        raise ValueError("No fact rows have been folded into the aggregate state.")
+
+    kpis = kpis_from_totals(state.sales, state.orders.count(), state.units, state.gm, state.markdown)
+    avg_week = float(state.weekly["Units"].mean()) if len(state.weekly) else 0.0
+    stockouts = int((state.daily_on_hand["OnHandUnits"] == 0).sum())
+
+    exec_tables = {
+        "sales_by_week": sales_by_week_table(state.weekly),
+        "top_movers": top_movers_table(state.sku_totals.copy()),
+    }
+
+    sold = (
+        state.sku_store_window.groupby(["SKU", "Store"], as_index=False)["Units"]
+        .sum()
+        .rename(columns={"Units": "Units28d"})
+    )
+    inv_tables = inventory_tables_from_parts(sold, state.latest_on_hand, dim_sku, dim_store, state.latest_snapshot)
+    return kpis, avg_week, stockouts, exec_tables, inv_tables
@@ -0,0 +1,122 @@
+from __future__ import annotations
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.profiling import profiled
+from src.timeseries import DateIndex
+
+
+# FactInventorySnapshot can also be stored as FactInventoryChanges: one row per run of
+# days over which a SKU-store's on hand stayed the same, valid on [ValidFrom, ValidTo).
+# Rows still valid at the end of the data close on the day after the last snapshot.
+CHANGE_COLUMNS = ["SKU", "Store", "ValidFrom", "ValidTo", "OnHandUnits"]
+DAY = pd.Timedelta(days=1)
+
+
+def is_changes(inv: pd.DataFrame) -> bool:
+    return "ValidFrom" in inv.columns
+
+
+@profiled()
+def to_changes(snapshot: pd.DataFrame) -> pd.DataFrame:
+    # Collapses daily snapshot rows into change rows; each SKU-store needs a snapshot every day
+    sku, _ = pd.factorize(snapshot["SKU"], sort=True)
+    store, stores = pd.factorize(snapshot["Store"], sort=True)
+    cell = sku.astype(np.int64) * len(stores) + store
+    order = np.lexsort((snapshot["SnapshotDate"].to_numpy(), cell))
+    cell = cell[order]
+    on_hand = snapshot["OnHandUnits"].to_numpy()[order]
+
+    new_cell = np.r_[True, cell[1:] != cell[:-1]]
+    starts = np.flatnonzero(new_cell | np.r_[True, on_hand[1:] != on_hand[:-1]])
+    rows = snapshot.iloc[order[starts]]
+
+    # A run ends where the next one of the same cell starts, or the day after the last snapshot
+    valid_from = rows["SnapshotDate"].to_numpy()
+    valid_to = np.full(len(starts), (snapshot["SnapshotDate"].max() + DAY).to_datetime64(), dtype=valid_from.dtype)
+    same_cell = ~new_cell[starts[1:]]
+    valid_to[:-1][same_cell] = valid_from[1:][same_cell]
+    return pd.DataFrame(
+        {
+            "SKU": rows["SKU"].to_numpy(),
+            "Store": rows["Store"].to_numpy(),
+            "ValidFrom": valid_from,
+            "ValidTo": valid_to,
+            "OnHandUnits": on_hand[starts],
+        }
+    )
+
+
+@profiled()
+def to_snapshot(changes: pd.DataFrame) -> pd.DataFrame:
+    # Expands change rows back into one row per SKU-store per day
+    days = ((changes["ValidTo"] - changes["ValidFrom"]) // DAY).to_numpy().astype(np.int64)
+    rows = np.repeat(np.arange(len(changes)), days)
+    offset = np.arange(len(rows)) - np.repeat(np.cumsum(days) - days, days)
+    out = pd.DataFrame(
+        {
+            "SnapshotDate": changes["ValidFrom"].to_numpy()[rows] + offset * np.timedelta64(1, "D"),
+            "SKU": changes["SKU"].to_numpy()[rows],
+            "Store": changes["Store"].to_numpy()[rows],
+            "OnHandUnits": changes["OnHandUnits"].to_numpy()[rows],
+        }
+    )
+    return out.sort_values(["SnapshotDate", "SKU", "Store"], kind="stable").reset_index(drop=True)
+
+
+def daily_on_hand(inv: pd.DataFrame) -> pd.DataFrame:
+    # Total OnHandUnits per SnapshotDate, from either representation
+    if not is_changes(inv):
+        index = DateIndex.if_sorted(inv, "SnapshotDate")
+        if index is not None:
+            return index.daily_sum("OnHandUnits")
+        return inv.groupby("SnapshotDate", as_index=False, observed=True)["OnHandUnits"].sum()
+    if inv.empty:
+        return pd.DataFrame({"SnapshotDate": pd.Series(dtype="datetime64[ns]"), "OnHandUnits": pd.Series(dtype="int64")})
+
+    # Each row adds its units on ValidFrom and removes them on ValidTo; a running sum of
+    # those deltas gives the daily totals without expanding the rows
+    first = inv["ValidFrom"].min()
+    start = ((inv["ValidFrom"] - first) // DAY).to_numpy().astype(np.int64)
+    end = ((inv["ValidTo"] - first) // DAY).to_numpy().astype(np.int64)
+    n = int(end.max())
+    units = inv["OnHandUnits"].to_numpy().astype(np.float64)
+
+    delta = np.bincount(start, weights=units, minlength=n + 1) - np.bincount(end, weights=units, minlength=n + 1)
+    totals = np.rint(np.cumsum(delta)[:n]).astype(np.int64)  # exact while totals stay below 2**53
+    rows = np.cumsum(np.bincount(start, minlength=n + 1) - np.bincount(end, minlength=n + 1))[:n]
+
+    # Only days some row is valid on are snapshot days, as in the daily table
+    days = np.flatnonzero(rows > 0)
+    return pd.DataFrame({"SnapshotDate": first + pd.to_timedelta(days, unit="D"), "OnHandUnits": totals[days]})
+
+
+def on_hand_as_of(inv: pd.DataFrame, date: pd.Timestamp) -> pd.DataFrame:
+    # SKU, Store, OnHandUnits on date, from either representation
+    if is_changes(inv):
+        rows = inv[(inv["ValidFrom"] <= date) & (inv["ValidTo"] > date)]
+    else:
+        index = DateIndex.if_sorted(inv, "SnapshotDate")
+        rows = index.on(date) if index is not None else inv[inv["SnapshotDate"] == date]
+    return rows.groupby(["SKU", "Store"], as_index=False, observed=True)["OnHandUnits"].sum()
+
+
+def latest_snapshot_date(inv: pd.DataFrame) -> pd.Timestamp:
+    if is_changes(inv):
+        return inv["ValidTo"].max() - DAY
+    return inv["SnapshotDate"].max()
+
+
+def latest_on_hand(inv: pd.DataFrame) -> Tuple[pd.Timestamp, pd.DataFrame]:
+    latest = latest_snapshot_date(inv)
+    if is_changes(inv):
+        # Rows still open at the end are exactly the ones valid on the latest day
+        rows = inv[inv["ValidTo"] == latest + DAY]
+        return latest, rows.groupby(["SKU", "Store"], as_index=False, observed=True)["OnHandUnits"].sum()
+    index = DateIndex.if_sorted(inv, "SnapshotDate")
+    if index is not None:
+        # Date-ordered snapshots: the latest day is the last slice of rows, no scan needed
+        return latest, index.latest().groupby(["SKU", "Store"], as_index=False, observed=True)["OnHandUnits"].sum()
+    return latest, on_hand_as_of(inv, latest)
@@ -1,14 +1,7 @@
 import argparse
 from pathlib import Path
 
-from src.metrics import (
-    load_superstore,
-    daily_revenue,
-    revenue_by_segment,
-    revenue_by_category,
-    revenue_by_region,
-    kpi_summary,
-)
+from src.superstore import load_superstore, superstore_tables
 from src.reporting import build_markdown_report, save_report
 
 
@@ -36,14 +29,11 @@ def main() -> None:
 
     df = load_superstore(args.input)
 
-    daily = daily_revenue(df)
-    by_segment = revenue_by_segment(df)
-    by_category = revenue_by_category(df)
-    by_region = revenue_by_region(df)
-    kpis = kpi_summary(df)
+    # One grouped pass feeds the KPIs and every revenue breakdown
+    t = superstore_tables(df)
 
     report_text = build_markdown_report(
-        kpis, daily, by_segment, by_category, by_region
+        t["kpis"], t["daily"], t["by_segment"], t["by_category"], t["by_region"]
     )
     save_report(report_text, args.output)
 
@@ -1,39 +1,115 @@
 from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
 import pandas as pd
+from numpy.typing import ArrayLike
+
+from src.compact import KEY_DTYPES, compact_tables
+from src.inventory import daily_on_hand, latest_on_hand
+from src.profiling import profiled, record, set_rows, stage, timed
+from src.storage import TABLES, read_table
+from src.timeseries import WINDOWS, trailing_sums
+from src.topn import HeavyHitters, top_n
+
+
+def load_tables(
+    data_dir: str,
+    fmt: str = "csv",
+    columns: Optional[Dict[str, List[str]]] = None,
+    compact: bool = False,
+    names: Sequence[str] = TABLES,
+    workers: int = 1,
+    on_table: Optional[Callable[[str, pd.DataFrame], None]] = None,
+) -> dict:
+    # columns optionally prunes each table to the listed columns, e.g. {"FactInventorySnapshot": ["SnapshotDate", "OnHandUnits"]}
+    # compact dictionary encodes keys against the Dim tables and downcasts integer measures
+    # names restricts the load to a subset of the tables (the Dim tables are needed for compact)
+    # workers > 1 reads up to that many tables at once on threads, so I/O latency overlaps;
+    # on_table(name, df) runs on the calling thread as each table arrives, before compact
+    columns = columns or {}
+    # compact csv reads parse keys straight into categoricals instead of a string column per key
+    dtype = KEY_DTYPES if compact else None
+    tables = {}
+    if workers > 1 and len(names) > 1:
+        def read(name: str) -> tuple:
+            with timed() as t:
+                df = read_table(data_dir, name, fmt, columns.get(name), dtype)
+            return name, df, t
+
+        # Facts first: they are the long reads
+        order = sorted(names, key=lambda n: not n.startswith("Fact"))
+        with ThreadPoolExecutor(max_workers=min(workers, len(names))) as pool:
+            futures = [pool.submit(read, n) for n in order]
+            try:
+                for f in as_completed(futures):
+                    name, df, t = f.result()
+                    record(f"load:{name}", t, len(df))
+                    tables[name] = df
+                    if on_table is not None:
+                        on_table(name, df)
+            except BaseException:
+                for f in futures:
+                    f.cancel()
+                raise
+        tables = {name: tables[name] for name in names}
+    else:
+        for name in names:
+            with stage(f"load:{name}") as st:
+                tables[name] = read_table(data_dir, name, fmt, columns.get(name), dtype)
+                set_rows(st, len(tables[name]))
+            if on_table is not None:
+                on_table(name, tables[name])
+    if compact:
+        with stage("compact", sum(len(df) for df in tables.values())):
+            tables = compact_tables(tables)
+    return tables
+
+
+def week_start(dates: pd.Series) -> pd.Series:
+    return (dates - pd.to_timedelta(dates.dt.weekday, unit="D")).dt.normalize()
 
 
-def load_tables(data_dir: str) -> dict:
-    dim_date = pd.read_csv(f"{data_dir}/DimDate.csv", parse_dates=["Date", "WeekStart"])
-    dim_sku = pd.read_csv(f"{data_dir}/DimSKU.csv")
-    dim_store = pd.read_csv(f"{data_dir}/DimStore.csv")
-    dim_channel = pd.read_csv(f"{data_dir}/DimChannel.csv")
+def add_week_start(df: pd.DataFrame, date_col: str) -> pd.DataFrame:
+    out = df.copy()
+    out["WeekStart"] = week_start(out[date_col])
+    return out
 
-    fact_sales = pd.read_csv(f"{data_dir}/FactSales.csv", parse_dates=["OrderDate"])
-    fact_inv = pd.read_csv(f"{data_dir}/FactInventorySnapshot.csv", parse_dates=["SnapshotDate"])
 
-    return {
-        "DimDate": dim_date,
-        "DimSKU": dim_sku,
-        "DimStore": dim_store,
-        "DimChannel": dim_channel,
-        "FactSales": fact_sales,
-        "FactInventorySnapshot": fact_inv,
-    }
+# Attribute -> the fact column it is a function of
+ATTRIBUTES = {"WeekStart": "OrderDate", "Category": "SKU", "Brand": "SKU", "Region": "Store"}
 
+# Measures top movers can be ranked by (GM $ is GrossMarginAmt, Markdown $ is DiscountAmt)
+MOVER_MEASURES = ["Sales", "Units", "GrossMarginAmt", "DiscountAmt"]
 
-def add_week_start(df: pd.DataFrame, date_col: str) -> pd.DataFrame:
-    out = df.copy()
-    out["WeekStart"] = (out[date_col] - pd.to_timedelta(out[date_col].dt.weekday, unit="D")).dt.normalize()
-    return out
 
+def attribute_lookups(dim_sku: Optional[pd.DataFrame], dim_store: Optional[pd.DataFrame]) -> Dict[str, pd.Series]:
+    lookups = {}
+    if dim_sku is not None:
+        sku = dim_sku.set_index(dim_sku["SKU"].astype(str))
+        lookups.update(Category=sku["Category"], Brand=sku["Brand"])
+    if dim_store is not None:
+        lookups["Region"] = dim_store.set_index(dim_store["Store"].astype(str))["Region"]
+    return lookups
+
+
+def derive_attribute(key: str, source: pd.Series, lookups: Dict[str, pd.Series]) -> pd.Series:
+    # Derives the attribute once per distinct source value and broadcasts it back by code
+    codes, uniques = pd.factorize(source)
+    if key == "WeekStart":
+        weeks = week_start(pd.Series(uniques)).to_numpy()
+        return pd.Series(weeks[codes], index=source.index, name=key)
+    if key not in lookups:
+        raise ValueError(f"{key} needs {'DimStore' if key == 'Region' else 'DimSKU'}")
+    attr = pd.Categorical(lookups[key].reindex(pd.Index(uniques).astype(str)).to_numpy())
+    return pd.Series(pd.Categorical.from_codes(attr.codes[codes], attr.categories), index=source.index, name=key)
 
-def kpi_summary(fact_sales: pd.DataFrame) -> dict:
-    sales = float(fact_sales["Sales"].sum())
-    orders = int(fact_sales["OrderID"].nunique())
-    units = int(fact_sales["Units"].sum())
-    gm = float(fact_sales["GrossMarginAmt"].sum())
-    markdown = float(fact_sales["DiscountAmt"].sum())
 
+def key_columns(fact_sales: pd.DataFrame, keys: Sequence[str], lookups: Dict[str, pd.Series]) -> List[pd.Series]:
+    return [fact_sales[k] if k in fact_sales.columns else derive_attribute(k, fact_sales[ATTRIBUTES[k]], lookups) for k in keys]
+
+
+def kpis_from_totals(sales: float, orders: int, units: int, gm: float, markdown: float) -> dict:
     gm_pct = (gm / sales) if sales > 0 else 0.0
     markdown_rate = (markdown / (sales + markdown)) if (sales + markdown) > 0 else 0.0
     aov = (sales / orders) if orders > 0 else 0.0
@@ -50,55 +126,129 @@ def kpi_summary(fact_sales: pd.DataFrame) -> dict:
     }
 
 
+@profiled()
+def kpi_summary(fact_sales: pd.DataFrame) -> dict:
+    sales = float(fact_sales["Sales"].sum())
+    orders = int(fact_sales["OrderID"].nunique())
+    units = int(fact_sales["Units"].sum())
+    gm = float(fact_sales["GrossMarginAmt"].sum())
+    markdown = float(fact_sales["DiscountAmt"].sum())
+    return kpis_from_totals(sales, orders, units, gm, markdown)
+
+
+def sell_through_pct_array(units_sold: ArrayLike, on_hand: ArrayLike) -> np.ndarray:
+    units_sold = np.asarray(units_sold, dtype=float)
+    denom = units_sold + np.asarray(on_hand, dtype=float)
+    out = np.zeros(denom.shape)
+    np.divide(units_sold, denom, out=out, where=denom > 0)
+    return out
+
+
 def sell_through_pct(units_sold: float, on_hand: float) -> float:
-    denom = units_sold + on_hand
-    return (units_sold / denom) if denom > 0 else 0.0
+    return float(sell_through_pct_array(units_sold, on_hand))
 
 
+@profiled()
 def avg_weekly_units(fact_sales: pd.DataFrame) -> float:
     fs = add_week_start(fact_sales, "OrderDate")
-    weekly = fs.groupby("WeekStart", as_index=False)["Units"].sum()
+    weekly = fs.groupby("WeekStart", as_index=False, observed=True)["Units"].sum()
     return float(weekly["Units"].mean()) if len(weekly) else 0.0
 
 
+def weeks_of_supply_array(on_hand: ArrayLike, avg_week_units: ArrayLike) -> np.ndarray:
+    on_hand = np.asarray(on_hand, dtype=float)
+    avg_week_units = np.asarray(avg_week_units, dtype=float)
+    out = np.zeros(np.broadcast(on_hand, avg_week_units).shape)
+    np.divide(on_hand, avg_week_units, out=out, where=avg_week_units > 0)
+    return out
+
+
 def weeks_of_supply(on_hand: float, avg_week_units: float) -> float:
-    return (on_hand / avg_week_units) if avg_week_units > 0 else 0.0
+    return float(weeks_of_supply_array(on_hand, avg_week_units))
 
 
+@profiled()
 def stockout_days(fact_inv: pd.DataFrame) -> int:
-    daily = fact_inv.groupby("SnapshotDate", as_index=False)["OnHandUnits"].sum()
+    # fact_inv is daily snapshot rows or change rows (see src.inventory)
+    daily = daily_on_hand(fact_inv)
     return int((daily["OnHandUnits"] == 0).sum())
 
 
+@profiled()
+def top_movers_table(sku_totals: pd.DataFrame, n: int = 10, by: str = "Sales", per: Sequence[str] = ()) -> pd.DataFrame:
+    # sku_totals: one row per SKU (in SKU order), or per group and member, with MOVER_MEASURES.
+    # Partial selection: ties keep row order, as a stable descending sort would.
+    top_movers = top_n(sku_totals, n, by, per)
+    for c in ["Sales", "GrossMarginAmt", "DiscountAmt"]:
+        top_movers[c] = top_movers[c].round(2)
+    return top_movers
+
+
+def sales_by_week_table(weekly: pd.DataFrame) -> pd.DataFrame:
+    # weekly: Sales per WeekStart. Rounded so every report path renders the same, whatever
+    # order it summed the rows in.
+    out = weekly[["WeekStart", "Sales"]].sort_values("WeekStart").reset_index(drop=True)
+    return out.assign(Sales=out["Sales"].round(2))
+
+
+@profiled()
+def top_movers(
+    fact_sales: pd.DataFrame,
+    n: int = 10,
+    by: str = "Sales",
+    level: str = "SKU",
+    per: Sequence[str] = (),
+    dim_sku: Optional[pd.DataFrame] = None,
+    dim_store: Optional[pd.DataFrame] = None,
+) -> pd.DataFrame:
+    # The n largest members of level (SKU, Brand, Category, Store, Region) by one of
+    # MOVER_MEASURES, overall or within each group of per, e.g. per=["Store", "WeekStart"].
+    # Brand and Category need dim_sku, Region needs dim_store.
+    keys = [*per, level]
+    by_keys = key_columns(fact_sales, keys, attribute_lookups(dim_sku, dim_store))
+    totals = fact_sales.groupby(by_keys, observed=True)[MOVER_MEASURES].sum().reset_index()
+    return top_movers_table(totals, n, by, per)
+
+
+def streaming_top_movers(
+    chunks: Iterable[pd.DataFrame],
+    n: int = 10,
+    by: str = "Sales",
+    level: str = "SKU",
+    per: Sequence[str] = (),
+    dim_sku: Optional[pd.DataFrame] = None,
+    dim_store: Optional[pd.DataFrame] = None,
+    capacity: int = 100_000,
+) -> Tuple[pd.DataFrame, float]:
+    # top_movers over FactSales chunks in bounded memory: (top, error), where each by in top
+    # is at most error below the true total. error is 0, and top exact, while the stream
+    # has no more than capacity distinct keys.
+    keys = [*per, level]
+    lookups = attribute_lookups(dim_sku, dim_store)
+    hitters = HeavyHitters(keys, by, capacity)
+    for chunk in chunks:
+        hitters.update(pd.concat([*key_columns(chunk, keys, lookups), chunk[by]], axis=1))
+    return hitters.top(n, per), hitters.error
+
+
+@profiled()
 def exec_page_tables(fact_sales: pd.DataFrame) -> dict:
     fs = add_week_start(fact_sales, "OrderDate")
-    sales_by_week = fs.groupby("WeekStart", as_index=False)["Sales"].sum().sort_values("WeekStart")
+    sales_by_week = sales_by_week_table(fs.groupby("WeekStart", as_index=False, observed=True)["Sales"].sum())
 
-    top_movers = (
-        fact_sales.groupby("SKU", as_index=False)
-        .agg({"Sales": "sum", "Units": "sum", "GrossMarginAmt": "sum", "DiscountAmt": "sum"})
-        .sort_values("Sales", ascending=False)
-        .head(10)
+    sku_totals = fact_sales.groupby("SKU", as_index=False, observed=True).agg(
+        {"Sales": "sum", "Units": "sum", "GrossMarginAmt": "sum", "DiscountAmt": "sum"}
     )
-    for c in ["Sales", "GrossMarginAmt", "DiscountAmt"]:
-        top_movers[c] = top_movers[c].round(2)
+    top_movers = top_movers_table(sku_totals)
 
     return {"sales_by_week": sales_by_week, "top_movers": top_movers}
 
 
-def inventory_page_tables(fact_sales: pd.DataFrame, fact_inv: pd.DataFrame, dim_sku: pd.DataFrame, dim_store: pd.DataFrame) -> dict:
-    # Current on hand (latest snapshot)
-    latest = fact_inv["SnapshotDate"].max()
-    inv_latest = fact_inv[fact_inv["SnapshotDate"] == latest].copy()
-
-    # Units sold in last 28 days
-    last_date = fact_sales["OrderDate"].max()
-    start = last_date - pd.Timedelta(days=27)
-    fs_28 = fact_sales[(fact_sales["OrderDate"] >= start) & (fact_sales["OrderDate"] <= last_date)].copy()
-
-    sold = fs_28.groupby(["SKU", "Store"], as_index=False)["Units"].sum().rename(columns={"Units": "Units28d"})
-    inv = inv_latest.groupby(["SKU", "Store"], as_index=False)["OnHandUnits"].sum()
-
+@profiled()
+def inventory_tables_from_parts(
+    sold: pd.DataFrame, inv: pd.DataFrame, dim_sku: pd.DataFrame, dim_store: pd.DataFrame, latest: pd.Timestamp
+) -> dict:
+    # sold: SKU, Store, Units28d; inv: SKU, Store, OnHandUnits at the latest snapshot
     merged = inv.merge(sold, on=["SKU", "Store"], how="left").fillna({"Units28d": 0})
     merged = merged.merge(dim_sku[["SKU", "Category", "Brand"]], on="SKU", how="left")
     merged = merged.merge(dim_store[["Store", "Region"]], on="Store", how="left")
@@ -106,17 +256,17 @@ def inventory_page_tables(fact_sales: pd.DataFrame, fact_inv: pd.DataFrame, dim_
     # Avg weekly units proxy from last 28 days
     merged["AvgWeeklyUnits"] = merged["Units28d"] / 4.0
 
-    merged["SellThrough%"] = merged.apply(lambda r: sell_through_pct(r["Units28d"], r["OnHandUnits"]), axis=1)
-    merged["WOS"] = merged.apply(lambda r: weeks_of_supply(r["OnHandUnits"], r["AvgWeeklyUnits"]), axis=1)
+    merged["SellThrough%"] = sell_through_pct_array(merged["Units28d"], merged["OnHandUnits"])
+    merged["WOS"] = weeks_of_supply_array(merged["OnHandUnits"], merged["AvgWeeklyUnits"])
 
     # Aggregate to Category and Store views
     by_category = (
-        merged.groupby(["Category"], as_index=False)
+        merged.groupby(["Category"], as_index=False, observed=True)
         .agg({"OnHandUnits": "sum", "Units28d": "sum", "SellThrough%": "mean", "WOS": "mean"})
         .sort_values("Units28d", ascending=False)
     )
     by_store = (
-        merged.groupby(["Store", "Region"], as_index=False)
+        merged.groupby(["Store", "Region"], as_index=False, observed=True)
         .agg({"OnHandUnits": "sum", "Units28d": "sum", "SellThrough%": "mean", "WOS": "mean"})
         .sort_values("Units28d", ascending=False)
         .head(15)
@@ -128,3 +278,19 @@ def inventory_page_tables(fact_sales: pd.DataFrame, fact_inv: pd.DataFrame, dim_
     by_store["WOS"] = by_store["WOS"].round(2)
 
     return {"by_category": by_category, "by_store": by_store, "latest_snapshot": latest}
+
+
+@profiled()
+def inventory_page_tables(fact_sales: pd.DataFrame, fact_inv: pd.DataFrame, dim_sku: pd.DataFrame, dim_store: pd.DataFrame) -> dict:
+    # Current on hand (latest snapshot), from daily snapshot rows or change rows
+    latest, inv = latest_on_hand(fact_inv)
+
+    # Units sold in last 28 days
+    sold = trailing_units(fact_sales, (28,))
+
+    return inventory_tables_from_parts(sold, inv, dim_sku, dim_store, latest)
+
+
+def trailing_units(fact_sales: pd.DataFrame, windows: Sequence[int] = WINDOWS) -> pd.DataFrame:
+    # SKU, Store and Units{w}d for each trailing window ending on the last OrderDate, in one pass
+    return trailing_sums(fact_sales, "OrderDate", ["SKU", "Store"], "Units", windows)
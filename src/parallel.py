@@ -0,0 +1,164 @@
+from __future__ import annotations
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.compact import encode_keys
+from src.incremental import AggregateState, report_inputs
+from src.inventory import CHANGE_COLUMNS, is_changes
+from src.profiling import profiled
+
+
+SALES_COLUMNS = ["OrderDate", "OrderID", "SKU", "Store", "Units", "Sales", "GrossMarginAmt", "DiscountAmt"]
+INV_COLUMNS = ["SnapshotDate", "SKU", "Store", "OnHandUnits"]
+
+# Only ever counted distinct, so workers get bare codes without the dictionary
+CODES_ONLY = ("OrderID",)
+
+
+@dataclass
+class SharedColumn:
+    # A fact column published to shared memory. String and categorical columns are
+    # shared as integer codes; their (small) dictionary travels with the spec.
+    name: str
+    shm_name: str
+    dtype: str
+    length: int
+    categories: Optional[list] = None
+
+
+def _share_column(s: pd.Series, handles: List[shared_memory.SharedMemory], codes_only: bool = False) -> SharedColumn:
+    categories = None
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        values = s.cat.codes.to_numpy()
+        categories = None if codes_only else s.cat.categories.tolist()
+    elif s.dtype.kind in "iufMb":
+        values = s.to_numpy()
+    else:
+        values, uniques = pd.factorize(s)
+        categories = None if codes_only else uniques.tolist()
+
+    shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+    handles.append(shm)
+    np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf)[:] = values
+    return SharedColumn(s.name, shm.name, values.dtype.str, len(values), categories)
+
+
+def share_frame(
+    df: pd.DataFrame,
+    columns: List[str],
+    handles: List[shared_memory.SharedMemory],
+    overrides: Optional[Dict[str, pd.Series]] = None,
+) -> List[SharedColumn]:
+    overrides = overrides or {}
+    return [_share_column(overrides.get(c, df[c]), handles, c in CODES_ONLY) for c in columns]
+
+
+def _attach(specs: List[SharedColumn], handles: list) -> Dict[str, np.ndarray]:
+    out = {}
+    for spec in specs:
+        shm = shared_memory.SharedMemory(name=spec.shm_name)
+        handles.append(shm)
+        out[spec.name] = np.ndarray((spec.length,), dtype=np.dtype(spec.dtype), buffer=shm.buf)
+    return out
+
+
+def _frame(specs: List[SharedColumn], arrays: Dict[str, np.ndarray], rows: np.ndarray) -> pd.DataFrame:
+    data = {}
+    for spec in specs:
+        values = arrays[spec.name][rows]
+        if spec.categories is not None:
+            values = pd.Categorical.from_codes(values, categories=spec.categories)
+        data[spec.name] = values
+    return pd.DataFrame(data)
+
+
+def _partition_rows(arrays: Dict[str, np.ndarray], date_col: str, part: int, n_parts: int, by: str, bounds: np.ndarray) -> np.ndarray:
+    if by == "store":
+        return np.flatnonzero(arrays["Store"] % n_parts == part)
+    dates = arrays[date_col]
+    return np.flatnonzero((dates >= bounds[part]) & (dates < bounds[part + 1]))
+
+
+def _date_bounds(dates: np.ndarray, n_parts: int) -> np.ndarray:
+    if not len(dates):
+        return np.zeros(n_parts + 1, dtype=dates.dtype)
+    lo, hi = dates.min(), dates.max()
+    step = (hi - lo) // n_parts + 1
+    return np.array([lo + step * k for k in range(n_parts + 1)], dtype=dates.dtype)
+
+
+def _partial_state(task: tuple) -> AggregateState:
+    sales_specs, inv_specs, inv_date, part, n_parts, by, sales_bounds, inv_bounds = task
+    handles: list = []
+    try:
+        state = AggregateState()
+        sales = _attach(sales_specs, handles)
+        rows = _partition_rows(sales, "OrderDate", part, n_parts, by, sales_bounds)
+        state.fold_sales(_frame(sales_specs, sales, rows))
+
+        inv = _attach(inv_specs, handles)
+        rows = _partition_rows(inv, inv_date, part, n_parts, by, inv_bounds)
+        state.fold_inventory(_frame(inv_specs, inv, rows))
+        return state
+    finally:
+        for h in handles:
+            h.close()
+
+
+@profiled()
+def parallel_report_tables(
+    fact_sales: pd.DataFrame,
+    fact_inv: pd.DataFrame,
+    dim_sku: pd.DataFrame,
+    dim_store: pd.DataFrame,
+    workers: Optional[int] = None,
+    partition_by: str = "store",
+) -> Tuple[dict, float, int, dict, dict]:
+    # Parallel equivalent of kpi_summary, avg_weekly_units, stockout_days, exec_page_tables
+    # and inventory_page_tables. The needed fact columns are published once to shared
+    # memory; each worker aggregates the rows of one store-hash or date-range partition
+    # into an AggregateState, and the partials are merged here.
+    if partition_by not in ("store", "date"):
+        raise ValueError(f"Unknown partitioning {partition_by!r}, expected 'store' or 'date'")
+    workers = workers or os.cpu_count() or 1
+
+    # Both facts share one Store dictionary so a store hashes to the same partition in each
+    stores = pd.Index(dim_store["Store"].astype(str))
+    for s in (fact_sales["Store"], fact_inv["Store"]):
+        stores = stores.union(pd.Index(pd.unique(s)).astype(str))
+    store_codes = {
+        name: encode_keys(df["Store"], stores)
+        for name, df in (("FactSales", fact_sales), ("FactInventorySnapshot", fact_inv))
+    }
+
+    # Change rows fold like snapshot rows under any split of the rows, so they are
+    # partitioned on ValidFrom in place of SnapshotDate
+    inv_columns, inv_date = (CHANGE_COLUMNS, "ValidFrom") if is_changes(fact_inv) else (INV_COLUMNS, "SnapshotDate")
+
+    handles: List[shared_memory.SharedMemory] = []
+    try:
+        sales_specs = share_frame(fact_sales, SALES_COLUMNS, handles, {"Store": store_codes["FactSales"]})
+        inv_specs = share_frame(fact_inv, inv_columns, handles, {"Store": store_codes["FactInventorySnapshot"]})
+        sales_bounds = _date_bounds(fact_sales["OrderDate"].to_numpy(), workers)
+        inv_bounds = _date_bounds(fact_inv[inv_date].to_numpy(), workers)
+
+        tasks = [
+            (sales_specs, inv_specs, inv_date, k, workers, partition_by, sales_bounds, inv_bounds) for k in range(workers)
+        ]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            partials = list(pool.map(_partial_state, tasks))
+    finally:
+        for h in handles:
+            h.close()
+            h.unlink()
+
+    state = partials[0]
+    for p in partials[1:]:
+        state.merge(p)
+    return report_inputs(state, dim_sku, dim_store)
@@ -0,0 +1,170 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from src.inventory import daily_on_hand, is_changes, latest_on_hand
+from src.metrics import inventory_tables_from_parts, kpis_from_totals, sales_by_week_table, top_movers_table, week_start
+from src.profiling import profiled
+from src.timeseries import DateIndex
+
+
+# Columns computed once per table on demand, shared by every aggregate that groups on them
+DERIVED: Dict[str, Callable[[pd.DataFrame], pd.Series]] = {
+    "WeekStart": lambda df: week_start(df["OrderDate"]),
+}
+
+
+def _trailing_28d(df: pd.DataFrame) -> pd.Series:
+    last_date = df["OrderDate"].max()
+    return (df["OrderDate"] >= last_date - pd.Timedelta(days=27)) & (df["OrderDate"] <= last_date)
+
+
+def _latest_snapshot(df: pd.DataFrame) -> pd.Series:
+    return df["SnapshotDate"] == df["SnapshotDate"].max()
+
+
+# Named row filters, also computed once per table
+FILTERS: Dict[str, Callable[[pd.DataFrame], pd.Series]] = {
+    "trailing_28d": _trailing_28d,
+    "latest_snapshot": _latest_snapshot,
+}
+
+
+@dataclass(frozen=True)
+class Aggregate:
+    table: str
+    keys: Tuple[str, ...]
+    values: Tuple[str, ...]
+    agg: str = "sum"
+    where: Optional[str] = None
+
+
+class QueryPlan:
+    # Collects the aggregates a report needs, then runs one groupby per distinct
+    # (table, keys, filter, agg) with the union of the requested value columns.
+    def __init__(self) -> None:
+        self.aggregates: List[Aggregate] = []
+
+    def add(self, table: str, keys: List[str], values: List[str], agg: str = "sum", where: Optional[str] = None) -> Aggregate:
+        a = Aggregate(table, tuple(keys), tuple(values), agg, where)
+        self.aggregates.append(a)
+        return a
+
+    def groups(self) -> Dict[tuple, List[str]]:
+        fused: Dict[tuple, List[str]] = {}
+        for a in self.aggregates:
+            cols = fused.setdefault((a.table, a.keys, a.where, a.agg), [])
+            cols += [v for v in a.values if v not in cols]
+        return fused
+
+    def execute(self, tables: Dict[str, pd.DataFrame]) -> Dict[Aggregate, pd.DataFrame]:
+        derived: Dict[Tuple[str, str], pd.Series] = {}
+        masks: Dict[Tuple[str, str], pd.Series] = {}
+
+        def column(table: str, name: str) -> pd.Series:
+            df = tables[table]
+            if name in df.columns:
+                return df[name]
+            if (table, name) not in derived:
+                derived[(table, name)] = DERIVED[name](df).rename(name)
+            return derived[(table, name)]
+
+        results: Dict[tuple, pd.DataFrame] = {}
+        for (table, keys, where, agg), cols in self.groups().items():
+            df = tables[table]
+            mask = None
+            if where is not None:
+                if (table, where) not in masks:
+                    masks[(table, where)] = FILTERS[where](df)
+                mask = masks[(table, where)]
+
+            if not keys:
+                src = df[cols] if mask is None else df.loc[mask, cols]
+                results[(table, keys, where, agg)] = src.agg(agg).to_frame().T
+                continue
+
+            # Group on the (derived) key Series directly so the fact frame is never copied;
+            # filtered aggregates only materialize the selected rows of the needed columns
+            by = [column(table, k) for k in keys]
+            if mask is None:
+                grouped = df.groupby(by, observed=True)[cols]
+            else:
+                grouped = df.loc[mask, cols].groupby([b[mask] for b in by], observed=True)
+            out = grouped.agg(agg).reset_index()
+            results[(table, keys, where, agg)] = out
+
+        return {
+            a: results[(a.table, a.keys, a.where, a.agg)][list(a.keys) + list(a.values)] for a in self.aggregates
+        }
+
+
+@profiled()
+def sales_tables(fact_sales: pd.DataFrame) -> Tuple[dict, float, dict, pd.DataFrame]:
+    # Everything the report needs from FactSales alone: (kpis, avg_week, exec_tables, sold),
+    # where sold is trailing 28 day Units28d by SKU and Store for the inventory tables
+    plan = QueryPlan()
+    totals = plan.add("FactSales", [], ["Sales", "Units", "GrossMarginAmt", "DiscountAmt"])
+    orders = plan.add("FactSales", [], ["OrderID"], agg="nunique")
+    weekly_sales = plan.add("FactSales", ["WeekStart"], ["Sales"])
+    weekly_units = plan.add("FactSales", ["WeekStart"], ["Units"])
+    sku_totals = plan.add("FactSales", ["SKU"], ["Sales", "Units", "GrossMarginAmt", "DiscountAmt"])
+    sold_28d = plan.add("FactSales", ["SKU", "Store"], ["Units"], where="trailing_28d")
+
+    r = plan.execute({"FactSales": fact_sales})
+
+    t = r[totals].iloc[0]
+    kpis = kpis_from_totals(
+        float(t["Sales"]), int(r[orders].iloc[0]["OrderID"]), int(t["Units"]), float(t["GrossMarginAmt"]), float(t["DiscountAmt"])
+    )
+    weekly = r[weekly_units]
+    avg_week = float(weekly["Units"].mean()) if len(weekly) else 0.0
+
+    exec_tables = {
+        "sales_by_week": sales_by_week_table(r[weekly_sales]),
+        "top_movers": top_movers_table(r[sku_totals]),
+    }
+    sold = r[sold_28d].rename(columns={"Units": "Units28d"})
+    return kpis, avg_week, exec_tables, sold
+
+
+@profiled()
+def inventory_tables(
+    sold: pd.DataFrame, fact_inv: pd.DataFrame, dim_sku: pd.DataFrame, dim_store: pd.DataFrame
+) -> Tuple[int, dict]:
+    # (stockouts, inv_tables) from FactInventorySnapshot and the sold part of sales_tables
+    if is_changes(fact_inv):
+        # Change rows answer both directly, without expanding to daily rows
+        latest, on_hand = latest_on_hand(fact_inv)
+        stockouts = int((daily_on_hand(fact_inv)["OnHandUnits"] == 0).sum())
+        return stockouts, inventory_tables_from_parts(sold, on_hand, dim_sku, dim_store, latest)
+
+    index = DateIndex.if_sorted(fact_inv, "SnapshotDate")
+    if index is not None:
+        # Snapshots in date order (as generated and partitioned): daily totals come from the
+        # date offsets and the latest snapshot is the last slice, so neither needs a scan
+        stockouts = int((index.daily_sum("OnHandUnits")["OnHandUnits"] == 0).sum())
+        on_hand = index.latest().groupby(["SKU", "Store"], as_index=False, observed=True)["OnHandUnits"].sum()
+        return stockouts, inventory_tables_from_parts(sold, on_hand, dim_sku, dim_store, index.last)
+
+    plan = QueryPlan()
+    daily = plan.add("FactInventorySnapshot", ["SnapshotDate"], ["OnHandUnits"])
+    latest_cells = plan.add("FactInventorySnapshot", ["SKU", "Store"], ["OnHandUnits"], where="latest_snapshot")
+
+    r = plan.execute({"FactInventorySnapshot": fact_inv})
+
+    stockouts = int((r[daily]["OnHandUnits"] == 0).sum())
+    latest = fact_inv["SnapshotDate"].max()
+    inv_tables = inventory_tables_from_parts(sold, r[latest_cells], dim_sku, dim_store, latest)
+    return stockouts, inv_tables
+
+
+def report_tables(
+    fact_sales: pd.DataFrame, fact_inv: pd.DataFrame, dim_sku: pd.DataFrame, dim_store: pd.DataFrame
+) -> Tuple[dict, float, int, dict, dict]:
+    # Fused equivalent of kpi_summary, avg_weekly_units, stockout_days,
+    # exec_page_tables and inventory_page_tables
+    kpis, avg_week, exec_tables, sold = sales_tables(fact_sales)
+    stockouts, inv_tables = inventory_tables(sold, fact_inv, dim_sku, dim_store)
+    return kpis, avg_week, stockouts, exec_tables, inv_tables
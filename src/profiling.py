@@ -0,0 +1,200 @@
+from __future__ import annotations
+import functools
+import json
+import os
+import platform
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+MB = 2**20
+
+
+def _peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / MB if sys.platform == "darwin" else peak / 1024
+
+
+def _rss_mb() -> Optional[float]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / MB
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+@dataclass
+class Stage:
+    name: str
+    depth: int
+    start_s: float
+    wall_s: float = 0.0
+    cpu_s: float = 0.0
+    rows: Optional[int] = None
+    rss_mb: Optional[float] = None
+    peak_rss_mb: Optional[float] = None
+    traced_peak_mb: Optional[float] = None  # only with trace_memory
+    thread: int = 0  # 0 for the main thread, else the native id of the thread it ran on
+
+
+@dataclass
+class Profiler:
+    # Records wall time, CPU time, memory and row counts for nested named stages.
+    # trace_memory turns on tracemalloc for per-stage Python allocation peaks, which
+    # slows allocation-heavy code noticeably, so it is opt in.
+    trace_memory: bool = False
+    meta: Dict[str, object] = field(default_factory=dict)
+    stages: List[Stage] = field(default_factory=list)
+    _stack: List[Stage] = field(default_factory=list)
+    _t0: float = field(default_factory=time.perf_counter)
+
+    @contextmanager
+    def stage(self, name: str, rows: Optional[int] = None) -> Iterator[Stage]:
+        st = Stage(name, len(self._stack), time.perf_counter() - self._t0, rows=rows)
+        self.stages.append(st)
+        if self.trace_memory:
+            # Fold the parent's peak so far into it before the child resets the counter
+            if self._stack:
+                parent = self._stack[-1]
+                parent.traced_peak_mb = max(parent.traced_peak_mb or 0.0, tracemalloc.get_traced_memory()[1] / MB)
+            tracemalloc.reset_peak()
+        self._stack.append(st)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield st
+        finally:
+            st.wall_s = time.perf_counter() - wall
+            st.cpu_s = time.process_time() - cpu
+            st.rss_mb = _rss_mb()
+            st.peak_rss_mb = _peak_rss_mb()
+            self._stack.pop()
+            if self.trace_memory:
+                st.traced_peak_mb = max(st.traced_peak_mb or 0.0, tracemalloc.get_traced_memory()[1] / MB)
+                if self._stack:
+                    parent = self._stack[-1]
+                    parent.traced_peak_mb = max(parent.traced_peak_mb or 0.0, st.traced_peak_mb)
+
+    def record(self, name: str, start: float, wall_s: float, cpu_s: float, rows: Optional[int] = None, thread: int = 0) -> Stage:
+        # Adds a stage timed elsewhere, e.g. on a worker thread where stage() can't be used;
+        # start is a time.perf_counter() value
+        st = Stage(name, len(self._stack), start - self._t0, wall_s, cpu_s, rows, _rss_mb(), _peak_rss_mb(), thread=thread)
+        self.stages.append(st)
+        return st
+
+    def trace(self) -> dict:
+        meta = {
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            **self.meta,
+        }
+        return {"meta": meta, "stages": [asdict(s) for s in self.stages]}
+
+    def write_json(self, path: str) -> None:
+        p = Path(path)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        p.write_text(json.dumps(self.trace(), indent=2, default=str), encoding="utf8")
+
+    def write_chrome_trace(self, path: str) -> None:
+        # Complete ("X") events in the Trace Event Format; open in chrome://tracing or Perfetto
+        events = []
+        for s in self.stages:
+            args = {k: v for k, v in asdict(s).items() if k not in ("name", "depth", "start_s", "wall_s", "thread") and v is not None}
+            events.append(
+                {
+                    "name": s.name,
+                    "ph": "X",
+                    "ts": round(s.start_s * 1e6, 1),
+                    "dur": round(s.wall_s * 1e6, 1),
+                    "pid": os.getpid(),
+                    "tid": s.thread,
+                    "args": args,
+                }
+            )
+        p = Path(path)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        p.write_text(json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}), encoding="utf8")
+
+
+_ACTIVE: Optional[Profiler] = None
+
+
+@contextmanager
+def profiling(profiler: Profiler) -> Iterator[Profiler]:
+    global _ACTIVE
+    previous, _ACTIVE = _ACTIVE, profiler
+    if profiler.trace_memory:
+        tracemalloc.start()
+    try:
+        yield profiler
+    finally:
+        if profiler.trace_memory:
+            tracemalloc.stop()
+        _ACTIVE = previous
+
+
+@contextmanager
+def stage(name: str, rows: Optional[int] = None) -> Iterator[Optional[Stage]]:
+    # No-op unless a Profiler is active, so instrumented code pays nothing by default
+    if _ACTIVE is None:
+        yield None
+        return
+    with _ACTIVE.stage(name, rows) as st:
+        yield st
+
+
+@contextmanager
+def timed() -> Iterator[Dict[str, float]]:
+    # Thread-safe timing for work on worker threads; pass the result to record()
+    t = {"start": time.perf_counter(), "cpu": time.thread_time(), "thread": threading.get_native_id()}
+    try:
+        yield t
+    finally:
+        t["wall_s"] = time.perf_counter() - t["start"]
+        t["cpu_s"] = time.thread_time() - t["cpu"]
+
+
+def record(name: str, t: Dict[str, float], rows: Optional[int] = None) -> None:
+    # Adds a stage timed with timed() to the active Profiler, from the main thread
+    if _ACTIVE is not None:
+        _ACTIVE.record(name, t["start"], t["wall_s"], t["cpu_s"], rows, int(t["thread"]))
+
+
+def set_rows(st: Optional[Stage], rows: int) -> None:
+    if st is not None:
+        st.rows = rows
+
+
+def profiled(name: Optional[str] = None) -> Callable:
+    # Decorator form of stage(); rows are the total rows of the DataFrame arguments
+    def wrap(fn: Callable) -> Callable:
+        label = name or fn.__name__
+
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            if _ACTIVE is None:
+                return fn(*args, **kwargs)
+            frames = [a for a in (*args, *kwargs.values()) if isinstance(a, pd.DataFrame)]
+            with _ACTIVE.stage(label, sum(len(f) for f in frames) if frames else None):
+                return fn(*args, **kwargs)
+
+        return inner
+
+    return wrap
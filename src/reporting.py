@@ -1,18 +1,65 @@
 from __future__ import annotations
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict
+from typing import Dict, List, Optional
 from tabulate import tabulate
 import pandas as pd
 
+from src.profiling import record, stage, timed
+
 
 def md_table(df: pd.DataFrame, max_rows: int = 12) -> str:
     return tabulate(df.head(max_rows), headers="keys", tablefmt="github", showindex=False)
 
 
-def write_text(path: str, text: str) -> None:
+def _write_atomic(path: str, text: str) -> None:
+    # Written to a temp file in the same directory and renamed over the target, so readers
+    # see the old file or the new one, never a partial write
     p = Path(path)
     p.parent.mkdir(parents=True, exist_ok=True)
-    p.write_text(text, encoding="utf8")
+    tmp = p.with_name(f".{p.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp, "w", encoding="utf8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, p)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def write_text(path: str, text: str) -> None:
+    with stage(f"write_text:{path}"):
+        _write_atomic(path, text)
+
+
+def _unchanged(path: str, text: str) -> bool:
+    p = Path(path)
+    try:
+        return p.read_text(encoding="utf8") == text
+    except FileNotFoundError:
+        return False
+
+
+def write_texts(texts: Dict[str, str], workers: Optional[int] = None, skip_unchanged: bool = False) -> List[str]:
+    # Writes {path: text} concurrently, each file atomically; skip_unchanged leaves files that
+    # already hold the same text untouched. Returns the paths written.
+    def write(path: str, text: str) -> tuple:
+        with timed() as t:
+            changed = not (skip_unchanged and _unchanged(path, text))
+            if changed:
+                _write_atomic(path, text)
+        return path, changed, t
+
+    written = []
+    with ThreadPoolExecutor(max_workers=workers or max(1, len(texts))) as pool:
+        for path, changed, t in pool.map(lambda item: write(*item), texts.items()):
+            if changed:
+                record(f"write_text:{path}", t)
+                written.append(path)
+    return written
 
 
 def metric_definitions_md() -> str:
@@ -32,4 +79,40 @@ These definitions are used consistently across the Python report and the Power B
 - **Sell-through %**: Units Sold / (Units Sold + On Hand Units). (Proxy for synthetic inventory.)
 - **Weeks of Supply (WOS)**: On Hand Units / Avg Weekly Units. (Avg weekly based on last 28 days.)
 - **Stockout proxy**: Number of days where total On Hand Units = 0.
+- **Drivers**: Sales $ change between two periods = Volume + Mix + Price + Markdown, per SKU, Brand, Category, Store, Region or Channel. Volume is the unit change at the base average net price, Mix the shift across SKUs at base prices, Price the UnitPrice change at the base DiscountRate, Markdown the DiscountRate change. GM $ change splits the same way plus Rate (GM % change on current Sales $).
 """
+
+
+def build_markdown_report(
+    kpis: dict,
+    daily: pd.DataFrame,
+    by_segment: pd.DataFrame,
+    by_category: pd.DataFrame,
+    by_region: pd.DataFrame,
+) -> str:
+    report = []
+    report.append("# Revenue Metrics and Insights Report\n")
+    report.append("## Summary KPIs\n")
+    report.append(f"- Total revenue: {kpis['total_revenue']}")
+    report.append(f"- Total orders: {kpis['total_orders']}")
+    report.append(f"- Average order value: {kpis['avg_order_value']}")
+    report.append(f"- Date range: {kpis['date_min']} to {kpis['date_max']} ({kpis['n_days']} days)")
+    report.append("")
+
+    report.append("## Daily Revenue Trend (top 10 rows)\n")
+    report.append(md_table(daily, max_rows=10))
+    report.append("")
+    report.append("## Revenue by Customer Segment\n")
+    report.append(md_table(by_segment))
+    report.append("")
+    report.append("## Revenue by Category\n")
+    report.append(md_table(by_category))
+    report.append("")
+    report.append("## Revenue by Region\n")
+    report.append(md_table(by_region))
+    report.append("")
+    return "\n".join(report)
+
+
+def save_report(text: str, path: str) -> None:
+    write_text(path, text)
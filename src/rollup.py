@@ -0,0 +1,213 @@
+from __future__ import annotations
+import argparse
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from src.cache import fingerprint
+from src.metrics import (
+    ATTRIBUTES,
+    attribute_lookups,
+    derive_attribute,
+    kpis_from_totals,
+    sales_by_week_table,
+    top_movers_table,
+)
+from src.plan import inventory_tables
+from src.profiling import profiled
+from src.storage import FORMATS, TABLES, read_table, write_table
+from src.validate import load_validated
+
+
+MEASURES = ["Sales", "Units", "GrossMarginAmt", "DiscountAmt", "Orders"]
+
+# Cube name -> grain, finest first. Every cube is rolled up from the smallest already
+# built cube that covers it.
+GRAINS: Dict[str, Tuple[str, ...]] = {
+    "AggSalesDaily": ("OrderDate", "SKU", "Store", "Channel"),
+    "AggSalesWeeklyBrandRegion": ("WeekStart", "Category", "Brand", "Region", "Channel"),
+    "AggSalesWeeklySkuStore": ("WeekStart", "SKU", "Store"),
+    "AggSalesWeekly": ("WeekStart",),
+    "AggSalesSku": ("SKU",),
+}
+
+DATE_KEYS = ("OrderDate", "WeekStart")
+MANIFEST = "_manifest.json"
+
+# Tables the cubes are built from: FactSales, and the Dims whose attributes (Category,
+# Brand, Region) are rolled into them
+SOURCES = ("FactSales", "DimSKU", "DimStore")
+
+
+def default_rollup_dir(data_dir: str) -> Path:
+    return Path(data_dir) / "aggregations"
+
+
+class Rollup:
+    # Additive FactSales aggregates at several grains. OrderID is unique per FactSales
+    # row (see validate_tables), so Orders is a row count and sums across grains like
+    # the other measures.
+    def __init__(self, cubes: Dict[str, pd.DataFrame], dim_sku: pd.DataFrame, dim_store: pd.DataFrame) -> None:
+        self.cubes = cubes
+        self.lookups = attribute_lookups(dim_sku, dim_store)
+
+    @property
+    def last_date(self) -> pd.Timestamp:
+        return self.cubes["AggSalesDaily"]["OrderDate"].max()
+
+    def covering(self, keys: Sequence[str], since: Optional[pd.Timestamp] = None) -> str:
+        # Smallest cube whose grain holds every key or the key it derives from
+        def covers(grain: Tuple[str, ...]) -> bool:
+            if since is not None and "OrderDate" not in grain:
+                return False
+            return all(k in grain or ATTRIBUTES.get(k) in grain for k in keys)
+
+        candidates = [name for name, df in self.cubes.items() if covers(GRAINS[name])]
+        if not candidates:
+            raise ValueError(f"No cube covers keys {list(keys)}")
+        return min(candidates, key=lambda name: len(self.cubes[name]))
+
+    def query(
+        self, keys: Sequence[str], measures: Sequence[str] = MEASURES, since: Optional[pd.Timestamp] = None
+    ) -> pd.DataFrame:
+        # Sums measures by keys from the smallest covering cube; since keeps OrderDate >= since
+        name = self.covering(keys, since)
+        return _rollup(self.cubes[name], GRAINS[name], list(keys), list(measures), self.lookups, since)
+
+
+def _rollup(
+    cube: pd.DataFrame,
+    grain: Tuple[str, ...],
+    keys: List[str],
+    measures: List[str],
+    lookups: Dict[str, pd.Series],
+    since: Optional[pd.Timestamp] = None,
+) -> pd.DataFrame:
+    if since is not None:
+        cube = cube[cube["OrderDate"] >= since]
+    if not keys:
+        return cube[measures].sum().to_frame().T
+
+    by = []
+    for k in keys:
+        by.append(cube[k] if k in grain else derive_attribute(k, cube[ATTRIBUTES[k]], lookups))
+    return cube.groupby(by, observed=True)[measures].sum().reset_index()
+
+
+@profiled()
+def build_rollup(fact_sales: pd.DataFrame, dim_sku: pd.DataFrame, dim_store: pd.DataFrame) -> Rollup:
+    base_keys = list(GRAINS["AggSalesDaily"])
+    base = fact_sales.groupby(base_keys, observed=True).agg(
+        Sales=("Sales", "sum"),
+        Units=("Units", "sum"),
+        GrossMarginAmt=("GrossMarginAmt", "sum"),
+        DiscountAmt=("DiscountAmt", "sum"),
+        Orders=("OrderID", "size"),
+    )
+    rollup = Rollup({"AggSalesDaily": base.reset_index()}, dim_sku, dim_store)
+    for name, grain in GRAINS.items():
+        if name not in rollup.cubes:
+            rollup.cubes[name] = rollup.query(grain)
+    return rollup
+
+
+def rollup_source(data_dir: str, fmt: str) -> Dict[str, list]:
+    return {name: fingerprint(data_dir, name, fmt) for name in SOURCES}
+
+
+def rollup_validation(data_dir: str, fmt: str, validate_sample: Optional[int] = None) -> dict:
+    # How FactSales was validated before the cubes were built: against which Dim tables, and
+    # on what sample. Orders counts rows, so the cubes are only right for a unique OrderID.
+    return {"dims": {n: fingerprint(data_dir, n, fmt) for n in TABLES if n.startswith("Dim")}, "sample_rows": validate_sample}
+
+
+def write_rollup(
+    rollup: Rollup, out_dir: str, fmt: str = "csv", source: Optional[Dict[str, list]] = None, validated: Any = None
+) -> None:
+    # source is the rollup_source the cubes were built from, used to detect staleness;
+    # validated records how FactSales was validated (None when it was not)
+    for name, df in rollup.cubes.items():
+        write_table(df, out_dir, name, fmt)
+    manifest = {"format": fmt, "grains": {k: list(v) for k, v in GRAINS.items()}, "source": source, "validated": validated}
+    (Path(out_dir) / MANIFEST).write_text(json.dumps(manifest, indent=2), encoding="utf8")
+
+
+def read_rollup(out_dir: str, fmt: str, dim_sku: pd.DataFrame, dim_store: pd.DataFrame) -> Rollup:
+    cubes = {}
+    for name in GRAINS:
+        df = read_table(out_dir, name, fmt)
+        for k in DATE_KEYS:
+            if k in df.columns:
+                df[k] = pd.to_datetime(df[k])
+        cubes[name] = df
+    return Rollup(cubes, dim_sku, dim_store)
+
+
+def rollup_is_current(data_dir: str, out_dir: str, fmt: str, validated: Any = None) -> bool:
+    # True when out_dir holds cubes of the current grains built from the SOURCES as they are
+    # now and, when validated is given, from a FactSales validated that way
+    path = Path(out_dir) / MANIFEST
+    if not path.exists():
+        return False
+    manifest = json.loads(path.read_text(encoding="utf8"))
+    return (
+        manifest.get("format") == fmt
+        and manifest.get("grains") == {k: list(v) for k, v in GRAINS.items()}
+        and manifest.get("source") == rollup_source(data_dir, fmt)
+        and (validated is None or manifest.get("validated") == validated)
+    )
+
+
+@profiled()
+def rollup_report_tables(
+    rollup: Rollup, fact_inv: pd.DataFrame, dim_sku: pd.DataFrame, dim_store: pd.DataFrame
+) -> Tuple[dict, float, int, dict, dict]:
+    # report_tables answered from the cubes instead of FactSales
+    t = rollup.query([]).iloc[0]
+    kpis = kpis_from_totals(
+        float(t["Sales"]), int(t["Orders"]), int(t["Units"]), float(t["GrossMarginAmt"]), float(t["DiscountAmt"])
+    )
+
+    weekly = rollup.query(["WeekStart"], ["Sales", "Units"])
+    avg_week = float(weekly["Units"].mean()) if len(weekly) else 0.0
+    exec_tables = {
+        "sales_by_week": sales_by_week_table(weekly),
+        "top_movers": top_movers_table(rollup.query(["SKU"], ["Sales", "Units", "GrossMarginAmt", "DiscountAmt"])),
+    }
+
+    since = rollup.last_date - pd.Timedelta(days=27)
+    sold = rollup.query(["SKU", "Store"], ["Units"], since=since).rename(columns={"Units": "Units28d"})
+    stockouts, inv_tables = inventory_tables(sold, fact_inv, dim_sku, dim_store)
+    return kpis, avg_week, stockouts, exec_tables, inv_tables
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Build and export FactSales aggregation tables (rollup cubes).")
+    p.add_argument("--data_dir", type=str, default="data_out")
+    p.add_argument("--format", type=str, default="csv", choices=FORMATS, help="Storage format of the tables and cubes.")
+    p.add_argument("--out_dir", type=str, default=None, help="Where to write the cubes (default: <data_dir>/aggregations).")
+    p.add_argument(
+        "--validate_sample",
+        type=int,
+        default=None,
+        help="Validate FactSales larger than this on a random sample of this many rows.",
+    )
+    args = p.parse_args()
+
+    # Validated as build_artifacts --rollup does, so its manifest lets those builds reuse the cubes
+    names = [n for n in TABLES if n.startswith("Dim")] + ["FactSales"]
+    t = load_validated(args.data_dir, args.format, names=names, validate_sample=args.validate_sample, io_workers=len(names))
+    rollup = build_rollup(t["FactSales"], t["DimSKU"], t["DimStore"])
+    out_dir = args.out_dir or str(default_rollup_dir(args.data_dir))
+    validated = rollup_validation(args.data_dir, args.format, args.validate_sample)
+    write_rollup(rollup, out_dir, args.format, rollup_source(args.data_dir, args.format), validated)
+
+    print(f"Aggregation tables written to {out_dir}:")
+    for name, df in rollup.cubes.items():
+        print(f"- {name} {GRAINS[name]} ({len(df)} rows, FactSales has {len(t['FactSales'])})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,434 @@
+from __future__ import annotations
+import argparse
+import json
+import socketserver
+import sys
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from src.approx import KpiSample, approx_exec_page_tables, approx_inventory_page_tables, approx_kpi_table, load_sample
+from src.cache import fingerprint
+from src.compact import encode_order_ids
+from src.inventory import DAY, is_changes
+from src.metrics import (
+    ATTRIBUTES,
+    MOVER_MEASURES,
+    attribute_lookups,
+    exec_page_tables,
+    inventory_page_tables,
+    key_columns,
+    kpi_summary,
+    kpis_from_totals,
+    load_tables,
+    top_movers,
+)
+from src.storage import FORMATS, TABLES
+from src.timeseries import DateIndex
+from src.validate import load_validated, validate_tables
+
+
+# Every query takes start and end (inclusive OrderDate bounds, YYYY-MM-DD; inventory is
+# taken as of end) and comma separated members of any of these keys, which narrow the
+# SKUs, stores or channels the facts are filtered to
+KEY_FILTERS = {"SKU": "SKU", "Category": "SKU", "Brand": "SKU", "Store": "Store", "Region": "Store", "Channel": "Channel"}
+SLICE_KEYS = ["WeekStart", "Category", "Brand", "Region", "SKU", "Store", "Channel"]
+
+
+class Tables:
+    # One generation of the star schema, as served. FactSales is kept in OrderDate order
+    # under a DateIndex, with OrderID as integers and SKU/Store/Channel as categoricals, so
+    # date filters are slices and key filters and distinct counts run on codes. Snapshot
+    # inventory in date order gets a DateIndex too, and so do the rows of the FactSales
+    # sample approx=1 queries are answered from, when there is one.
+    def __init__(self, tables: Dict[str, pd.DataFrame], fingerprints: Dict[str, list], sample: Optional[KpiSample] = None) -> None:
+        fs = tables["FactSales"]
+        fs = fs.assign(OrderID=encode_order_ids(fs["OrderID"]), **_categorical(fs, ("SKU", "Store", "Channel")))
+        self.sales = DateIndex(fs, "OrderDate")
+        inv = tables["FactInventorySnapshot"]
+        self.inventory = inv.assign(**_categorical(inv, ("SKU", "Store")))
+        self.inv_index = None if is_changes(inv) else DateIndex.if_sorted(self.inventory, "SnapshotDate")
+
+        self.sample = sample
+        if sample is not None:
+            self.sampled = DateIndex(sample.rows.assign(**_categorical(sample.rows, ("SKU", "Store", "Channel"))), "OrderDate")
+
+        self.tables = {**tables, "FactSales": self.sales.frame, "FactInventorySnapshot": self.inventory}
+        self.fingerprints = fingerprints
+        self.lookups = attribute_lookups(tables["DimSKU"], tables["DimStore"])
+        self.loaded_at = time.time()
+
+    def members(self, filters: Dict[str, List[str]]) -> Dict[str, List[str]]:
+        # The SKU, Store and Channel members the key filters allow, for the keys they narrow
+        dims = {"SKU": self.tables["DimSKU"], "Store": self.tables["DimStore"]}
+        allowed: Dict[str, set] = {}
+        for key, values in filters.items():
+            column = KEY_FILTERS[key]
+            if key == column:
+                members = set(values)
+            else:
+                dim = dims[column]
+                members = set(dim.loc[dim[key].astype(str).isin(values), column].astype(str))
+            allowed[column] = allowed[column] & members if column in allowed else members
+        return {c: sorted(m) for c, m in allowed.items()}
+
+    def sales_rows(self, start: Optional[pd.Timestamp], end: Optional[pd.Timestamp], members: Dict[str, List[str]]) -> pd.DataFrame:
+        fs = self.sales.between(start, end)
+        return _filter(fs, members)
+
+    def sample_rows(self, start: Optional[pd.Timestamp], end: Optional[pd.Timestamp], members: Dict[str, List[str]]) -> pd.DataFrame:
+        return _filter(self.sampled.between(start, end), members)
+
+    def inventory_rows(self, end: Optional[pd.Timestamp], members: Dict[str, List[str]]) -> pd.DataFrame:
+        inv = self.inventory
+        if end is not None:
+            if self.inv_index is not None:
+                inv = self.inv_index.between(None, end)
+            elif is_changes(inv):
+                # Runs still open on end close the day after, as they would in data ending on end
+                inv = inv[inv["ValidFrom"] <= end]
+                inv = inv.assign(ValidTo=inv["ValidTo"].clip(upper=end + DAY))
+            else:
+                inv = inv[inv["SnapshotDate"] <= end]
+        return _filter(inv, {c: m for c, m in members.items() if c in inv.columns})
+
+
+def _categorical(df: pd.DataFrame, columns: Tuple[str, ...]) -> Dict[str, pd.Series]:
+    return {c: df[c].astype("category") for c in columns if c in df.columns and not isinstance(df[c].dtype, pd.CategoricalDtype)}
+
+
+def _filter(df: pd.DataFrame, members: Dict[str, List[str]]) -> pd.DataFrame:
+    if not members:
+        return df
+    mask = np.ones(len(df), dtype=bool)
+    for c, m in members.items():
+        mask &= df[c].astype(str).isin(m).to_numpy() if not isinstance(df[c].dtype, pd.CategoricalDtype) else df[c].isin(m).to_numpy()
+    return df[mask]
+
+
+def _jsonable(value: Any) -> Any:
+    if isinstance(value, pd.DataFrame):
+        return [_jsonable(row) for row in value.to_dict(orient="records")]
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, (pd.Timestamp, np.datetime64)):
+        ts = pd.Timestamp(value)
+        return None if pd.isna(ts) else (ts.date().isoformat() if ts == ts.normalize() else ts.isoformat())
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    return value
+
+
+class MetricsService:
+    # Loads and validates the star schema once and answers queries from memory. Encoded
+    # responses are kept in an LRU of cache_entries; refresh() reloads the tables whose
+    # files changed (new fact partitions included) into a new generation, which replaces
+    # the current one, and its cache, in one step: queries never wait on a reload.
+    def __init__(
+        self,
+        data_dir: str,
+        fmt: str = "csv",
+        cache_entries: int = 256,
+        validate_sample: Optional[int] = None,
+        io_workers: int = len(TABLES),
+        sample_fraction: Optional[float] = None,
+    ) -> None:
+        self.data_dir = data_dir
+        self.fmt = fmt
+        self.cache_entries = cache_entries
+        self.validate_sample = validate_sample
+        self.io_workers = io_workers
+        self.sample_fraction = sample_fraction
+        self.lock = threading.Lock()
+        self.results: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self.hits = self.misses = self.reloads = 0
+        self.failed: Optional[Dict[str, list]] = None
+        self.endpoints: Dict[str, Callable[[Tables, Dict[str, List[str]]], Any]] = {
+            "kpis": self._kpis,
+            "slice": self._slice,
+            "exec": self._exec,
+            "inventory": self._inventory,
+            "top_movers": self._top_movers,
+        }
+
+        fps = self._fingerprints()
+        t = load_validated(data_dir, fmt, names=TABLES, validate_sample=validate_sample, io_workers=io_workers)
+        self.current = Tables(t, fps, self._sample(t))
+
+    def _sample(self, t: Dict[str, pd.DataFrame]) -> Optional[KpiSample]:
+        # The persisted FactSales sample, drawn again when FactSales or DimSKU changed
+        return load_sample(self.data_dir, self.fmt, self.sample_fraction, tables=t) if self.sample_fraction else None
+
+    def _fingerprints(self) -> Dict[str, list]:
+        return {name: fingerprint(self.data_dir, name, self.fmt) for name in TABLES}
+
+    def refresh(self) -> bool:
+        # Reloads the changed tables; True when a new generation was loaded. A reload that
+        # fails (say, files still being written) keeps the current generation and is only
+        # retried once the files change again.
+        fps = self._fingerprints()
+        current = self.current
+        if fps == current.fingerprints or fps == self.failed:
+            return False
+        changed = [name for name in TABLES if fps[name] != current.fingerprints[name]]
+        try:
+            t = {**current.tables, **load_tables(self.data_dir, self.fmt, names=changed, workers=self.io_workers)}
+            vr = validate_tables(*(t[name] for name in TABLES), sample_rows=self.validate_sample)
+            if not vr.ok:
+                raise ValueError("Validation failed:\n" + "\n".join(vr.errors))
+            sample = current.sample if not {"FactSales", "DimSKU"} & set(changed) else self._sample(t)
+            tables = Tables(t, fps, sample)
+        except Exception:
+            self.failed = fps
+            raise
+        with self.lock:
+            self.current = tables
+            self.results.clear()
+            self.reloads += 1
+        return True
+
+    def query(self, endpoint: str, params: Dict[str, List[str]]) -> Tuple[bytes, bool]:
+        # (JSON body, cache hit) for endpoint; ValueError for bad parameters
+        if endpoint == "status":
+            return json.dumps(self.status()).encode(), False
+        tables = self.current
+        key = (id(tables), endpoint, tuple(sorted((k, tuple(v)) for k, v in params.items())))
+        with self.lock:
+            body = self.results.get(key)
+            if body is not None:
+                self.results.move_to_end(key)
+                self.hits += 1
+                return body, True
+            self.misses += 1
+
+        body = json.dumps(_jsonable(self.endpoints[endpoint](tables, params))).encode()
+        with self.lock:
+            if tables is self.current:
+                self.results[key] = body
+                while len(self.results) > self.cache_entries:
+                    self.results.popitem(last=False)
+        return body, False
+
+    def status(self) -> dict:
+        tables = self.current
+        return {
+            "data_dir": self.data_dir,
+            "format": self.fmt,
+            "loaded_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(tables.loaded_at)),
+            "rows": {name: len(df) for name, df in tables.tables.items()},
+            "sample_rows": None if tables.sample is None else len(tables.sample.rows),
+            "reloads": self.reloads,
+            "cache": {"entries": len(self.results), "max_entries": self.cache_entries, "hits": self.hits, "misses": self.misses},
+        }
+
+    # Endpoints: each takes the generation to answer from and the query parameters
+
+    def _common(self, tables: Tables, params: Dict[str, List[str]], extra: Tuple[str, ...] = ()) -> tuple:
+        unknown = [k for k in params if k not in ("start", "end", *KEY_FILTERS, *extra)]
+        if unknown:
+            raise ValueError(f"Unknown parameters {unknown}")
+        start, end = (_date(params, k) for k in ("start", "end"))
+        members = tables.members({k: _values(params, k) for k in KEY_FILTERS if k in params})
+        return start, end, members
+
+    def _approx(self, tables: Tables, params: Dict[str, List[str]]) -> bool:
+        # approx=1 answers from the FactSales sample, with 95% intervals
+        if _values(params, "approx", ["0"])[0].lower() in ("0", "false"):
+            return False
+        if tables.sample is None:
+            raise ValueError("approx=1 needs the service started with --sample_fraction")
+        return True
+
+    def _kpis(self, tables: Tables, params: Dict[str, List[str]]) -> dict:
+        start, end, members = self._common(tables, params, ("approx",))
+        if self._approx(tables, params):
+            return approx_kpi_table(tables.sample, (), tables.sample_rows(start, end, members))[0]
+        return kpi_summary(tables.sales_rows(start, end, members))
+
+    def _slice(self, tables: Tables, params: Dict[str, List[str]]) -> list:
+        # kpi_summary for each member of the by keys, e.g. by=Category,WeekStart
+        start, end, members = self._common(tables, params, ("by", "approx"))
+        by = _values(params, "by")
+        bad = [k for k in by if k not in SLICE_KEYS]
+        if not by or bad:
+            raise ValueError(f"by takes one or more of {SLICE_KEYS}")
+        if self._approx(tables, params):
+            return approx_kpi_table(tables.sample, by, tables.sample_rows(start, end, members))
+        fs = tables.sales_rows(start, end, members)
+        totals = fs.groupby(key_columns(fs, by, tables.lookups), observed=True).agg(
+            Sales=("Sales", "sum"),
+            Orders=("OrderID", "nunique"),
+            Units=("Units", "sum"),
+            GM=("GrossMarginAmt", "sum"),
+            Markdown=("DiscountAmt", "sum"),
+        )
+        rows = []
+        for idx, r in zip(totals.index, totals.itertuples(index=False)):
+            keys = dict(zip(by, idx if len(by) > 1 else (idx,)))
+            rows.append({**keys, **kpis_from_totals(float(r.Sales), int(r.Orders), int(r.Units), float(r.GM), float(r.Markdown))})
+        return rows
+
+    def _exec(self, tables: Tables, params: Dict[str, List[str]]) -> dict:
+        start, end, members = self._common(tables, params, ("approx",))
+        if self._approx(tables, params):
+            return approx_exec_page_tables(tables.sample, tables.sample_rows(start, end, members))
+        return exec_page_tables(tables.sales_rows(start, end, members))
+
+    def _inventory(self, tables: Tables, params: Dict[str, List[str]]) -> dict:
+        start, end, members = self._common(tables, params, ("approx",))
+        t = tables.tables
+        inv = tables.inventory_rows(end, members)
+        if inv.empty:
+            raise ValueError("No inventory rows match the filters")
+        if self._approx(tables, params):
+            sample = tables.sample
+            last = None if end is None else min(end, sample.last_date)
+            return approx_inventory_page_tables(sample, inv, t["DimSKU"], t["DimStore"], tables.sample_rows(start, end, members), last)
+        return inventory_page_tables(tables.sales_rows(start, end, members), inv, t["DimSKU"], t["DimStore"])
+
+    def _top_movers(self, tables: Tables, params: Dict[str, List[str]]) -> Any:
+        start, end, members = self._common(tables, params, ("level", "n", "by", "per"))
+        level = _values(params, "level", ["SKU"])[0]
+        by = _values(params, "by", ["Sales"])[0]
+        per = _values(params, "per", [])
+        if level not in ("SKU", "Store", *ATTRIBUTES) or level == "WeekStart":
+            raise ValueError(f"Unknown level {level!r}")
+        if by not in MOVER_MEASURES:
+            raise ValueError(f"by takes one of {MOVER_MEASURES}")
+        bad = [k for k in per if k not in SLICE_KEYS]
+        if bad:
+            raise ValueError(f"per takes any of {SLICE_KEYS}")
+        try:
+            n = int(_values(params, "n", ["10"])[0])
+        except ValueError:
+            raise ValueError("n must be an integer") from None
+        t = tables.tables
+        return top_movers(tables.sales_rows(start, end, members), n, by, level, per, t["DimSKU"], t["DimStore"])
+
+
+def _values(params: Dict[str, List[str]], key: str, default: Optional[List[str]] = None) -> List[str]:
+    if key not in params:
+        return default if default is not None else []
+    return [v for value in params[key] for v in value.split(",") if v]
+
+
+def _date(params: Dict[str, List[str]], key: str) -> Optional[pd.Timestamp]:
+    values = _values(params, key)
+    if not values:
+        return None
+    try:
+        return pd.Timestamp(values[0])
+    except ValueError:
+        raise ValueError(f"{key} must be a date, got {values[0]!r}") from None
+
+
+def make_handler(service: MetricsService, quiet: bool = False) -> type:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            url = urlparse(self.path)
+            endpoint = url.path.strip("/")
+            t0 = time.perf_counter()
+            hit = False
+            if endpoint != "status" and endpoint not in service.endpoints:
+                status, body = 404, {"error": f"Unknown endpoint {endpoint!r}", "endpoints": ["status", *service.endpoints]}
+            else:
+                try:
+                    body, hit = service.query(endpoint, parse_qs(url.query))
+                    status = 200
+                except ValueError as e:
+                    status, body = 400, {"error": str(e)}
+                except Exception as e:
+                    status, body = 500, {"error": f"{type(e).__name__}: {e}"}
+            if not isinstance(body, bytes):
+                body = json.dumps(body).encode()
+
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("X-Cache", "hit" if hit else "miss")
+            self.send_header("X-Elapsed-Ms", f"{(time.perf_counter() - t0) * 1000:.2f}")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def address_string(self) -> str:
+            # Unix socket peers have no address
+            return self.client_address[0] if isinstance(self.client_address, tuple) else "local"
+
+        def log_message(self, format: str, *args: Any) -> None:
+            if not quiet:
+                super().log_message(format, *args)
+
+    return Handler
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def watch(service: MetricsService, interval: float, stop: threading.Event) -> None:
+    while not stop.wait(interval):
+        try:
+            if service.refresh():
+                print(f"Reloaded tables: {service.status()['rows']}", file=sys.stderr)
+        except Exception as e:
+            print(f"Reload failed, still serving the previous tables: {e}", file=sys.stderr)
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Serve KPI queries over the star schema from memory, on localhost.")
+    p.add_argument("--data_dir", type=str, default="data_out")
+    p.add_argument("--format", type=str, default="csv", choices=FORMATS)
+    p.add_argument("--port", type=int, default=8765, help="Port on 127.0.0.1.")
+    p.add_argument("--socket", type=str, default=None, help="Listen on this Unix socket path instead of a port.")
+    p.add_argument("--cache_entries", type=int, default=256, help="Query results kept, least recently used evicted first.")
+    p.add_argument("--poll_seconds", type=float, default=2.0, help="How often to check the tables for changes (0 never reloads).")
+    p.add_argument("--validate_sample", type=int, default=None, help="Validate a random sample of this many fact rows.")
+    p.add_argument(
+        "--sample_fraction",
+        type=float,
+        default=None,
+        help="Keep a stratified FactSales sample of this fraction for approx=1 queries (see src.approx).",
+    )
+    p.add_argument("--quiet", action="store_true", help="Do not log each request.")
+    args = p.parse_args()
+
+    service = MetricsService(
+        args.data_dir, args.format, args.cache_entries, args.validate_sample, sample_fraction=args.sample_fraction
+    )
+    handler = make_handler(service, args.quiet)
+    if args.socket:
+        Path(args.socket).unlink(missing_ok=True)
+        server = UnixHTTPServer(args.socket, handler)
+        where = args.socket
+    else:
+        server = ThreadingHTTPServer(("127.0.0.1", args.port), handler)
+        where = f"http://127.0.0.1:{args.port}"
+
+    stop = threading.Event()
+    if args.poll_seconds > 0:
+        threading.Thread(target=watch, args=(service, args.poll_seconds, stop), daemon=True).start()
+    print(f"Serving {args.data_dir} on {where} (endpoints: status, {', '.join(service.endpoints)})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
+        if args.socket:
+            Path(args.socket).unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+from __future__ import annotations
+import shutil
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from src.colstore import MANIFEST, concat_columns, copy_bytes, iter_column_chunks, read_columns, write_columns
+
+
+# memmap is a directory of raw column files opened with np.memmap (see src.colstore)
+FORMATS = ("csv", "parquet", "feather", "memmap")
+
+TABLES = ("DimDate", "DimSKU", "DimStore", "DimChannel", "FactSales", "FactInventorySnapshot")
+
+DATE_COLUMNS: Dict[str, List[str]] = {
+    "DimDate": ["Date", "WeekStart"],
+    "FactSales": ["OrderDate"],
+    "FactInventorySnapshot": ["SnapshotDate"],
+    "FactInventoryChanges": ["ValidFrom", "ValidTo"],
+}
+
+# Low cardinality keys stored dictionary encoded in columnar formats
+DICTIONARY_COLUMNS = ("SKU", "Store", "Channel", "Region")
+
+# Prefix-plus-digits IDs the memmap format stores as integers
+ID_COLUMNS = ("OrderID",)
+
+# Tables written as one directory per month: <Table>/Month=YYYY-MM/part-NNNNN.<ext>. New
+# rows go to new part files, so --incremental only reads those and the months rewritten.
+PARTITIONED_TABLES: Dict[str, str] = {
+    "FactSales": "OrderDate",
+    "FactInventorySnapshot": "SnapshotDate",
+    "FactInventoryChanges": "ValidFrom",
+}
+PARTITIONED_FORMATS = ("parquet", "feather")
+
+# Tables that may instead be stored in a sparse form (see src.inventory)
+SPARSE_TABLES: Dict[str, str] = {"FactInventorySnapshot": "FactInventoryChanges"}
+
+
+def _check_format(fmt: str) -> None:
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown storage format {fmt!r}, expected one of {FORMATS}")
+
+
+def table_path(data_dir: str, name: str, fmt: str = "csv") -> Path:
+    _check_format(fmt)
+    if fmt in PARTITIONED_FORMATS and name in PARTITIONED_TABLES:
+        return Path(data_dir) / name
+    return Path(data_dir) / f"{name}.{fmt}"
+
+
+def _encode(df: pd.DataFrame) -> pd.DataFrame:
+    out = df.reset_index(drop=True)
+    for c in DICTIONARY_COLUMNS:
+        if c in out.columns and not isinstance(out[c].dtype, pd.CategoricalDtype):
+            out[c] = out[c].astype("category")
+    return out
+
+
+def _write_columnar(df: pd.DataFrame, path: Path, fmt: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if fmt == "parquet":
+        df.to_parquet(path, index=False)
+    else:
+        df.to_feather(path)
+
+
+def write_table(df: pd.DataFrame, data_dir: str, name: str, fmt: str = "csv", part: int = 0) -> None:
+    # part > 0 appends another block of rows to a table started with part == 0,
+    # which is how the generator streams FactInventorySnapshot.
+    path = table_path(data_dir, name, fmt)
+
+    if fmt == "csv":
+        path.parent.mkdir(parents=True, exist_ok=True)
+        df.to_csv(path, index=False, mode="w" if part == 0 else "a", header=(part == 0))
+        return
+    if fmt == "memmap":
+        write_columns(df.reset_index(drop=True), path, ID_COLUMNS, append=part > 0)
+        return
+
+    df = _encode(df)
+    if name not in PARTITIONED_TABLES:
+        if part != 0:
+            raise ValueError(f"{name} is not partitioned and cannot be written in parts")
+        _write_columnar(df, path, fmt)
+        return
+
+    if part == 0 and path.exists():
+        shutil.rmtree(path)
+    # Truncating to months is a cast; strftime over every row would cost more than the write
+    month = df[PARTITIONED_TABLES[name]].to_numpy().astype("datetime64[M]")
+    for m, block in df.groupby(month, sort=True):
+        _write_columnar(block.reset_index(drop=True), path / f"Month={m:%Y-%m}" / f"part-{part:05d}.{fmt}", fmt)
+
+
+def partition_files(data_dir: str, name: str, fmt: str) -> List[Path]:
+    path = table_path(data_dir, name, fmt)
+    if fmt == "memmap":
+        return [path / MANIFEST]
+    if fmt not in PARTITIONED_FORMATS or name not in PARTITIONED_TABLES:
+        return [path]
+    return sorted(path.glob(f"Month=*/part-*.{fmt}"))
+
+
+def stored_table(data_dir: str, name: str, fmt: str = "csv") -> str:
+    # The name a table's data is stored under: its sparse form when only that exists
+    sparse = SPARSE_TABLES.get(name)
+    if sparse is None or table_path(data_dir, name, fmt).exists() or not table_path(data_dir, sparse, fmt).exists():
+        return name
+    return sparse
+
+
+def read_partition(
+    path: Path, name: str, fmt: str = "csv", columns: Optional[List[str]] = None, dtype: Optional[Dict[str, str]] = None
+) -> pd.DataFrame:
+    # dtype only applies to csv; the other formats carry their own column types
+    if fmt == "csv":
+        dates = [c for c in DATE_COLUMNS.get(name, []) if columns is None or c in columns]
+        return pd.read_csv(path, usecols=columns, parse_dates=dates or False, dtype=dtype)
+    if fmt == "memmap":
+        return read_columns(path.parent, columns)
+    if fmt == "parquet":
+        return pd.read_parquet(path, columns=columns)
+    return pd.read_feather(path, columns=columns)
+
+
+def read_table(
+    data_dir: str, name: str, fmt: str = "csv", columns: Optional[List[str]] = None, dtype: Optional[Dict[str, str]] = None
+) -> pd.DataFrame:
+    name = stored_table(data_dir, name, fmt)
+    files = partition_files(data_dir, name, fmt)
+    if not files or not files[0].exists():
+        raise FileNotFoundError(f"No {fmt} data for {name} under {data_dir}")
+    if len(files) == 1:
+        return read_partition(files[0], name, fmt, columns, dtype)
+
+    df = pd.concat([read_partition(f, name, fmt, columns, dtype) for f in files], ignore_index=True)
+    # Parts with different dictionaries concatenate to plain strings; re-encode them
+    for c in DICTIONARY_COLUMNS:
+        if c in df.columns and not isinstance(df[c].dtype, pd.CategoricalDtype):
+            df[c] = df[c].astype("category")
+    return df
+
+
+def iter_table_chunks(
+    data_dir: str, name: str, fmt: str = "csv", chunksize: int = 1_000_000, columns: Optional[List[str]] = None
+) -> Iterator[pd.DataFrame]:
+    # Reads a table a bounded number of rows at a time, partition by partition
+    name = stored_table(data_dir, name, fmt)
+    for path in partition_files(data_dir, name, fmt):
+        if fmt == "memmap":
+            yield from iter_column_chunks(path.parent, chunksize, columns)
+        elif fmt == "csv":
+            dates = [c for c in DATE_COLUMNS.get(name, []) if columns is None or c in columns]
+            yield from pd.read_csv(path, usecols=columns, parse_dates=dates or False, chunksize=chunksize)
+        elif fmt == "parquet":
+            import pyarrow.parquet as pq
+
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+                yield batch.to_pandas()
+        else:
+            import pyarrow as pa
+            import pyarrow.ipc as ipc
+
+            reader = ipc.open_file(path)
+            batches, n = [], 0
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                batches.append(batch.select(columns) if columns else batch)
+                n += batch.num_rows
+                if n >= chunksize:
+                    yield pa.Table.from_batches(batches).to_pandas()
+                    batches, n = [], 0
+            if batches:
+                yield pa.Table.from_batches(batches).to_pandas()
+
+
+class ShardWriter:
+    # Writes one shard of a table under its own data_dir, part by part as write_table does,
+    # recording where each part ends: bytes for csv, rows for memmap. Columnar parts of
+    # partitioned tables are files of their own. concat_shards then lays the parts of
+    # several shards out in one table by copying them, without decoding the rows.
+    def __init__(self, data_dir: str, name: str, fmt: str = "csv") -> None:
+        self.data_dir = data_dir
+        self.name = name
+        self.fmt = fmt
+        self.ends: List[int] = []
+        self.rows = 0
+
+    def write(self, df: pd.DataFrame) -> None:
+        write_table(df, self.data_dir, self.name, self.fmt, part=len(self.ends))
+        self.rows += len(df)
+        if self.fmt == "csv":
+            self.ends.append(table_path(self.data_dir, self.name, self.fmt).stat().st_size)
+        else:
+            self.ends.append(self.rows)
+
+    def starts(self) -> List[int]:
+        if self.fmt == "csv":
+            with open(table_path(self.data_dir, self.name, self.fmt), "rb") as f:
+                return [len(f.readline()), *self.ends[:-1]]
+        return [0, *self.ends[:-1]]
+
+
+def _row_groups(path: Path, fmt: str):
+    # (schema, the file's row groups or record batches as Tables)
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+
+    if fmt == "parquet":
+        f = pq.ParquetFile(path)
+        return f.schema_arrow, (f.read_row_group(i) for i in range(f.num_row_groups))
+    f = ipc.open_file(path)
+    return f.schema, (pa.Table.from_batches([f.get_batch(i)]) for i in range(f.num_record_batches))
+
+
+def _concat_arrow(files: Sequence[Tuple[Path, int]], path: Path, fmt: str) -> None:
+    # Copies the row groups (record batches) of files, in order, into one file; those of
+    # consecutive files with the same group key are written as one row group
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+
+    writer, pending = None, []
+    for n, (f, key) in enumerate(files):
+        schema, tables = _row_groups(f, fmt)
+        if writer is None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if fmt == "parquet":
+                writer = pq.ParquetWriter(path, schema)
+            else:
+                writer = ipc.new_file(path, schema, options=ipc.IpcWriteOptions(compression="lz4"))
+        pending.extend(tables)
+        if pending and (n + 1 == len(files) or files[n + 1][1] != key):
+            writer.write_table(pa.concat_tables(pending))
+            pending = []
+    if writer is not None:
+        writer.close()
+
+
+def concat_shards(shards: Sequence[ShardWriter], data_dir: str, by_part: bool = False) -> int:
+    # Writes the table the shards hold to data_dir, in the layout write_table gives it, as
+    # shard after shard or, with by_part=True, part k of every shard before part k + 1 (so
+    # shards of daily snapshots written a day per part come out in date order). Returns
+    # the row count.
+    name, fmt = shards[0].name, shards[0].fmt
+    path = table_path(data_dir, name, fmt)
+    # Empty shards are left out: with no rows to go by, their column types may not match
+    shards = [s for s in shards if s.rows] or shards[:1]
+    units = [(i, k) for i, s in enumerate(shards) for k in range(len(s.ends))]
+    if by_part:
+        units.sort(key=lambda u: (u[1], u[0]))
+
+    if fmt == "csv":
+        files = [open(table_path(s.data_dir, name, fmt), "rb") for s in shards]
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            starts = [s.starts() for s in shards]
+            with open(path, "wb") as out:
+                out.write(files[0].readline())
+                for i, k in units:
+                    copy_bytes(files[i], out, starts[i][k], shards[i].ends[k])
+        finally:
+            for f in files:
+                f.close()
+    elif fmt == "memmap":
+        starts = [s.starts() for s in shards]
+        ranges = [(table_path(shards[i].data_dir, name, fmt), starts[i][k], shards[i].ends[k]) for i, k in units]
+        concat_columns(ranges, path)
+    elif name in PARTITIONED_TABLES:
+        if path.exists():
+            shutil.rmtree(path)
+        months = sorted({f.parent.name for s in shards for f in table_path(s.data_dir, name, fmt).glob("Month=*/part-*")})
+        for month in months:
+            files = []
+            for i, k in units:
+                f = table_path(shards[i].data_dir, name, fmt) / month / f"part-{k:05d}.{fmt}"
+                if f.exists():
+                    files.append((f, k if by_part else i))
+            _concat_arrow(files, path / month / f"part-00000.{fmt}", fmt)
+    else:
+        _concat_arrow([(table_path(shards[i].data_dir, name, fmt), i) for i, k in units], path, fmt)
+    return sum(s.rows for s in shards)
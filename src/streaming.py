@@ -0,0 +1,88 @@
+from __future__ import annotations
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.distinct import ExactDistinct, make_distinct
+from src.incremental import DIM_TABLES, AggregateState, report_inputs
+from src.inventory import is_changes
+from src.profiling import profiled
+from src.storage import iter_table_chunks, read_table
+from src.validate import REQUIRED_COLUMNS, UNIQUE_KEYS, validate_tables
+
+
+@profiled()
+def streaming_report_tables(
+    data_dir: str,
+    fmt: str = "csv",
+    chunksize: int = 1_000_000,
+    orders: str = "exact",
+    max_orders_in_memory: Optional[int] = 10_000_000,
+    spill_dir: Optional[str] = None,
+) -> Tuple[dict, float, int, dict, dict]:
+    # Out-of-core equivalent of kpi_summary, avg_weekly_units, stockout_days, exec_page_tables
+    # and inventory_page_tables. Facts are read chunksize rows at a time and folded into
+    # mergeable partial aggregates whose size depends on the dimensions, not the fact rows.
+    # orders="exact" spills distinct OrderIDs to disk past max_orders_in_memory;
+    # orders="approx" counts them with a HyperLogLog sketch instead, and then OrderIDs are
+    # only checked for uniqueness within each chunk.
+    dims = {name: read_table(data_dir, name, fmt) for name in DIM_TABLES}
+    _validate_chunk(dims)
+    state = AggregateState(fmt=fmt, orders=make_distinct(orders, max_orders_in_memory, spill_dir))
+    inv_keys = ExactDistinct(max_in_memory=max_orders_in_memory, spill_dir=spill_dir)
+
+    try:
+        # Chunks are validated on their own; uniqueness across chunks is checked from exact
+        # distinct counts of the keys against the rows folded
+        sales_rows = inv_rows = 0
+        inv_name = "FactInventorySnapshot"
+        for chunk in iter_table_chunks(data_dir, "FactSales", fmt, chunksize):
+            _validate_chunk(dims, fact_sales=chunk)
+            state.fold_sales(chunk)
+            sales_rows += len(chunk)
+        for chunk in iter_table_chunks(data_dir, "FactInventorySnapshot", fmt, chunksize):
+            _validate_chunk(dims, fact_inv=chunk)
+            state.fold_inventory(chunk)
+            inv_name = "FactInventoryChanges" if is_changes(chunk) else "FactInventorySnapshot"
+            inv_keys.update(_inventory_keys(chunk, inv_name, dims))
+            inv_rows += len(chunk)
+
+        errors = []
+        if orders == "exact":
+            errors += _duplicates("FactSales", sales_rows - state.orders.count())
+        errors += _duplicates(inv_name, inv_rows - inv_keys.count())
+        if errors:
+            raise ValueError("Validation failed:\n" + "\n".join(errors))
+        return report_inputs(state, dims["DimSKU"], dims["DimStore"])
+    finally:
+        state.orders.close()
+        inv_keys.close()
+
+
+def _inventory_keys(inv: pd.DataFrame, name: str, dims: dict) -> np.ndarray:
+    # One int64 per (date, SKU, Store) key, from Dim positions (validated to exist) and day numbers
+    date_col, sku_col, store_col = UNIQUE_KEYS[name]
+    skus = pd.Index(dims["DimSKU"]["SKU"].astype(str))
+    stores = pd.Index(dims["DimStore"]["Store"].astype(str))
+    sku = skus.get_indexer(inv[sku_col].astype(str)).astype(np.int64)
+    store = stores.get_indexer(inv[store_col].astype(str)).astype(np.int64)
+    days = inv[date_col].to_numpy().astype("datetime64[D]").astype(np.int64)
+    return (days * len(skus) + sku) * len(stores) + store
+
+
+def _duplicates(name: str, dups: int) -> List[str]:
+    # Worded as validate_tables words duplicates within one frame
+    return [f"{name} has {dups} duplicate rows on {UNIQUE_KEYS[name]}."] if dups else []
+
+
+def _validate_chunk(
+    dims: dict, fact_sales: Optional[pd.DataFrame] = None, fact_inv: Optional[pd.DataFrame] = None
+) -> None:
+    # Without facts, checks the Dim tables; with them, only the facts (the Dims were checked first)
+    fs = fact_sales if fact_sales is not None else pd.DataFrame(columns=REQUIRED_COLUMNS["FactSales"])
+    inv = fact_inv if fact_inv is not None else pd.DataFrame(columns=REQUIRED_COLUMNS["FactInventorySnapshot"])
+    skip = DIM_TABLES if fact_sales is not None or fact_inv is not None else ()
+    vr = validate_tables(dims["DimDate"], dims["DimSKU"], dims["DimStore"], dims["DimChannel"], fs, inv, skip=skip)
+    if not vr.ok:
+        raise ValueError("Validation failed:\n" + "\n".join(vr.errors))
@@ -0,0 +1,84 @@
+from __future__ import annotations
+from typing import Optional
+import pandas as pd
+
+
+CATEGORY_COLUMNS = ["Segment", "Region", "Category"]
+MEASURES = ["Sales"]
+CUBE_KEYS = ["Order Date", *CATEGORY_COLUMNS]
+REQUIRED_COLUMNS = ["Order ID", *CUBE_KEYS, *MEASURES]
+
+
+def load_superstore(path: str) -> pd.DataFrame:
+    # Only the columns the report uses are read. Order Date is parsed once at load and
+    # Segment/Region/Category come in as categoricals, so the grouping below runs on codes.
+    header = pd.read_csv(path, nrows=0).columns
+    missing = [c for c in REQUIRED_COLUMNS if c not in header]
+    if missing:
+        raise ValueError(f"Superstore input is missing columns: {missing}")
+    dtypes = {c: "category" for c in CATEGORY_COLUMNS}
+    return pd.read_csv(path, usecols=REQUIRED_COLUMNS, dtype=dtypes, parse_dates=["Order Date"])
+
+
+def revenue_cube(df: pd.DataFrame) -> pd.DataFrame:
+    # The one grouped pass over the rows: Sales by day x Segment x Region x Category. Its
+    # size depends on the calendar and the dimensions, not the row count, and every revenue
+    # breakdown is a roll-up of it.
+    cube = df.groupby(CUBE_KEYS, observed=True, sort=False)[MEASURES].sum()
+    return cube.reset_index()
+
+
+def _rollup(cube: pd.DataFrame, key: str) -> pd.DataFrame:
+    # Same layout as reports/metrics_report.md: <key>, "<key> Revenue", largest first
+    out = cube.groupby(key, observed=True)["Sales"].sum().reset_index()
+    out = out.rename(columns={"Sales": f"{key} Revenue"})
+    if isinstance(out[key].dtype, pd.CategoricalDtype):
+        out[key] = out[key].astype(str)
+    return out.sort_values(f"{key} Revenue", ascending=False).reset_index(drop=True)
+
+
+def daily_revenue(df: pd.DataFrame, cube: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    cube = revenue_cube(df) if cube is None else cube
+    out = cube.groupby("Order Date")["Sales"].sum().reset_index()
+    out = out.rename(columns={"Sales": "Daily Revenue"})
+    return out.sort_values("Order Date").reset_index(drop=True)
+
+
+def revenue_by_segment(df: pd.DataFrame, cube: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    return _rollup(revenue_cube(df) if cube is None else cube, "Segment")
+
+
+def revenue_by_category(df: pd.DataFrame, cube: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    return _rollup(revenue_cube(df) if cube is None else cube, "Category")
+
+
+def revenue_by_region(df: pd.DataFrame, cube: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    return _rollup(revenue_cube(df) if cube is None else cube, "Region")
+
+
+def kpi_summary(df: pd.DataFrame, cube: Optional[pd.DataFrame] = None) -> dict:
+    cube = revenue_cube(df) if cube is None else cube
+    revenue = float(cube["Sales"].sum())
+    orders = int(df["Order ID"].nunique())
+    start, end = cube["Order Date"].min(), cube["Order Date"].max()
+
+    return {
+        "total_revenue": round(revenue, 2),
+        "total_orders": orders,
+        "avg_order_value": round(revenue / orders, 2) if orders else 0.0,
+        "date_min": start.date(),
+        "date_max": end.date(),
+        "n_days": (end - start).days + 1,
+    }
+
+
+def superstore_tables(df: pd.DataFrame) -> dict:
+    # All report inputs off a single shared revenue_cube
+    cube = revenue_cube(df)
+    return {
+        "kpis": kpi_summary(df, cube),
+        "daily": daily_revenue(df, cube),
+        "by_segment": revenue_by_segment(df, cube),
+        "by_category": revenue_by_category(df, cube),
+        "by_region": revenue_by_region(df, cube),
+    }
@@ -0,0 +1,109 @@
+from __future__ import annotations
+from typing import Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+
+WINDOWS = (7, 28, 91)
+DAY = np.timedelta64(1, "D")
+
+
+class DateIndex:
+    # A fact table in date order with the row offset where each distinct date starts, so
+    # date-range and as-of lookups are binary searches over the distinct dates and the
+    # rows come back as iloc slices (views, not copies). Tables already in date order (the
+    # generated and partitioned inventory snapshots) are indexed in place; others are
+    # sorted once, stably, which pays off when many windows are sliced from the same table.
+    def __init__(self, df: pd.DataFrame, date_col: str, sort: bool = True) -> None:
+        values = df[date_col].to_numpy()
+        if len(values) and not (values[1:] >= values[:-1]).all():
+            if not sort:
+                raise ValueError(f"{date_col} is not sorted")
+            df = df.take(np.argsort(values, kind="stable"))
+            values = df[date_col].to_numpy()
+        self.frame = df.reset_index(drop=True)
+        self.date_col = date_col
+        starts = np.flatnonzero(values[1:] != values[:-1]) + 1 if len(values) else np.array([], dtype=np.int64)
+        self.offsets = np.r_[0, starts, len(values)] if len(values) else np.zeros(1, dtype=np.int64)
+        self.dates = values[self.offsets[:-1]]
+
+    @classmethod
+    def if_sorted(cls, df: pd.DataFrame, date_col: str) -> Optional["DateIndex"]:
+        # The index when df is already in date order, else None (to fall back to a scan)
+        try:
+            return cls(df, date_col, sort=False)
+        except ValueError:
+            return None
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    @property
+    def first(self) -> pd.Timestamp:
+        return pd.Timestamp(self.dates[0])
+
+    @property
+    def last(self) -> pd.Timestamp:
+        return pd.Timestamp(self.dates[-1])
+
+    def rows(self, start: Optional[pd.Timestamp] = None, end: Optional[pd.Timestamp] = None) -> slice:
+        # Row positions of dates in [start, end], either bound open when None
+        lo = 0 if start is None else int(np.searchsorted(self.dates, np.datetime64(start), side="left"))
+        hi = len(self.dates) if end is None else int(np.searchsorted(self.dates, np.datetime64(end), side="right"))
+        return slice(int(self.offsets[lo]), int(self.offsets[max(lo, hi)]))
+
+    def between(self, start: Optional[pd.Timestamp] = None, end: Optional[pd.Timestamp] = None) -> pd.DataFrame:
+        return self.frame.iloc[self.rows(start, end)]
+
+    def on(self, date: pd.Timestamp) -> pd.DataFrame:
+        return self.between(date, date)
+
+    def as_of(self, date: pd.Timestamp) -> pd.DataFrame:
+        # Rows of the last date on or before date
+        k = int(np.searchsorted(self.dates, np.datetime64(date), side="right")) - 1
+        if k < 0:
+            return self.frame.iloc[0:0]
+        return self.frame.iloc[int(self.offsets[k]) : int(self.offsets[k + 1])]
+
+    def latest(self) -> pd.DataFrame:
+        return self.frame.iloc[int(self.offsets[-2]) :] if len(self.dates) else self.frame
+
+    def trailing(self, days: int, end: Optional[pd.Timestamp] = None) -> pd.DataFrame:
+        # The days-day window ending on end (default: the last date), inclusive
+        end = self.last if end is None else end
+        return self.between(end - pd.Timedelta(days=days - 1), end)
+
+    def daily_sum(self, column: str) -> pd.DataFrame:
+        # date_col, column summed per date, from the offsets instead of a hash groupby
+        values = self.frame[column].to_numpy()
+        dtype = np.result_type(values.dtype, np.int64)  # narrow (compact) integers must not overflow
+        sums = np.add.reduceat(values, self.offsets[:-1], dtype=dtype) if len(values) else values[:0].astype(dtype)
+        return pd.DataFrame({self.date_col: self.dates, column: sums})
+
+
+def trailing_sums(
+    facts: Union[pd.DataFrame, DateIndex],
+    date_col: str,
+    keys: Sequence[str],
+    value: str,
+    windows: Sequence[int] = WINDOWS,
+    end: Optional[pd.Timestamp] = None,
+) -> pd.DataFrame:
+    # keys plus one f"{value}{w}d" column per window: the sum of value over the w days
+    # ending on end (default: the last date). All windows come from one groupby over the
+    # widest window's rows, each with value zeroed outside its own window.
+    widest = max(windows)
+    if isinstance(facts, DateIndex):
+        end = facts.last if end is None else end
+        rows = facts.trailing(widest, end)
+    else:
+        end = facts[date_col].max() if end is None else end
+        dates = facts[date_col]
+        rows = facts[(dates >= end - pd.Timedelta(days=widest - 1)) & (dates <= end)]
+
+    age = ((np.datetime64(end) - rows[date_col].to_numpy()) // DAY).astype(np.int64)
+    v = rows[value].to_numpy()
+    sums = {f"{value}{w}d": v if w == widest else np.where(age < w, v, 0) for w in windows}
+    by = [rows[k] for k in keys]
+    return pd.DataFrame(sums, index=rows.index).groupby(by, observed=True).sum().reset_index()
@@ -0,0 +1,106 @@
+from __future__ import annotations
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from numpy.typing import ArrayLike
+
+
+def _select(key: np.ndarray, n: int) -> np.ndarray:
+    # Positions of the n largest keys in position order, ties at the cut taken first come
+    # first, from a linear-time partition instead of a sort
+    m = len(key)
+    if n >= m:
+        return np.arange(m)
+    if n <= 0:
+        return np.arange(0)
+    kth = np.partition(key, m - n)[m - n]
+    above = np.flatnonzero(key > kth)
+    ties = np.flatnonzero(key == kth)[: n - len(above)]
+    return np.sort(np.concatenate([above, ties]))
+
+
+def _key(values: ArrayLike) -> np.ndarray:
+    key = np.asarray(values, dtype=np.float64)
+    return np.where(np.isnan(key), -np.inf, key)  # NaN ranks last, as in sort_values
+
+
+def top_positions(values: ArrayLike, n: int) -> np.ndarray:
+    # Positions of the n largest values, largest first, ties in position order
+    key = _key(values)
+    pos = _select(key, n)
+    return pos[np.lexsort((pos, -key[pos]))]
+
+
+def _group_order(codes: np.ndarray) -> np.ndarray:
+    # Stable argsort of non-negative group codes. numpy radix sorts 16-bit keys only, so
+    # wider codes are sorted as two 16-bit digits, low then high.
+    if len(codes) == 0 or codes.max() < 2**16:
+        return np.argsort(codes.astype(np.uint16), kind="stable")
+    order = np.argsort((codes & 0xFFFF).astype(np.uint16), kind="stable")
+    return order[np.argsort((codes[order] >> 16).astype(np.uint16), kind="stable")]
+
+
+def top_n(df: pd.DataFrame, n: int, by: str, per: Sequence[str] = ()) -> pd.DataFrame:
+    # The n rows of df with the largest by, or the n largest within each group of the per
+    # columns (groups in key order). Each group is partitioned, not sorted; only the kept
+    # rows are ordered, so the cost is linear in len(df) plus a sort of groups x n rows.
+    if not per:
+        return df.iloc[top_positions(df[by].to_numpy(), n)]
+
+    key = _key(df[by].to_numpy())
+    codes = df.groupby(list(per), observed=True, sort=True, dropna=False).ngroup().to_numpy()
+    order = _group_order(codes)
+    bounds = np.r_[0, np.cumsum(np.bincount(codes))]
+
+    # Groups no larger than n keep every row; only the larger ones need a selection
+    sizes = np.diff(bounds)
+    kept = [order[np.repeat(sizes <= n, sizes)]]
+    for g in np.flatnonzero(sizes > n):
+        rows = order[bounds[g] : bounds[g + 1]]
+        kept.append(rows[_select(key[rows], n)])
+    pos = np.concatenate(kept)
+    return df.iloc[pos[np.lexsort((pos, -key[pos], codes[pos]))]]
+
+
+class HeavyHitters:
+    # Mergeable Misra-Gries summary of the per-key totals of a non-negative measure over a
+    # stream of chunks, holding at most capacity keys. Each held estimate is at most error
+    # below the key's true total, and any key whose total exceeds error is held, so top()
+    # is exact while error stays below the gap it has to resolve (error is 0 until more
+    # than capacity keys have been seen).
+    def __init__(self, keys: Sequence[str], by: str, capacity: int = 100_000) -> None:
+        self.keys = list(keys)
+        self.by = by
+        self.capacity = capacity
+        self.counts: Optional[pd.Series] = None
+        self.error = 0.0
+
+    def update(self, chunk: pd.DataFrame) -> "HeavyHitters":
+        totals = chunk.groupby(self.keys, observed=True)[self.by].sum()
+        if (totals < 0).any():
+            raise ValueError(f"HeavyHitters needs non-negative {self.by} totals")
+        self._add(totals)
+        return self
+
+    def merge(self, other: "HeavyHitters") -> "HeavyHitters":
+        if other.counts is not None:
+            self.error += other.error
+            self._add(other.counts)
+        return self
+
+    def _add(self, totals: pd.Series) -> None:
+        counts = totals if self.counts is None else pd.concat([self.counts, totals]).groupby(level=self.keys).sum()
+        if len(counts) > self.capacity:
+            # Subtract the (capacity + 1)-th largest count from every key and drop the ones at or below it
+            values = counts.to_numpy()
+            kth = np.partition(values, len(values) - self.capacity - 1)[len(values) - self.capacity - 1]
+            counts = counts[values > kth] - kth
+            self.error += float(kth)
+        self.counts = counts
+
+    def top(self, n: int, per: Sequence[str] = ()) -> pd.DataFrame:
+        # keys and the estimated by of the n largest keys (within each per group)
+        if self.counts is None:
+            return pd.DataFrame(columns=[*self.keys, self.by])
+        return top_n(self.counts.reset_index(), n, self.by, per).reset_index(drop=True)
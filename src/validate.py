@@ -1,13 +1,67 @@
 from __future__ import annotations
-from dataclasses import dataclass
-from typing import List
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
 import pandas as pd
 
+from src.inventory import is_changes
+from src.metrics import load_tables
+from src.profiling import profiled, stage
+from src.storage import TABLES
+
+
+REQUIRED_COLUMNS: Dict[str, List[str]] = {
+    "DimDate": ["Date", "WeekStart"],
+    "DimSKU": ["SKU", "Category", "Brand", "BasePrice"],
+    "DimStore": ["Store", "Region"],
+    "DimChannel": ["Channel"],
+    "FactSales": ["OrderDate", "OrderID", "SKU", "Store", "Channel", "Units", "Sales", "DiscountAmt", "GrossMarginAmt", "ReturnFlag"],
+    "FactInventorySnapshot": ["SnapshotDate", "SKU", "Store", "OnHandUnits"],
+    "FactInventoryChanges": ["SKU", "Store", "ValidFrom", "ValidTo", "OnHandUnits"],
+}
+
+# Fact key column -> (Dim table, Dim column) it must exist in
+FOREIGN_KEYS: Dict[str, Dict[str, Tuple[str, str]]] = {
+    "FactSales": {"SKU": ("DimSKU", "SKU"), "Store": ("DimStore", "Store"), "Channel": ("DimChannel", "Channel")},
+    "FactInventorySnapshot": {"SKU": ("DimSKU", "SKU"), "Store": ("DimStore", "Store")},
+    "FactInventoryChanges": {"SKU": ("DimSKU", "SKU"), "Store": ("DimStore", "Store")},
+}
+
+# Columns whose combined values identify a row
+UNIQUE_KEYS: Dict[str, List[str]] = {
+    "DimDate": ["Date"],
+    "DimSKU": ["SKU"],
+    "DimStore": ["Store"],
+    "DimChannel": ["Channel"],
+    "FactSales": ["OrderID"],
+    "FactInventorySnapshot": ["SnapshotDate", "SKU", "Store"],
+    "FactInventoryChanges": ["ValidFrom", "SKU", "Store"],
+}
+
+# Fact date column that must fall on a DimDate Date
+FACT_DATES: Dict[str, str] = {
+    "FactSales": "OrderDate",
+    "FactInventorySnapshot": "SnapshotDate",
+    "FactInventoryChanges": "ValidFrom",
+}
+
+NON_NEGATIVE: Dict[str, List[str]] = {
+    "FactSales": ["Units", "Sales"],
+    "FactInventorySnapshot": ["OnHandUnits"],
+    "FactInventoryChanges": ["OnHandUnits"],
+}
+
+# (start, end) columns of validity ranges that must not be empty
+RANGES: Dict[str, Tuple[str, str]] = {"FactInventoryChanges": ("ValidFrom", "ValidTo")}
+
 
 @dataclass
 class ValidationResult:
     ok: bool
     errors: List[str]
+    timings: Dict[str, float] = field(default_factory=dict)  # "<Table>.<check>" -> seconds
+    sampled_rows: Dict[str, int] = field(default_factory=dict)  # fact tables checked on a row sample
 
 
 def _require_columns(df: pd.DataFrame, required: List[str], name: str) -> List[str]:
@@ -17,6 +71,113 @@ def _require_columns(df: pd.DataFrame, required: List[str], name: str) -> List[s
     return []
 
 
+def _sample(df: pd.DataFrame, n: int, seed: int) -> pd.DataFrame:
+    rows = np.random.default_rng(seed).choice(len(df), size=n, replace=False)
+    return df.take(np.sort(rows))
+
+
+def _preview(values: pd.Index, n: int = 5) -> str:
+    shown = [str(v) for v in values[:n]]
+    return str(shown) + (" ..." if len(values) > n else "")
+
+
+def _encode(s: pd.Series) -> Tuple[np.ndarray, pd.Index, int]:
+    # (codes, distinct values present, number of codes) with code -1 for nulls, like
+    # pd.factorize, but categoricals reuse their codes instead of being hashed again
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        codes = s.cat.codes.to_numpy()
+        n = len(s.cat.categories)
+        used = np.zeros(n + 1, dtype=bool)
+        used[codes] = True  # nulls (-1) land in the spare last slot
+        return codes, s.cat.categories[used[:n]], n
+    codes, uniques = pd.factorize(s)
+    return codes, pd.Index(uniques), len(uniques)
+
+
+def _duplicate_rows(codes: List[np.ndarray], sizes: List[int], n: int) -> int:
+    # Packs the per-column codes into one int64 key per row; rows are duplicated when keys repeat
+    span = 1
+    for k in sizes:
+        span *= k + 1
+    if span >= 2**62:
+        return int(pd.DataFrame(dict(enumerate(codes))).duplicated().sum())
+
+    key = np.zeros(n, dtype=np.int64)
+    for c, k in zip(codes, sizes):
+        key *= k + 1
+        key += c
+        key += 1
+    if span <= max(8 * n, 2**24):
+        # Dense key space: mark a bitmap instead of building a hash table
+        seen = np.zeros(span, dtype=bool)
+        seen[key] = True
+        return int(n - np.count_nonzero(seen))
+    return int(n - len(pd.unique(key)))
+
+
+def _check_table(
+    name: str, df: pd.DataFrame, tables: Dict[str, pd.DataFrame], timings: Dict[str, float], note: str
+) -> List[str]:
+    # Every key column is encoded once; its distinct values feed the anti-join against the
+    # Dim table and the date coverage check, and its codes the uniqueness check
+    errors: List[str] = []
+    fks = FOREIGN_KEYS.get(name, {})
+    date_col = FACT_DATES.get(name)
+    unique = UNIQUE_KEYS.get(name, [])
+    key_cols = list(dict.fromkeys([*fks, *([date_col] if date_col else []), *unique]))
+
+    t0 = time.perf_counter()
+    encoded = {c: _encode(df[c]) for c in key_cols}
+    timings[f"{name}.encode"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for col, (dim_name, dim_col) in fks.items():
+        codes, values, _ = encoded[col]
+        nulls = int((codes == -1).sum())
+        if nulls:
+            errors.append(f"{name} has {nulls} rows with no {col}{note}.")
+        values = pd.Index(np.asarray(values))
+        missing = values[~values.isin(np.asarray(tables[dim_name][dim_col]))]
+        if len(missing):
+            errors.append(f"{name} has {len(missing)} {col} values missing from {dim_name}{note}: {_preview(missing)}")
+    if fks:
+        timings[f"{name}.referential"] = time.perf_counter() - t0
+
+    if date_col:
+        t0 = time.perf_counter()
+        dates = pd.DatetimeIndex(encoded[date_col][1])
+        outside = dates[~dates.isin(tables["DimDate"]["Date"])].sort_values()
+        if len(outside):
+            errors.append(f"{name} has {len(outside)} {date_col} values not in DimDate{note}: {_preview(outside)}")
+        timings[f"{name}.date_coverage"] = time.perf_counter() - t0
+
+    if unique:
+        t0 = time.perf_counter()
+        codes = [encoded[c][0] for c in unique]
+        dups = _duplicate_rows(codes, [encoded[c][2] for c in unique], len(df))
+        if dups:
+            errors.append(f"{name} has {dups} duplicate rows on {unique}{note}.")
+        timings[f"{name}.uniqueness"] = time.perf_counter() - t0
+
+    if name in RANGES:
+        t0 = time.perf_counter()
+        start, end = RANGES[name]
+        empty = int((df[end] <= df[start]).sum())
+        if empty:
+            errors.append(f"{name} has {empty} rows with {end} not after {start}{note}.")
+        timings[f"{name}.ranges"] = time.perf_counter() - t0
+
+    cols = NON_NEGATIVE.get(name, [])
+    if cols:
+        t0 = time.perf_counter()
+        for c in cols:
+            if (df[c] < 0).any():
+                errors.append(f"{name} has negative {c}.")
+        timings[f"{name}.non_negative"] = time.perf_counter() - t0
+    return errors
+
+
+@profiled()
 def validate_tables(
     dim_date: pd.DataFrame,
     dim_sku: pd.DataFrame,
@@ -24,27 +185,74 @@ def validate_tables(
     dim_channel: pd.DataFrame,
     fact_sales: pd.DataFrame,
     fact_inv: pd.DataFrame,
+    sample_rows: Optional[int] = None,
+    seed: int = 0,
+    skip: Sequence[str] = (),
 ) -> ValidationResult:
+    # sample_rows checks facts larger than that on a uniform random sample of rows. A clean
+    # sample of n rows bounds the rate of bad keys, dates and signs at about 3/n (95%);
+    # duplicates are only caught when both copies land in the sample. fact_inv may hold
+    # daily snapshot rows or change rows (FactInventoryChanges). Tables named in skip (already
+    # validated) only have their required columns checked.
     errors: List[str] = []
+    timings: Dict[str, float] = {}
+    sampled: Dict[str, int] = {}
+
+    tables = {
+        "DimDate": dim_date,
+        "DimSKU": dim_sku,
+        "DimStore": dim_store,
+        "DimChannel": dim_channel,
+        "FactSales": fact_sales,
+        "FactInventoryChanges" if is_changes(fact_inv) else "FactInventorySnapshot": fact_inv,
+    }
+    t0 = time.perf_counter()
+    for name, df in tables.items():
+        errors += _require_columns(df, REQUIRED_COLUMNS[name], name)
+    timings["columns"] = time.perf_counter() - t0
+    if errors:
+        return ValidationResult(ok=False, errors=errors, timings=timings)
+
+    for name, df in tables.items():
+        if name in skip:
+            continue
+        note = ""
+        if sample_rows is not None and name in FACT_DATES and len(df) > sample_rows:
+            df = _sample(df, sample_rows, seed)
+            sampled[name] = sample_rows
+            note = f" (in a {sample_rows} row sample)"
+        with stage(f"validate:{name}", len(df)):
+            errors += _check_table(name, df, tables, timings, note)
+
+    return ValidationResult(ok=(len(errors) == 0), errors=errors, timings=timings, sampled_rows=sampled)
+
+
+def _validate(t: Dict[str, pd.DataFrame], sample_rows: Optional[int] = None, skip: Sequence[str] = ()) -> None:
+    # Tables that were not loaded (their results came from the cache) are checked as empty frames
+    frames = {name: t.get(name, pd.DataFrame(columns=REQUIRED_COLUMNS[name])) for name in TABLES}
+    vr = validate_tables(*frames.values(), sample_rows=sample_rows, skip=skip)
+    if not vr.ok:
+        raise ValueError("Validation failed:\n" + "\n".join(vr.errors))
+
+
+def load_validated(
+    data_dir: str,
+    fmt: str = "csv",
+    compact: bool = False,
+    names: Sequence[str] = TABLES,
+    validate_sample: Optional[int] = None,
+    io_workers: int = 1,
+) -> Dict[str, pd.DataFrame]:
+    # load_tables then validation, with the Dim tables validated as soon as they have all
+    # arrived, while the fact reads are still in flight on the I/O threads
+    dims = [n for n in names if n.startswith("Dim")]
+    arrived: Dict[str, pd.DataFrame] = {}
+
+    def on_table(name: str, df: pd.DataFrame) -> None:
+        arrived[name] = df
+        if name in dims and all(n in arrived for n in dims):
+            _validate({n: arrived[n] for n in dims})
 
-    errors += _require_columns(dim_date, ["Date", "WeekStart"], "DimDate")
-    errors += _require_columns(dim_sku, ["SKU", "Category", "Brand", "BasePrice"], "DimSKU")
-    errors += _require_columns(dim_store, ["Store", "Region"], "DimStore")
-    errors += _require_columns(dim_channel, ["Channel"], "DimChannel")
-
-    errors += _require_columns(
-        fact_sales,
-        ["OrderDate", "OrderID", "SKU", "Store", "Channel", "Units", "Sales", "DiscountAmt", "GrossMarginAmt", "ReturnFlag"],
-        "FactSales",
-    )
-    errors += _require_columns(fact_inv, ["SnapshotDate", "SKU", "Store", "OnHandUnits"], "FactInventorySnapshot")
-
-    # Basic sanity checks
-    if "Units" in fact_sales.columns and (fact_sales["Units"] < 0).any():
-        errors.append("FactSales has negative Units.")
-    if "Sales" in fact_sales.columns and (fact_sales["Sales"] < 0).any():
-        errors.append("FactSales has negative Sales.")
-    if "OnHandUnits" in fact_inv.columns and (fact_inv["OnHandUnits"] < 0).any():
-        errors.append("FactInventorySnapshot has negative OnHandUnits.")
-
-    return ValidationResult(ok=(len(errors) == 0), errors=errors)
+    t = load_tables(data_dir, fmt, compact=compact, names=names, workers=io_workers, on_table=on_table)
+    _validate(t, validate_sample, skip=dims)
+    return t
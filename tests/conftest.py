@@ -0,0 +1,38 @@
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+# Allow running from the repo root without installing: python -m pytest
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from data.generate_merchandising_data import Config, write_dataset  # noqa: E402
+
+# Small enough to generate in a second or two, large enough that every store, SKU and week has sales
+SMALL = Config(start_date="2024-01-01", end_date="2024-04-30", n_skus=40, n_stores=5, n_orders=3000, seed=7)
+
+
+@pytest.fixture(scope="session")
+def data_dir(tmp_path_factory) -> str:
+    out = tmp_path_factory.mktemp("data")
+    write_dataset(SMALL, out, "csv")
+    return str(out)
+
+
+@pytest.fixture
+def work_dir(data_dir, tmp_path) -> Path:
+    # A private copy of the dataset, for tests that append to or edit the tables
+    out = tmp_path / "data"
+    shutil.copytree(data_dir, out)
+    return out
+
+
+@pytest.fixture
+def make_data_dir(tmp_path):
+    # The SMALL dataset written in another storage format, in a fresh directory
+    def make(fmt: str) -> Path:
+        out = tmp_path / fmt
+        write_dataset(SMALL, out, fmt)
+        return out
+
+    return make
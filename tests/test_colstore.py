@@ -0,0 +1,43 @@
+import pandas as pd
+import pytest
+
+from src.colstore import concat_columns, read_columns, write_columns
+
+
+def _frame(start: int, n: int) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "OrderDate": pd.date_range("2024-01-01", periods=n, freq="D") + pd.Timedelta(days=start),
+            "OrderID": [f"ORD-{i:08d}" for i in range(start, start + n)],
+            "Store": pd.Categorical([f"S{i % 3}" for i in range(start, start + n)]),
+            "Sales": [i * 1.25 for i in range(start, start + n)],
+        }
+    )
+
+
+def test_roundtrip_append_and_concat_verify(tmp_path):
+    store = tmp_path / "t"
+    write_columns(_frame(0, 10), store, ids=["OrderID"])
+    write_columns(_frame(10, 5), store, ids=["OrderID"], append=True)
+    df = read_columns(store, verify=True)
+    assert len(df) == 15
+    assert df["Sales"].tolist() == _frame(0, 15)["Sales"].tolist()
+
+    concat_columns([(store, 2, 8), (store, 12, 15)], tmp_path / "c")
+    assert len(read_columns(tmp_path / "c", verify=True)) == 9
+
+
+def test_verify_detects_corrupt_and_truncated_columns(tmp_path):
+    store = tmp_path / "t"
+    write_columns(_frame(0, 10), store, ids=["OrderID"])
+    sales = store / "Sales.bin"
+    data = bytearray(sales.read_bytes())
+    data[3] ^= 0xFF
+    sales.write_bytes(bytes(data))
+    read_columns(store, ["OrderID"], verify=True)
+    with pytest.raises(ValueError, match="crc32"):
+        read_columns(store, verify=True)
+
+    (store / "OrderID.bin").write_bytes((store / "OrderID.bin").read_bytes()[:-8])
+    with pytest.raises(ValueError, match="crc32"):
+        read_columns(store, ["OrderID"], verify=True)
@@ -0,0 +1,34 @@
+import pandas as pd
+import pytest
+
+from src.drivers import GM_EFFECTS, SALES_EFFECTS, drivers, weekly_drivers
+from src.metrics import load_tables
+
+
+@pytest.fixture(scope="module")
+def tables(data_dir):
+    return load_tables(data_dir, "csv", names=["DimSKU", "DimStore", "FactSales"])
+
+
+@pytest.mark.parametrize("level", ["Store", "Category", "SKU"])
+def test_weekly_matches_pairwise(tables, level):
+    fs, dim_sku, dim_store = tables["FactSales"], tables["DimSKU"], tables["DimStore"]
+    weekly = weekly_drivers(fs, dim_sku, level, dim_store)
+    assert weekly["WeekStart"].nunique() > 10
+    for week, got in weekly.groupby("WeekStart"):
+        base = (week - pd.Timedelta(days=7), week - pd.Timedelta(days=1))
+        current = (week, week + pd.Timedelta(days=6))
+        expected = drivers(fs, dim_sku, base, current, level, dim_store)
+        got = got.drop(columns="WeekStart").set_index(level).sort_index()
+        expected = expected.set_index(level).sort_index()
+        pd.testing.assert_frame_equal(got, expected, check_exact=False, atol=1e-6, check_index_type=False, check_categorical=False)
+
+
+def test_effects_add_up(tables):
+    fs = tables["FactSales"]
+    last = fs["OrderDate"].max()
+    current = (last - pd.Timedelta(days=27), last)
+    base = (current[0] - pd.Timedelta(days=28), current[0] - pd.Timedelta(days=1))
+    out = drivers(fs, tables["DimSKU"], base, current, "Brand", tables["DimStore"])
+    assert (out[SALES_EFFECTS].sum(axis=1) - out["SalesChange"]).abs().max() < 1e-6
+    assert (out[GM_EFFECTS].sum(axis=1) - out["GMChange"]).abs().max() < 1e-6
@@ -0,0 +1,58 @@
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from src.incremental import load_state, update_state
+from src.storage import FORMATS, read_table, table_path, write_table
+
+
+def _append(path: Path, rows: pd.DataFrame) -> None:
+    rows.to_csv(path, mode="a", header=False, index=False)
+
+
+def test_rejects_appended_order_id_already_folded(work_dir):
+    update_state(str(work_dir), "csv")
+    fact = work_dir / "FactSales.csv"
+    _append(fact, pd.read_csv(fact).head(1))
+    with pytest.raises(ValueError, match="OrderID values already folded"):
+        update_state(str(work_dir), "csv")
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+def test_appended_rows_fold_like_full_rebuild(make_data_dir, fmt):
+    data_dir = make_data_dir(fmt)
+    rows = read_table(str(data_dir), "FactSales", fmt)
+    write_table(rows.head(len(rows) - 200), str(data_dir), "FactSales", fmt)
+    update_state(str(data_dir), fmt)
+    if fmt == "csv":
+        _append(table_path(str(data_dir), "FactSales", fmt), rows.tail(200))
+    else:
+        write_table(rows.tail(200), str(data_dir), "FactSales", fmt, part=1)
+    state, _ = update_state(str(data_dir), fmt)
+
+    full, _ = update_state(str(data_dir), fmt, str(data_dir / "full.pkl"))
+    assert state.orders.count() == full.orders.count() == len(rows)
+    assert state.sales == pytest.approx(full.sales)
+    pd.testing.assert_frame_equal(state.weekly, full.weekly)
+
+
+def test_rewritten_last_rows_rebuild(work_dir):
+    fact = work_dir / "FactSales.csv"
+    rows = pd.read_csv(fact)
+    update_state(str(work_dir), "csv")
+    rows.loc[len(rows) - 1, "Sales"] += 1000.0
+    rows.to_csv(fact, index=False)
+    state, _ = update_state(str(work_dir), "csv")
+    assert state.sales == pytest.approx(rows["Sales"].sum())
+
+
+@pytest.mark.parametrize("content", [b"not a pickle", b"\x80\x05\x95"])
+def test_unreadable_state_rebuilds(work_dir, content):
+    state, _ = update_state(str(work_dir), "csv")
+    path = work_dir / "_kpi_state.pkl"
+    path.write_bytes(content)
+    assert load_state(path, "csv").files == {}
+    rebuilt, _ = update_state(str(work_dir), "csv")
+    assert rebuilt.sales == pytest.approx(state.sales)
+    assert rebuilt.orders.count() == state.orders.count()
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.metrics import sell_through_pct, sell_through_pct_array, weeks_of_supply, weeks_of_supply_array
+
+# Divide-by-zero, negative and NaN denominators are where the governed definitions matter most
+EDGE_CASES = [
+    (0.0, 0.0),
+    (0.0, 5.0),
+    (5.0, 0.0),
+    (3.0, -3.0),
+    (-2.0, 1.0),
+    (1e-12, 1e12),
+    (np.nan, 4.0),
+    (4.0, np.nan),
+]
+
+
+def _sell_through_ref(units_sold: float, on_hand: float) -> float:
+    # Governed definition, written out in plain Python
+    denom = units_sold + on_hand
+    return (units_sold / denom) if denom > 0 else 0.0
+
+
+def _weeks_of_supply_ref(on_hand: float, avg_week_units: float) -> float:
+    return (on_hand / avg_week_units) if avg_week_units > 0 else 0.0
+
+
+def _random_pairs(n: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    units = rng.integers(0, 50, size=n).astype(float)
+    on_hand = rng.integers(0, 200, size=n).astype(float)
+    # Force a share of zero denominators
+    zero = rng.random(n) < 0.1
+    units[zero] = 0.0
+    on_hand[zero] = 0.0
+    return pd.DataFrame({"A": units, "B": on_hand})
+
+
+@pytest.fixture(params=["edge_cases", "random"])
+def pairs(request) -> pd.DataFrame:
+    if request.param == "edge_cases":
+        return pd.DataFrame(EDGE_CASES, columns=["A", "B"])
+    return _random_pairs(20000, 42)
+
+
+@pytest.mark.parametrize(
+    "scalar, array, ref",
+    [
+        (sell_through_pct, sell_through_pct_array, _sell_through_ref),
+        (weeks_of_supply, weeks_of_supply_array, _weeks_of_supply_ref),
+    ],
+)
+def test_scalar_and_array_kernels_agree(pairs, scalar, array, ref):
+    a, b = pairs["A"].to_numpy(), pairs["B"].to_numpy()
+    expected = np.array([ref(x, y) for x, y in zip(a.tolist(), b.tolist())])
+    got = {
+        "scalar": np.array([scalar(x, y) for x, y in zip(a, b)]),
+        "ndarray": array(a, b),
+        "series": np.asarray(array(pairs["A"], pairs["B"])),
+    }
+    for path, values in got.items():
+        assert np.array_equal(expected, values, equal_nan=True), path
+
+
+def test_array_kernels_match_row_wise_apply():
+    df = _random_pairs(2000, 7)
+    df["AvgWeeklyUnits"] = df["A"] / 4.0
+    st = df.apply(lambda r: sell_through_pct(r["A"], r["B"]), axis=1)
+    wos = df.apply(lambda r: weeks_of_supply(r["B"], r["AvgWeeklyUnits"]), axis=1)
+    assert np.array_equal(st.to_numpy(), sell_through_pct_array(df["A"], df["B"]))
+    assert np.array_equal(wos.to_numpy(), weeks_of_supply_array(df["B"], df["AvgWeeklyUnits"]))
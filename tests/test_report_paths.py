@@ -0,0 +1,58 @@
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from src.build_artifacts import build_report
+
+
+def _report(data_dir: Path, name: str, **kwargs) -> str:
+    out = data_dir.parent / name
+    report = out / "report.md"
+    build_report(str(data_dir), str(report), str(out / "defs.md"), str(out / "one_pager.md"), **kwargs)
+    return report.read_text(encoding="utf8")
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {},
+        {"compact": True},
+        {"workers": 2, "use_cache": False},
+        {"workers": 2, "partition_by": "date", "use_cache": False},
+        {"incremental": True},
+        {"chunksize": 700},
+        {"rollup": True},
+    ],
+    ids=["cached", "compact", "parallel", "parallel_date", "incremental", "streaming", "rollup"],
+)
+def test_paths_render_the_serial_report(work_dir, kwargs):
+    expected = _report(work_dir, "serial", use_cache=False)
+    assert _report(work_dir, "cold", **kwargs) == expected
+    # Warm: from the cache, the persisted state or the exported cubes
+    assert _report(work_dir, "warm", **kwargs) == expected
+
+
+@pytest.mark.parametrize("kwargs", [{}, {"incremental": True}, {"rollup": True}])
+def test_appended_sales_match_a_fresh_build(work_dir, kwargs):
+    fact = work_dir / "FactSales.csv"
+    rows = pd.read_csv(fact)
+    rows.head(len(rows) - 300).to_csv(fact, index=False)
+    _report(work_dir, "before", **kwargs)
+
+    rows.tail(300).to_csv(fact, mode="a", header=False, index=False)
+    assert _report(work_dir, "after", **kwargs) == _report(work_dir, "serial", use_cache=False)
+
+
+@pytest.mark.parametrize("kwargs", [{}, {"rollup": True}])
+def test_dim_changes_reach_cached_builds(work_dir, kwargs):
+    _report(work_dir, "warm", **kwargs)
+    dim_sku = pd.read_csv(work_dir / "DimSKU.csv")
+    dim_sku["Category"] = dim_sku["Category"].where(dim_sku.index % 2 == 0, "Toys")
+    dim_sku.to_csv(work_dir / "DimSKU.csv", index=False)
+    assert _report(work_dir, "after", **kwargs) == _report(work_dir, "serial", use_cache=False)
+
+    channels = pd.read_csv(work_dir / "DimChannel.csv")
+    channels[channels["Channel"] != "Online"].to_csv(work_dir / "DimChannel.csv", index=False)
+    with pytest.raises(ValueError, match="missing from DimChannel"):
+        _report(work_dir, "invalid", **kwargs)
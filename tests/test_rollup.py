@@ -0,0 +1,26 @@
+import sys
+
+import pandas as pd
+import pytest
+
+from src import rollup
+from src.rollup import default_rollup_dir, rollup_is_current, rollup_validation
+
+
+def _export(monkeypatch, data_dir) -> None:
+    monkeypatch.setattr(sys, "argv", ["rollup", "--data_dir", str(data_dir)])
+    rollup.main()
+
+
+def test_exported_cubes_are_reused_by_rollup_builds(monkeypatch, work_dir):
+    _export(monkeypatch, work_dir)
+    assert rollup_is_current(str(work_dir), str(default_rollup_dir(str(work_dir))), "csv", rollup_validation(str(work_dir), "csv"))
+
+
+def test_export_rejects_duplicate_order_ids(monkeypatch, work_dir):
+    fact = work_dir / "FactSales.csv"
+    rows = pd.read_csv(fact)
+    rows.loc[len(rows) - 1, "OrderID"] = rows.loc[0, "OrderID"]
+    rows.to_csv(fact, index=False)
+    with pytest.raises(ValueError, match="duplicate rows on \\['OrderID'\\]"):
+        _export(monkeypatch, work_dir)
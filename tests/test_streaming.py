@@ -0,0 +1,44 @@
+import sys
+
+import pandas as pd
+import pytest
+
+from src import build_artifacts
+from src.streaming import streaming_report_tables
+
+
+def test_duplicate_order_id_across_chunks(work_dir):
+    fact = work_dir / "FactSales.csv"
+    rows = pd.read_csv(fact)
+    rows.loc[len(rows) - 1, "OrderID"] = rows.loc[0, "OrderID"]
+    rows.to_csv(fact, index=False)
+    with pytest.raises(ValueError, match="FactSales has 1 duplicate rows on \\['OrderID'\\]"):
+        streaming_report_tables(str(work_dir), chunksize=700)
+    # The approximate Orders count can only check each chunk
+    streaming_report_tables(str(work_dir), chunksize=700, orders="approx")
+
+
+def test_duplicate_snapshot_key_across_chunks(work_dir):
+    fact = work_dir / "FactInventorySnapshot.csv"
+    rows = pd.read_csv(fact)
+    rows = pd.concat([rows, rows.head(1)], ignore_index=True)
+    rows.to_csv(fact, index=False)
+    with pytest.raises(ValueError, match="FactInventorySnapshot has 1 duplicate rows on"):
+        streaming_report_tables(str(work_dir), chunksize=5000)
+
+
+def test_dims_are_checked_before_any_chunk(work_dir):
+    dim = work_dir / "DimSKU.csv"
+    rows = pd.read_csv(dim)
+    pd.concat([rows, rows.head(1)], ignore_index=True).to_csv(dim, index=False)
+    with pytest.raises(ValueError, match="DimSKU has 1 duplicate rows"):
+        streaming_report_tables(str(work_dir), chunksize=700)
+
+
+@pytest.mark.parametrize("mode", [["--chunksize", "700"], ["--incremental"]])
+@pytest.mark.parametrize("flag", [["--compact"], ["--validate_sample", "100"]])
+def test_main_rejects_flags_the_mode_ignores(monkeypatch, capsys, data_dir, mode, flag):
+    monkeypatch.setattr(sys, "argv", ["build_artifacts", "--data_dir", str(data_dir), *mode, *flag])
+    with pytest.raises(SystemExit):
+        build_artifacts.main()
+    assert f"{flag[0]} cannot be combined with {mode[0]}" in capsys.readouterr().err
@@ -0,0 +1,30 @@
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from data.generate_superstore_data import BLOCK_ROWS, iter_superstore_chunks
+from src.reporting import build_markdown_report
+from src.superstore import load_superstore, superstore_tables
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def test_report_matches_tracked_contract():
+    t = superstore_tables(load_superstore(str(ROOT / "data" / "superstore_sample_large.csv")))
+    text = build_markdown_report(t["kpis"], t["daily"], t["by_segment"], t["by_category"], t["by_region"])
+    assert text == (ROOT / "reports" / "metrics_report.md").read_text(encoding="utf8")
+
+
+def test_chunks_do_not_depend_on_chunk_rows():
+    whole = pd.concat(list(iter_superstore_chunks(2 * BLOCK_ROWS + 5, chunk_rows=BLOCK_ROWS * 3)), ignore_index=True)
+    for chunk_rows in (997, BLOCK_ROWS - 1, BLOCK_ROWS + 13):
+        chunks = list(iter_superstore_chunks(2 * BLOCK_ROWS + 5, chunk_rows=chunk_rows))
+        assert all(len(c) == chunk_rows for c in chunks[:-1])
+        pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), whole)
+
+
+@pytest.mark.parametrize("chunk_rows", [0, -1])
+def test_chunk_rows_must_be_positive(chunk_rows):
+    with pytest.raises(ValueError, match="chunk_rows"):
+        next(iter_superstore_chunks(10, chunk_rows=chunk_rows))